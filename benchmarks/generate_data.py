@@ -0,0 +1,151 @@
+"""
+Synthetic sales ledger generator for scaling tests and benchmarks.
+
+Produces ledgers with the same columns as data/sample_data.csv (plus an
+order number and quantity) and realistic structure: a base price per
+material, a stable contract rate per customer and material, skewed customer
+and material popularity, and a controlled share of off-contract rates,
+missing values and duplicate rows. The same arguments and seed always give
+the same ledger.
+
+Usage:
+    python benchmarks/generate_data.py --rows 1000000 --out data/ledger_1m.csv
+    python benchmarks/generate_data.py --rows 50000 --variance-rate 0.1 --out data/ledger.xlsx
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# Excel sheets hold at most 1,048,576 rows including the header
+XLSX_MAX_ROWS = 1_048_575
+
+SALES_COLUMNS = ['MATERIAL DESCRIPTION', 'SO CREATED ON', 'MATERIAL CODE', 'SOLD TO PARTY NAME', 'BASIC RATE']
+
+_PRODUCTS = [
+    'Steel Rods', 'Cement Bags', 'Copper Wire', 'PVC Pipes', 'Paint', 'Glass Panels',
+    'Aluminium Sheets', 'Tiles', 'Bricks', 'Sand', 'Plywood', 'Bolts',
+]
+_COMPANY_SUFFIXES = ['Industries', 'Construction', 'Traders', 'Builders', 'Enterprises', 'Systems', 'Works']
+
+
+def generate_sales_ledger(rows, *, customers=500, materials=200, days=365, variance_rate=0.05,
+                          missing_rate=0.01, duplicate_rate=0.005, seed=42, start_date='2025-01-01'):
+    """Generate a synthetic sales ledger.
+
+    Args:
+        rows: Number of rows to generate (duplicates included)
+        customers: Number of distinct customers
+        materials: Number of distinct materials
+        days: Number of distinct order dates, starting at start_date
+        variance_rate: Share of lines billed off the customer's contract rate
+        missing_rate: Share of cells blanked in each sales column
+        duplicate_rate: Share of rows that are exact copies of another row
+        seed: Random seed
+
+    Returns:
+        DataFrame with the sales columns plus 'SO NUMBER' and 'QUANTITY'
+    """
+    rng = np.random.default_rng(seed)
+    n_dupes = int(rows * duplicate_rate)
+    n_unique = rows - n_dupes
+
+    # Popularity follows a Zipf-like curve: a few big customers and materials
+    cust_weights = 1.0 / np.arange(1, customers + 1) ** 0.8
+    mat_weights = 1.0 / np.arange(1, materials + 1) ** 0.8
+    cust = rng.choice(customers, size=n_unique, p=cust_weights / cust_weights.sum())
+    mat = rng.choice(materials, size=n_unique, p=mat_weights / mat_weights.sum())
+    day = rng.integers(0, days, size=n_unique)
+
+    # Contract rate = material base price less a stable per-customer discount
+    base_price = np.round(rng.uniform(50, 5000, size=materials), 0)
+    discount = rng.uniform(0.0, 0.15, size=customers)
+    rate = np.round(base_price[mat] * (1 - discount[cust]), 2)
+
+    # Off-contract lines deviate by 1-15% either way
+    off = rng.random(n_unique) < variance_rate
+    deviation = rng.uniform(0.01, 0.15, size=off.sum()) * rng.choice([-1, 1], size=off.sum())
+    rate[off] = np.round(rate[off] * (1 + deviation), 2)
+
+    # Build string columns from small lookup tables, not per-row formatting
+    cust_names = np.array([
+        f"{_PRODUCTS[i % len(_PRODUCTS)].split()[0]} {_COMPANY_SUFFIXES[i % len(_COMPANY_SUFFIXES)]} {i:05d}"
+        for i in range(customers)
+    ], dtype=object)
+    mat_codes = np.array([f"MAT{i:05d}" for i in range(materials)], dtype=object)
+    mat_desc = np.array([f"{_PRODUCTS[i % len(_PRODUCTS)]} {i:05d}" for i in range(materials)], dtype=object)
+    dates = np.asarray(
+        (pd.Timestamp(start_date) + pd.to_timedelta(np.arange(days), unit='D')).strftime('%d-%m-%Y'),
+        dtype=object,
+    )
+
+    df = pd.DataFrame({
+        'MATERIAL DESCRIPTION': mat_desc[mat],
+        'SO CREATED ON': dates[day],
+        'MATERIAL CODE': mat_codes[mat],
+        'SOLD TO PARTY NAME': cust_names[cust],
+        'BASIC RATE': rate,
+        'SO NUMBER': np.arange(1_000_000, 1_000_000 + n_unique),
+        'QUANTITY': rng.integers(1, 500, size=n_unique),
+    })
+
+    # Blank out a share of cells in each sales column
+    if missing_rate > 0:
+        for col in SALES_COLUMNS:
+            mask = rng.random(n_unique) < missing_rate
+            if mask.any():
+                df[col] = df[col].where(~mask)
+
+    # Append exact copies of random rows and shuffle them in
+    if n_dupes > 0:
+        dupes = df.iloc[rng.integers(0, n_unique, size=n_dupes)]
+        df = pd.concat([df, dupes], ignore_index=True)
+        df = df.iloc[rng.permutation(len(df))].reset_index(drop=True)
+
+    return df
+
+
+def write_ledger(df, path):
+    """Write a ledger to .csv or .xlsx based on the file extension."""
+    if path.lower().endswith('.xlsx'):
+        if len(df) > XLSX_MAX_ROWS:
+            raise ValueError(f"XLSX output is limited to {XLSX_MAX_ROWS:,} rows; use CSV for {len(df):,} rows")
+        df.to_excel(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic sales ledger")
+    parser.add_argument('--rows', type=int, default=100_000, help="Number of rows (10k to 10M)")
+    parser.add_argument('--customers', type=int, default=500, help="Distinct customers")
+    parser.add_argument('--materials', type=int, default=200, help="Distinct materials")
+    parser.add_argument('--days', type=int, default=365, help="Distinct order dates")
+    parser.add_argument('--variance-rate', type=float, default=0.05, help="Share of off-contract lines")
+    parser.add_argument('--missing-rate', type=float, default=0.01, help="Share of blank cells per column")
+    parser.add_argument('--duplicate-rate', type=float, default=0.005, help="Share of duplicate rows")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed")
+    parser.add_argument('--out', default='synthetic_ledger.csv', help="Output path (.csv or .xlsx)")
+    args = parser.parse_args()
+
+    df = generate_sales_ledger(
+        args.rows,
+        customers=args.customers,
+        materials=args.materials,
+        days=args.days,
+        variance_rate=args.variance_rate,
+        missing_rate=args.missing_rate,
+        duplicate_rate=args.duplicate_rate,
+        seed=args.seed,
+    )
+    out_dir = os.path.dirname(args.out)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    write_ledger(df, args.out)
+    print(f"✓ Wrote {len(df):,} rows to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
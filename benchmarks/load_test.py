@@ -0,0 +1,384 @@
+"""
+Concurrent-session load test for the Streamlit app.
+
+Simulates N auditors using one app process at the same time, the way a
+single Streamlit replica serves them. Each session logs in, uploads a
+generated ledger (see generate_data.py), maps the columns, runs the
+analysis, then repeatedly changes filters and downloads the Excel report.
+Sessions are driven headlessly with Streamlit's app testing API (AppTest),
+one thread per session, so process-wide objects such as the shared frame
+cache behave as they do on a server.
+
+AppTest assumes one app run at a time: every run installs its own mock
+runtime as the process-wide runtime and removes it afterwards, and all runs
+use the same session id. The harness therefore pins one shared runtime for
+the whole test and gives each session its own session id (see
+shared_app_runtime).
+
+Reported: run-time percentiles per step, the process's peak RSS, and the
+frame cache hit rates as shown in the app's Memory Cache panel. Results are
+appended to benchmarks/results/load_tests.jsonl. A session whose ledger has
+no variance cases has no filters or report to use; it is counted as
+"no cases" and stops after the analysis.
+
+Limits of the numbers:
+- Each step times one AppTest script run in this process. AppTest reruns
+  the whole script for every widget change, so 'filter' and 'quick filter'
+  time full reruns, not the @st.fragment reruns a browser gets, and no
+  websocket, serialization or rendering time is included. They bound the
+  server-side cost of a step rather than measuring interaction latency.
+- Running AppTest concurrently relies on Streamlit internals (the Runtime
+  singleton, app_test's module globals, LocalScriptRunner's session id and
+  script cache, the global.appTest option), which may change between
+  Streamlit releases; see shared_app_runtime.
+
+Usage:
+    python benchmarks/load_test.py --sessions 8 --rows 100000
+    python benchmarks/load_test.py --sessions 40 --rows 200000 --distinct-files 10 --cycles 3 --think-seconds 2
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from unittest.mock import MagicMock
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+sys.path.insert(0, HERE)
+
+import numpy as np  # noqa: E402
+
+from generate_data import SALES_COLUMNS, generate_sales_ledger  # noqa: E402
+from perf import current_rss_mb  # noqa: E402
+
+APP_PATH = os.path.join(HERE, '..', 'src', 'app.py')
+RESULTS_FILE = os.path.join(HERE, 'results', 'load_tests.jsonl')
+
+# Sidebar mapping selectboxes, in the order of SALES_COLUMNS
+MAPPING_LABELS = [
+    "Material Description Column",
+    "Date Column",
+    "Material Code Column",
+    "Customer Name Column",
+    "Price/Rate Column",
+]
+INTERACTIONS = ['open', 'login', 'upload', 'map columns', 'analyze', 'filter', 'quick filter', 'download']
+
+TIMING_NOTE = ("Step times are in-process AppTest script runs: full reruns for every step (no @st.fragment "
+               "reruns), without websocket or browser time. They are not end-user interaction latency.")
+
+_session = threading.local()
+
+
+@contextmanager
+def shared_app_runtime():
+    """Let AppTest instances run in parallel threads of this process.
+
+    Installs one runtime (media files, st.cache_data storage, components)
+    and one compiled-script cache shared by all sessions, keeps AppTest
+    runs from replacing or removing the runtime, and gives each thread's
+    sessions their own session id. Yields the shared media file storage,
+    for reading downloads.
+    """
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.testing.v1 import app_test, local_script_runner
+
+    storage = app_test.MemoryMediaFileStorage("/mock/media")
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = app_test.MediaFileManager(storage)
+    runtime.dataframe_source_mgr = app_test.DataframeSourceManager()
+    runtime.cache_storage_manager = app_test.MemoryCacheStorageManager()
+    components = app_test.BidiComponentManager()
+    components.discover_and_register_components(start_file_watching=False)
+    runtime.bidi_component_registry = components
+
+    class PinnedRuntime(Runtime):
+        """Stands in for Runtime in app_test; its per-run instance assignments go nowhere."""
+
+    # Compiled once for all sessions, as on a server (and parallel compiles trip a CPython 3.11 bug)
+    script_cache = app_test.ScriptCache()
+
+    class SessionScriptRunner(local_script_runner.LocalScriptRunner):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._session_id = getattr(_session, 'id', self._session_id)
+            self._script_cache = script_cache
+
+    saved = (Runtime._instance, app_test.Runtime, app_test.LocalScriptRunner, config.get_option('global.appTest'))
+    Runtime._instance = runtime
+    app_test.Runtime = PinnedRuntime
+    app_test.LocalScriptRunner = SessionScriptRunner
+    # Runs patch this option on and back off; with it already on, concurrent runs can't switch it off
+    config.set_option('global.appTest', True)
+    try:
+        yield storage
+    finally:
+        Runtime._instance, app_test.Runtime, app_test.LocalScriptRunner, app_test_flag = saved
+        config.set_option('global.appTest', app_test_flag)
+
+
+class Recorder:
+    """Thread-safe log of (interaction, seconds, error) samples and of sessions without variance cases."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []
+        self.no_cases = []
+
+    def add(self, session, interaction, seconds, error=None):
+        with self._lock:
+            self.samples.append({'session': session, 'interaction': interaction, 'seconds': seconds, 'error': error})
+
+    def add_no_cases(self, session):
+        with self._lock:
+            self.no_cases.append(session)
+
+    def summary(self):
+        """Run-time percentiles and error count per interaction, in flow order."""
+        rows = []
+        for interaction in INTERACTIONS:
+            samples = [s for s in self.samples if s['interaction'] == interaction]
+            if not samples:
+                continue
+            seconds = np.array([s['seconds'] for s in samples if s['error'] is None])
+            row = {'interaction': interaction, 'count': len(samples),
+                   'errors': sum(s['error'] is not None for s in samples)}
+            for p in (50, 90, 95, 99):
+                row[f'p{p}'] = float(np.percentile(seconds, p)) if len(seconds) else None
+            row['max'] = float(seconds.max()) if len(seconds) else None
+            rows.append(row)
+        return rows
+
+
+class RSSSampler(threading.Thread):
+    """Tracks the highest RSS of this process until stopped."""
+
+    def __init__(self, interval=0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_mb = self.start_mb = current_rss_mb() or 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, current_rss_mb() or 0)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _app(timeout):
+    from streamlit.testing.v1 import AppTest
+    return AppTest.from_file(APP_PATH, default_timeout=timeout)
+
+
+def _login(at, username, password):
+    at.text_input(key='username').set_value(username)
+    at.text_input(key='password').set_value(password)
+    at.button[0].click().run()
+    if 'authenticated' not in at.session_state or not at.session_state['authenticated']:
+        raise RuntimeError(f"login as {username!r} failed")
+
+
+def _download(at, storage, label_prefix):
+    """Fetch a download button's file the way a click does; returns its size in bytes."""
+    from streamlit.runtime import get_instance
+
+    button = next(b for b in at.get('download_button') if b.proto.label.startswith(label_prefix))
+    url = button.proto.url
+    if button.proto.deferred_file_id:
+        url = get_instance().media_file_mgr.execute_deferred(button.proto.deferred_file_id)
+    return len(storage.get_file(url.rsplit('/', 1)[-1]).content)
+
+
+def run_session(number, upload, storage, recorder, args):
+    """One simulated auditor, start to finish."""
+    _session.id = f"load-test-{number}-{uuid.uuid4().hex[:8]}"
+    rng = random.Random(args.seed + number)
+    at = _app(args.timeout)
+    name, data = upload
+
+    def step(interaction, action):
+        start = time.perf_counter()
+        error = None
+        try:
+            action()
+            if at.exception:
+                error = at.exception[0].value
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        recorder.add(number, interaction, time.perf_counter() - start, error)
+        if args.think_seconds:
+            time.sleep(rng.expovariate(1 / args.think_seconds))
+        return error is None
+
+    def map_columns():
+        boxes = {box.label: box for box in at.sidebar.selectbox}
+        for label, column in zip(MAPPING_LABELS, SALES_COLUMNS):
+            boxes[label].set_value(column)
+        at.run()
+
+    def set_filter():
+        at.number_input(key='min_diff_filter').set_value(float(rng.choice([0, 1, 5, 20, 50]))).run()
+
+    steps = [
+        ('open', at.run),
+        ('login', lambda: _login(at, args.username, args.password)),
+        ('upload', lambda: at.sidebar.file_uploader[0].set_value([(name, data, 'text/csv')]).run()),
+        ('map columns', map_columns),
+        ('analyze', lambda: at.button(key='analyze_btn').click().run()),
+    ]
+    for interaction, action in steps:
+        if not step(interaction, action):
+            return
+    if not any(box.key == 'min_diff_filter' for box in at.number_input):
+        # No variance cases in this ledger: no filters or report to exercise
+        recorder.add_no_cases(number)
+        return
+    for _ in range(args.cycles):
+        step('filter', set_filter)
+        step('quick filter', lambda: next(b for b in at.button if b.label == "🔥 High").click().run())
+        step('download', lambda: _download(at, storage, "📥 Download Excel Report"))
+
+
+def read_cache_stats(username, password, timeout):
+    """Frame cache counters per kind, read from the Memory Cache panel of an operator session."""
+    at = _app(timeout)
+    _session.id = f"load-test-stats-{uuid.uuid4().hex[:8]}"
+    at.run()
+    _login(at, username, password)
+    for table in at.sidebar.dataframe:
+        counters = table.value
+        if 'hits' in counters.columns:
+            return {kind: {k: int(v) for k, v in row.items() if k in ('hits', 'misses', 'waits', 'evictions', 'spills')}
+                    for kind, row in counters.iterrows()}
+    return {}
+
+
+def _hit_rates(before, after):
+    """Hit rate per cache kind over the test, from two counter snapshots."""
+    rates = {}
+    for kind, counts in after.items():
+        hits = counts.get('hits', 0) - before.get(kind, {}).get('hits', 0)
+        misses = counts.get('misses', 0) - before.get(kind, {}).get('misses', 0)
+        if hits + misses:
+            rates[kind] = {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses)}
+    return rates
+
+
+def run_load_test(args):
+    """Run args.sessions sessions concurrently; returns the result record."""
+    files = []
+    for i in range(args.distinct_files):
+        ledger = generate_sales_ledger(args.rows, seed=args.seed + i)
+        files.append((f"ledger_{i}.csv", ledger.to_csv(index=False).encode('utf-8')))
+    recorder = Recorder()
+
+    with shared_app_runtime() as storage:
+        stats_before = read_cache_stats(args.username, args.password, args.timeout)
+        rss = RSSSampler()
+        rss.start()
+        threads = []
+        started = time.perf_counter()
+        for number in range(args.sessions):
+            thread = threading.Thread(
+                target=run_session, args=(number, files[number % len(files)], storage, recorder, args),
+                name=f"session-{number}",
+            )
+            thread.start()
+            threads.append(thread)
+            if args.ramp_seconds:
+                time.sleep(args.ramp_seconds / args.sessions)
+        for thread in threads:
+            thread.join()
+        wall_seconds = time.perf_counter() - started
+        rss.stop()
+        stats_after = read_cache_stats(args.username, args.password, args.timeout)
+
+    return {
+        'sessions': args.sessions,
+        'rows': args.rows,
+        'distinct_files': args.distinct_files,
+        'cycles': args.cycles,
+        'think_seconds': args.think_seconds,
+        'wall_seconds': wall_seconds,
+        'rss_start_mb': rss.start_mb,
+        'rss_peak_mb': rss.peak_mb,
+        'interactions': recorder.summary(),
+        'cache': _hit_rates(stats_before, stats_after),
+        'no_case_sessions': len(recorder.no_cases),
+        'timing_note': TIMING_NOTE,
+        'errors': [s for s in recorder.samples if s['error']][:20],
+    }
+
+
+def _format_seconds(value):
+    return '-' if value is None else f"{value:.2f}"
+
+
+def print_report(result):
+    print(f"\n{result['sessions']} sessions × {result['rows']:,} rows "
+          f"({result['distinct_files']} distinct files), {result['wall_seconds']:.1f}s wall")
+    print(f"\n{'step':<14} {'count':>6} {'errors':>6} {'p50':>7} {'p90':>7} {'p95':>7} {'p99':>7} {'max':>7}")
+    for row in result['interactions']:
+        print(f"{row['interaction']:<14} {row['count']:>6} {row['errors']:>6} "
+              + ' '.join(f"{_format_seconds(row[k]):>7}" for k in ('p50', 'p90', 'p95', 'p99', 'max')))
+    print(TIMING_NOTE)
+    if result['no_case_sessions']:
+        print(f"{result['no_case_sessions']} session(s) found no variance cases and skipped filter and download")
+    print(f"\nRSS: {result['rss_start_mb']:,.0f} MB at start, {result['rss_peak_mb']:,.0f} MB peak")
+    if result['cache']:
+        print("\nFrame cache:")
+        for kind, counts in result['cache'].items():
+            print(f"  {kind:<10} {counts['hit_rate']:>6.1%} hits ({counts['hits']} hits, {counts['misses']} misses)")
+    for sample in result['errors']:
+        print(f"✗ session {sample['session']} {sample['interaction']}: {sample['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the Streamlit app with concurrent sessions")
+    parser.add_argument('--sessions', type=int, default=8, help="Concurrent sessions (default: 8)")
+    parser.add_argument('--rows', type=int, default=100_000, help="Rows per uploaded ledger (default: 100000)")
+    parser.add_argument('--distinct-files', type=int, default=None,
+                        help="Different ledgers shared out among the sessions (default: one per session)")
+    parser.add_argument('--cycles', type=int, default=2, help="Filter + download rounds per session (default: 2)")
+    parser.add_argument('--think-seconds', type=float, default=0.0,
+                        help="Mean pause after each interaction, exponentially distributed (default: 0)")
+    parser.add_argument('--ramp-seconds', type=float, default=0.0, help="Spread session starts over this long")
+    parser.add_argument('--timeout', type=float, default=600.0, help="Per-interaction timeout in seconds")
+    parser.add_argument('--username', default='admin', help="Login used by every session (an operator)")
+    parser.add_argument('--password', default='admin123')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-save', action='store_true', help="Don't append results to the history file")
+    args = parser.parse_args()
+    args.distinct_files = max(1, min(args.distinct_files or args.sessions, args.sessions))
+
+    result = run_load_test(args)
+    print_report(result)
+
+    if not args.no_save:
+        record = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            **result,
+        }
+        os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+        with open(RESULTS_FILE, 'a', encoding='utf-8') as fh:
+            fh.write(json.dumps(record) + '\n')
+        print(f"\n✓ Results appended to {os.path.relpath(RESULTS_FILE)}")
+    if any(row['errors'] for row in result['interactions']):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
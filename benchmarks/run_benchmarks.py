@@ -0,0 +1,306 @@
+"""
+Scaling benchmark for the audit pipeline.
+
+Times how long a fresh interpreter takes to import the core module and the
+app, then generates synthetic ledgers (see generate_data.py) at several
+sizes and times each pipeline stage: file parsing, the data quality check, both
+variance engines and the Excel report. Every stage is run once for wall
+time and once under tracemalloc for peak Python-heap memory, so tracing
+overhead never inflates the timings. The memory pass also samples the
+process RSS, which includes native allocations tracemalloc can't see (the
+Polars backend allocates outside the Python heap); compare backends by
+RSS growth. With --backend, the audits run on each dataframe backend and
+their results are checked to be identical.
+
+Results are appended to benchmarks/results/history.jsonl and each run is
+compared against the previous run of the same size and stage, so
+regressions show up as a percentage change.
+
+Usage:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --sizes 10000 100000 1000000 10000000 --skip-memory
+    python benchmarks/run_benchmarks.py --sizes 50000 --xlsx
+    python benchmarks/run_benchmarks.py --sizes 1000000 --backend pandas polars
+"""
+
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+sys.path.insert(0, HERE)
+
+import pandas as pd  # noqa: E402
+
+import audit_core  # noqa: E402
+import excel_reader  # noqa: E402
+from generate_data import XLSX_MAX_ROWS, generate_sales_ledger  # noqa: E402
+from perf import current_rss_mb  # noqa: E402
+
+RESULTS_FILE = os.path.join(HERE, 'results', 'history.jsonl')
+
+COLUMN_MAPPING = {
+    'material_description': 'MATERIAL DESCRIPTION',
+    'date_column': 'SO CREATED ON',
+    'material_code': 'MATERIAL CODE',
+    'customer_name': 'SOLD TO PARTY NAME',
+    'basic_rate': 'BASIC RATE',
+}
+DATE_FORMAT = '%d-%m-%Y'
+
+
+def _read_uncached(name, file_bytes):
+    """Parse an upload the way the app does, bypassing its frame cache."""
+    return audit_core.read_table(file_bytes, name)
+
+
+class _RSSSampler:
+    """Highest RSS seen while the block runs, sampled from a background thread."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss_mb() or 0)
+
+    def __enter__(self):
+        self.base = self.peak = current_rss_mb() or 0
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_mb() or 0)
+
+    @property
+    def growth_mb(self):
+        return self.peak - self.base
+
+
+def _measure(func, skip_memory):
+    """Run func for wall time, then again under tracemalloc for peak memory.
+
+    Returns (result, seconds, peak_mb, rss_mb); the memory figures are None
+    with skip_memory.
+    """
+    gc.collect()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+
+    peak_mb = rss_mb = None
+    if not skip_memory:
+        del result
+        gc.collect()
+        tracemalloc.start()
+        with _RSSSampler() as rss:
+            result = func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_mb = peak / 1024 ** 2
+        rss_mb = rss.growth_mb
+    return result, seconds, peak_mb, rss_mb
+
+
+def _stage_name(stage, backend):
+    """pandas keeps the plain stage names so its history stays comparable."""
+    return stage if backend == 'pandas' else f"{stage} ({backend})"
+
+
+def benchmark_size(rows, *, xlsx=False, skip_memory=False, seed=42, backends=('pandas',)):
+    """Time every pipeline stage on a generated ledger of the given size.
+
+    The audits run once per backend; their results must match the first
+    backend's exactly.
+    """
+    ledger = generate_sales_ledger(rows, seed=seed)
+    csv_bytes = ledger.to_csv(index=False).encode('utf-8')
+    critical_columns = list(COLUMN_MAPPING.values())
+
+    outputs = {}
+    stages = [
+        ('read_csv', lambda: _read_uncached('ledger.csv', csv_bytes)),
+    ]
+    if xlsx and rows <= XLSX_MAX_ROWS:
+        xlsx_buffer = io.BytesIO()
+        ledger.to_excel(xlsx_buffer, index=False)
+        xlsx_bytes = xlsx_buffer.getvalue()
+        stages.append(('read_xlsx', lambda: _read_uncached('ledger.xlsx', xlsx_bytes)))
+        # Every available workbook reader, each checked against pd.read_excel below
+        for reader in excel_reader.reader_chain('ledger.xlsx', 'auto'):
+            def _read_xlsx(reader=reader):
+                outputs['xlsx', reader] = excel_reader.read_excel(xlsx_bytes, 'ledger.xlsx', reader=reader)
+                return outputs['xlsx', reader]
+            stages.append((f'read_xlsx ({reader})', _read_xlsx))
+
+    df = _read_uncached('ledger.csv', csv_bytes)
+
+    def _audit(name, engine, backend):
+        def run():
+            outputs[name, backend] = engine(df, COLUMN_MAPPING, date_format=DATE_FORMAT, backend=backend)
+            return outputs[name, backend]
+        return run
+
+    def _quality():
+        outputs['quality'] = audit_core.analyze_data_quality(df, critical_columns=critical_columns)
+        return outputs['quality']
+
+    stages.append(('analyze_data_quality', _quality))
+    for backend in backends:
+        stages += [
+            (_stage_name('audit_within_customer', backend),
+             _audit('within', audit_core.audit_material_price_variance, backend)),
+            (_stage_name('audit_across_customers', backend),
+             _audit('across', audit_core.audit_cross_customer_variance, backend)),
+        ]
+
+    results = []
+    for stage, func in stages:
+        _, seconds, peak_mb, rss_mb = _measure(func, skip_memory)
+        results.append({'stage': stage, 'seconds': seconds, 'peak_mb': peak_mb, 'rss_mb': rss_mb})
+
+    for key in [key for key in outputs if key[0] == 'xlsx' and key[1] != 'pandas']:
+        pd.testing.assert_frame_equal(outputs['xlsx', 'pandas'], outputs[key])
+
+    for name in ('within', 'across'):
+        expected = outputs[name, backends[0]]
+        for backend in backends[1:]:
+            # Identical frames make identical reports
+            for left, right in zip(expected, outputs[name, backend]):
+                if left is not None or right is not None:
+                    pd.testing.assert_frame_equal(left, right)
+
+    # The report covers the within-customer result, as the app's default mode does
+    variance_df = outputs['within', backends[0]][0]
+    if variance_df is not None:
+        _, seconds, peak_mb, rss_mb = _measure(
+            lambda: audit_core.create_excel_download(
+                variance_df.head(XLSX_MAX_ROWS), metadata={'Rows': rows}, quality_issues=outputs['quality']
+            ),
+            skip_memory,
+        )
+        results.append({'stage': 'create_excel_download', 'seconds': seconds, 'peak_mb': peak_mb, 'rss_mb': rss_mb,
+                        'report_rows': min(len(variance_df), XLSX_MAX_ROWS)})
+
+    for result in results:
+        result['rows'] = rows
+        result['input_mb'] = len(csv_bytes) / 1024 ** 2
+    return results
+
+
+def measure_startup(repeats=5):
+    """Best-of-N time for a fresh interpreter to import each entry module.
+
+    audit_core is what the CLI, service workers and benchmarks load; app
+    additionally pulls in Streamlit and Plotly.
+    """
+    src_dir = os.path.join(HERE, '..', 'src')
+    results = []
+    for module in ('audit_core', 'app'):
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', f'import {module}'], cwd=src_dir, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            timings.append(time.perf_counter() - start)
+        results.append({'stage': f'import_{module}', 'seconds': min(timings), 'peak_mb': None, 'rows': 0})
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _load_previous():
+    """Latest recorded result per (rows, stage)."""
+    previous = {}
+    if os.path.exists(RESULTS_FILE):
+        with open(RESULTS_FILE, encoding='utf-8') as fh:
+            for line in fh:
+                record = json.loads(line)
+                previous[(record['rows'], record['stage'])] = record
+    return previous
+
+
+def _format_change(current, before):
+    if before is None or not before:
+        return ''
+    change = (current - before) / before * 100
+    return f"{change:+.0f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the audit pipeline at several sizes")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                        help="Ledger sizes in rows (10k to 10M)")
+    parser.add_argument('--xlsx', action='store_true', help="Also benchmark XLSX parsing (slow to prepare)")
+    parser.add_argument('--skip-memory', action='store_true', help="Skip the tracemalloc pass")
+    parser.add_argument('--no-save', action='store_true', help="Don't append results to the history file")
+    parser.add_argument('--skip-startup', action='store_true', help="Skip the module import timings")
+    parser.add_argument('--backend', nargs='+', choices=sorted(audit_core.BACKENDS), default=['pandas'],
+                        help="Dataframe backends to benchmark the audits on (default: pandas)")
+    args = parser.parse_args()
+    for backend in args.backend:
+        try:
+            audit_core.get_backend(backend)
+        except ImportError as e:
+            parser.error(str(e))
+
+    previous = _load_previous()
+    run_info = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'backends': args.backend,
+        'machine': platform.machine(),
+    }
+
+    print(f"{'rows':>10}  {'stage':<32} {'seconds':>9} {'vs last':>8} {'peak MB':>9} {'vs last':>8} {'RSS +MB':>8}")
+    all_results = []
+    runs = [(0, measure_startup)] if not args.skip_startup else []
+    runs += [(rows, lambda rows=rows: benchmark_size(rows, xlsx=args.xlsx, skip_memory=args.skip_memory,
+                                                    backends=args.backend))
+             for rows in args.sizes]
+    for rows, run in runs:
+        for result in run():
+            before = previous.get((rows, result['stage']), {})
+            peak = f"{result['peak_mb']:.1f}" if result['peak_mb'] is not None else '-'
+            peak_change = _format_change(result['peak_mb'], before.get('peak_mb')) if result['peak_mb'] else ''
+            rss = f"{result['rss_mb']:.1f}" if result.get('rss_mb') is not None else '-'
+            print(
+                f"{rows:>10,}  {result['stage']:<32} {result['seconds']:>9.3f} "
+                f"{_format_change(result['seconds'], before.get('seconds')):>8} {peak:>9} {peak_change:>8} {rss:>8}"
+            )
+            all_results.append({**run_info, **result})
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+        with open(RESULTS_FILE, 'a', encoding='utf-8') as fh:
+            for record in all_results:
+                fh.write(json.dumps(record) + '\n')
+        print(f"\n✓ Results appended to {os.path.relpath(RESULTS_FILE)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,51 @@ import pandas as pd
 from datetime import datetime
 import plotly.express as px
 import plotly.graph_objects as go
-from io import BytesIO
-import io
 import hashlib
 import hmac
 from difflib import get_close_matches
 import time
-import json
+import importlib.util
+import os
+import tempfile
+
+from audit_core import (
+    ACROSS_KEYS,
+    COLUMNAR_FORMATS,
+    PROGRESSIVE_CHUNK_ROWS,
+    RATE_PRECISION,
+    SOURCE_COLUMNS,
+    WITHIN_KEYS,
+    analyze_data_quality,
+    audit_contract_price,
+    audit_cross_customer_variance,
+    audit_material_price_variance,
+    audit_price_drift,
+    create_excel_download,
+    export_frame,
+    get_case_rates,
+    get_case_source_rows,
+    iter_table_chunks,
+    issue_rows_csv,
+    list_sheets,
+    preview_audit,
+    quality_report_frame,
+    read_sources,
+    read_table,
+    stream_top_variances,
+)
+from ingestion_profiles import (
+    DEFAULT_PROFILES_PATH,
+    IngestionProfiles,
+    build_profile,
+    read_header,
+    read_plan,
+    read_with_profile,
+)
+from memory_cache import FrameCache, SessionFrames
+from perf import PipelineProfile, stage
+from price_history import PriceHistory
+import sql_console
 
 # Page configuration
 st.set_page_config(
@@ -31,6 +69,22 @@ except (FileNotFoundError, KeyError):
         "manager": "manager123"  # Username: manager, Password: manager123
     }
 
+# Cached uploads and per-session results share one memory budget; idle
+# sessions' results are spilled to disk (settable through the environment)
+CACHE_BUDGET_MB = int(os.environ.get('SALES_AUDIT_CACHE_MB', '1024'))
+SESSION_IDLE_MINUTES = int(os.environ.get('SALES_AUDIT_SESSION_IDLE_MINUTES', '30'))
+SPILL_DIR = os.environ.get('SALES_AUDIT_SPILL_DIR', os.path.join(tempfile.gettempdir(), 'sales-audit-spill'))
+# Price levels of earlier uploads, for the price drift check
+HISTORY_DB = os.environ.get(
+    'SALES_AUDIT_HISTORY_DB', os.path.join(os.path.expanduser('~'), '.sales_audit', 'price_history.sqlite')
+)
+
+# Users who can see cache usage in the sidebar
+try:
+    OPERATORS = set(st.secrets["operators"])
+except (FileNotFoundError, KeyError):
+    OPERATORS = {"admin"}
+
 def check_password():
     """Returns `True` if the user has entered correct credentials."""
     
@@ -89,6 +143,8 @@ def check_password():
             if st.button("🚪 Logout", use_container_width=True):
                 st.session_state["authenticated"] = False
                 st.session_state["current_user"] = None
+                if '_session_frames' in st.session_state:
+                    st.session_state['_session_frames'].clear()
                 st.rerun()
         
         return True
@@ -156,285 +212,435 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-def audit_material_price_variance(df, column_mapping, *, date_format=None, dayfirst=False):
-    """
-    Audits material sales to identify when same customer bought same material 
-    on same date at different basic rates.
-    
-    Parameters:
-    df: Input DataFrame
-    column_mapping: Dictionary mapping required columns to actual column names
-    """
-    
-    # Rename columns based on mapping
-    df_renamed = df.rename(columns={
-        column_mapping['material_description']: 'MATERIAL DESCRIPTION',
-        column_mapping['date_column']: 'SO CREATED ON',
-        column_mapping['material_code']: 'MATERIAL CODE',
-        column_mapping['customer_name']: 'SOLD TO PARTY NAME',
-        column_mapping['basic_rate']: 'BASIC RATE'
-    })
-    
-    # Ensure numeric for BASIC RATE
-    df_renamed['BASIC RATE'] = pd.to_numeric(df_renamed['BASIC RATE'], errors='coerce')
-    # Convert date column to datetime
-    if date_format:
-        df_renamed['SO CREATED ON'] = pd.to_datetime(df_renamed['SO CREATED ON'], format=date_format, errors='coerce')
-    else:
-        df_renamed['SO CREATED ON'] = pd.to_datetime(df_renamed['SO CREATED ON'], errors='coerce', dayfirst=dayfirst)
-    
-    # Remove rows with missing critical data
-    df_clean = df_renamed.dropna(subset=[
-        'MATERIAL CODE',
-        'SO CREATED ON',
-        'SOLD TO PARTY NAME',
-        'BASIC RATE'
-    ])
-    
-    # Group by customer, material code, and date
-    grouped = df_clean.groupby(['SOLD TO PARTY NAME', 'MATERIAL CODE', 'SO CREATED ON'])
-    
-    variance_groups = []
-    
-    for (party_name, material_code, doc_date), group in grouped:
-        unique_rates = group['BASIC RATE'].unique()
-        
-        if len(unique_rates) > 1:
-            max_rate = group['BASIC RATE'].max()
-            min_rate = group['BASIC RATE'].min()
-            
-            variance_groups.append({
-                'Customer': party_name,
-                'Material Code': material_code,
-                'Date': doc_date.strftime('%Y-%m-%d'),
-                'Material Description': group['MATERIAL DESCRIPTION'].iloc[0] if 'MATERIAL DESCRIPTION' in group.columns else 'N/A',
-                'Max Rate': max_rate,
-                'Min Rate': min_rate,
-                'Difference': round(max_rate - min_rate, 2),
-                'Variance %': round(((max_rate - min_rate) / min_rate) * 100, 2) if min_rate != 0 else 0
-            })
-    
-    if variance_groups:
-        variance_df = pd.DataFrame(variance_groups)
-        variance_df = variance_df.sort_values('Difference', ascending=False)
-        return variance_df, df_clean
-    else:
-        return None, df_clean
-
-def audit_cross_customer_variance(df, column_mapping, *, date_format=None, dayfirst=False):
-    """
-    Audits sales to identify cases where on the same date the same material code
-    was sold to DIFFERENT customers at DIFFERENT prices.
+@st.cache_resource
+def _frame_cache():
+    """Process-wide frame cache shared by all sessions, bounded by CACHE_BUDGET_MB."""
+    return FrameCache(CACHE_BUDGET_MB * 1024 ** 2, spill_dir=SPILL_DIR)
 
-    Parameters:
-    df: Input DataFrame
-    column_mapping: Dictionary mapping required columns to actual column names
-    """
+@st.cache_resource
+def _price_history():
+    """Price history store shared by all sessions."""
+    return PriceHistory(HISTORY_DB)
 
-    # Rename columns based on mapping
-    df_renamed = df.rename(columns={
-        column_mapping['material_description']: 'MATERIAL DESCRIPTION',
-        column_mapping['date_column']: 'SO CREATED ON',
-        column_mapping['material_code']: 'MATERIAL CODE',
-        column_mapping['customer_name']: 'SOLD TO PARTY NAME',
-        column_mapping['basic_rate']: 'BASIC RATE'
-    })
+@st.cache_resource
+def _ingestion_profiles():
+    """Saved ingestion profiles (DEFAULT_PROFILES_PATH), shared by all sessions and the CLI."""
+    return IngestionProfiles(DEFAULT_PROFILES_PATH)
 
-    # Ensure numeric for BASIC RATE
-    df_renamed['BASIC RATE'] = pd.to_numeric(df_renamed['BASIC RATE'], errors='coerce')
-    # Convert date column to datetime
-    if date_format:
-        df_renamed['SO CREATED ON'] = pd.to_datetime(df_renamed['SO CREATED ON'], format=date_format, errors='coerce')
-    else:
-        df_renamed['SO CREATED ON'] = pd.to_datetime(df_renamed['SO CREATED ON'], errors='coerce', dayfirst=dayfirst)
+def _session_frames():
+    """This session's handle on the shared frame cache."""
+    if '_session_frames' not in st.session_state:
+        st.session_state['_session_frames'] = SessionFrames(_frame_cache())
+    return st.session_state['_session_frames']
 
-    # Remove rows with missing critical data
-    df_clean = df_renamed.dropna(subset=[
-        'MATERIAL CODE',
-        'SO CREATED ON',
-        'SOLD TO PARTY NAME',
-        'BASIC RATE'
-    ])
+def _upload_digest(uploaded_file):
+    """SHA-256 of an upload's content, hashed once per uploaded file."""
+    digests = st.session_state.setdefault('upload_digests', {})
+    if uploaded_file.file_id not in digests:
+        # Only the sales file and a price master are live at a time
+        while len(digests) >= 4:
+            digests.pop(next(iter(digests)))
+        digests[uploaded_file.file_id] = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    return digests[uploaded_file.file_id]
 
-    # For each (Material Code, Date), compare prices across different customers
-    results = []
+def _sheet_names(uploaded_file):
+    """Sheet names of an uploaded workbook ([None] for CSV), listed once per upload."""
+    sheets = st.session_state.setdefault('upload_sheets', {})
+    if uploaded_file.file_id not in sheets:
+        while len(sheets) >= 8:
+            sheets.pop(next(iter(sheets)))
+        sheets[uploaded_file.file_id] = list_sheets(uploaded_file.getvalue(), uploaded_file.name)
+    return sheets[uploaded_file.file_id]
 
-    # Aggregate to customer-level first (to avoid within-customer duplicates)
-    cust_level = (
-        df_clean
-        .groupby(['MATERIAL CODE', 'SO CREATED ON', 'SOLD TO PARTY NAME'], as_index=False)
-        .agg({
-            'BASIC RATE': 'mean',
-            'MATERIAL DESCRIPTION': 'first'
-        })
-        .rename(columns={'BASIC RATE': 'CUSTOMER AVG RATE'})
+def _select_sources(uploaded_files):
+    """(file, sheet) pairs to load, letting the user pick sheets of multi-sheet workbooks."""
+    options = [(f, sheet) for f in uploaded_files for sheet in _sheet_names(f)]
+    if all(len(_sheet_names(f)) == 1 for f in uploaded_files):
+        return options
+    labels = [f.name if sheet is None else f"{f.name} › {sheet}" for f, sheet in options]
+    first_sheets = [label for label, (f, sheet) in zip(labels, options) if sheet == _sheet_names(f)[0]]
+    selected = st.sidebar.multiselect(
+        "Sheets to load",
+        labels,
+        default=first_sheets,
+        help="Selected sheets from all files are combined, each row tagged with its source file, sheet and row"
     )
+    chosen = [option for label, option in zip(labels, options) if label in selected]
+    return chosen or options[:1]
 
-    for (material_code, doc_date), grp in cust_level.groupby(['MATERIAL CODE', 'SO CREATED ON']):
-        # Unique rates across customers
-        unique_rates = grp['CUSTOMER AVG RATE'].round(6).unique()
-        if len(unique_rates) > 1:
-            # Identify min/max rate and corresponding customers
-            idx_min = grp['CUSTOMER AVG RATE'].idxmin()
-            idx_max = grp['CUSTOMER AVG RATE'].idxmax()
-            row_min = grp.loc[idx_min]
-            row_max = grp.loc[idx_max]
+def _upload_header(uploaded_file):
+    """Header row of an upload, read once per uploaded file."""
+    headers = st.session_state.setdefault('upload_headers', {})
+    if uploaded_file.file_id not in headers:
+        while len(headers) >= 4:
+            headers.pop(next(iter(headers)))
+        headers[uploaded_file.file_id] = read_header(uploaded_file.getvalue(), uploaded_file.name)
+    return headers[uploaded_file.file_id]
 
-            min_rate = float(row_min['CUSTOMER AVG RATE'])
-            max_rate = float(row_max['CUSTOMER AVG RATE'])
+def _read_uploaded_file(name: str, file_bytes: bytes, digest: str = None, ingest_profile=None,
+                        stats=None) -> pd.DataFrame:
+    """Cached reader for uploaded file content.
 
-            # Build a compact list of customer -> rate for context (top 5 by deviation)
-            sample_customers = (
-                grp[['SOLD TO PARTY NAME', 'CUSTOMER AVG RATE']]
-                .sort_values('CUSTOMER AVG RATE')
-            )
+    Parsed frames are shared across sessions through the frame cache, keyed
+    by content hash (and the read plan of a matched ingestion profile), and
+    must be treated as read-only. stats receives the reader and its
+    throughput when the file is actually parsed.
+    """
+    key = ('upload', name, digest or hashlib.sha256(file_bytes).hexdigest(), read_plan(ingest_profile))
+    cache = _frame_cache()
+    df = cache.get(key)
+    if df is None:
+        if ingest_profile is None:
+            df = read_table(file_bytes, name, stats=stats)
+        else:
+            df = read_with_profile(file_bytes, name, ingest_profile, stats=stats)
+        df = cache.put(key, df)
+    return df
 
-            results.append({
-                'Material Code': material_code,
-                'Date': pd.to_datetime(doc_date).strftime('%Y-%m-%d'),
-                'Material Description': row_min.get('MATERIAL DESCRIPTION', 'N/A'),
-                'Min Rate': round(min_rate, 2),
-                'Min Customer': row_min['SOLD TO PARTY NAME'],
-                'Max Rate': round(max_rate, 2),
-                'Max Customer': row_max['SOLD TO PARTY NAME'],
-                'Difference': round(max_rate - min_rate, 2),
-                'Variance %': round(((max_rate - min_rate) / min_rate) * 100, 2) if min_rate != 0 else 0,
-                'Unique Customers': grp['SOLD TO PARTY NAME'].nunique(),
-            })
+def _quality_issues(digest, df, critical_columns, column_mapping=None, date_format=None, dayfirst=False):
+    """analyze_data_quality of a loaded upload, run once per file, columns, mapping and date options."""
+    key = ('quality', digest, tuple(df.columns), tuple(critical_columns),
+           tuple(sorted(column_mapping.items())) if column_mapping else None, date_format, dayfirst)
+    quality_issues, _ = _frame_cache().get_or_compute(
+        key, lambda: analyze_data_quality(df, critical_columns=critical_columns, column_mapping=column_mapping,
+                                          date_format=date_format, dayfirst=dayfirst)
+    )
+    return quality_issues
 
-    if results:
-        out_df = pd.DataFrame(results).sort_values('Difference', ascending=False)
-        return out_df, df_clean
-    else:
-        return None, df_clean
+def _result_key(digest, mode, column_mapping, *, date_format, dayfirst, rate_precision, critical_columns,
+                keys=None, master_digest=None, master_mapping=None, drift_options=None):
+    """Cache key of an analysis: everything its result depends on."""
+    return (
+        'result', digest, mode, tuple(sorted(column_mapping.items())), date_format, dayfirst, rate_precision,
+        tuple(critical_columns), tuple(keys) if keys else None,
+        master_digest, tuple(sorted(master_mapping.items())) if master_mapping else None,
+        tuple(sorted(drift_options.items())) if drift_options else None,
+    )
 
-def create_excel_download(df, metadata=None, quality_issues=None):
-    """Create an enhanced multi-sheet Excel file in memory for download"""
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        # Main variance sheet
-        df.to_excel(writer, index=False, sheet_name='Price Variances')
+def _render_cache_panel():
+    """Frame cache usage for operators."""
+    cache = _frame_cache()
+    stats = cache.stats()
+    with st.sidebar.expander("🧠 Memory Cache", expanded=False):
+        st.progress(
+            min(stats['used_mb'] / stats['budget_mb'], 1.0) if stats['budget_mb'] else 0.0,
+            text=f"{stats['used_mb']:,.1f} MB of {stats['budget_mb']:,.0f} MB in memory",
+        )
+        st.caption(
+            f"{stats['entries']} entries in memory · {stats['spilled_entries']} spilled to disk "
+            f"({stats['spilled_mb']:,.1f} MB) · idle sessions spill after {SESSION_IDLE_MINUTES} min"
+        )
+        if stats['by_kind']:
+            counters = pd.DataFrame.from_dict(stats['by_kind'], orient='index')
+            lookups = counters['hits'] + counters['misses']
+            counters['hit rate %'] = (counters['hits'] / lookups.where(lookups > 0) * 100).round(1)
+            st.dataframe(counters, use_container_width=True)
+        entries = cache.entries()
+        if entries:
+            table = pd.DataFrame(entries)
+            table['key'] = table['key'].astype(str)
+            st.dataframe(table.round({'size_mb': 2, 'idle_seconds': 0}), use_container_width=True, hide_index=True)
+
+def _set_quick_filter(min_diff, min_var=None):
+    st.session_state['min_diff_filter'] = min_diff
+    if min_var is not None:
+        st.session_state['min_var_filter'] = min_var
+
+@st.fragment
+def _render_variance_details(total_records):
+    """Filters, variance table, drill-down and downloads of the session's analysis.
+
+    Runs as a fragment, so a filter change or row selection reruns only this
+    part of the page instead of the whole script.
+    """
+    analysis = _session_frames().get('analysis')
+    if not analysis or analysis['variance_df'] is None:
+        return
+    variance_df = analysis['variance_df']
+    df_clean = analysis['df_clean']
+    
+    # Variance table with filters
+    st.subheader("🔍 Price Variance Details")
+    
+    with st.expander("🎯 Filters & Quick Actions", expanded=True):
+        st.session_state.setdefault('min_diff_filter', 0.0)
+        st.session_state.setdefault('min_var_filter', 0.0)
         
-        # Metadata sheet
-        if metadata:
-            meta_df = pd.DataFrame(list(metadata.items()), columns=['Property', 'Value'])
-            meta_df.to_excel(writer, index=False, sheet_name='Metadata')
+        col1, col2 = st.columns(2)
+        with col1:
+            min_diff = st.number_input("Min Difference (₹)", min_value=0.0, step=0.5, key="min_diff_filter")
+        with col2:
+            min_var = st.number_input("Min Variance %", min_value=0.0, step=0.5, key="min_var_filter")
         
-        # Data quality summary sheet
-        if quality_issues:
-            quality_data = []
-            if quality_issues.get('missing'):
-                for col, count in quality_issues['missing'].items():
-                    quality_data.append({
-                        'Issue Type': 'Missing Values', 
-                        'Column': col, 
-                        'Count': count,
-                        'Impact': '⚠️ High' if count > 100 else '⚠️ Medium' if count > 10 else '⚠️ Low'
-                    })
-            if quality_issues.get('duplicates'):
-                quality_data.append({
-                    'Issue Type': 'Duplicate Rows', 
-                    'Column': 'All', 
-                    'Count': quality_issues['duplicates'],
-                    'Impact': '⚠️ High' if quality_issues['duplicates'] > 100 else '⚠️ Medium'
-                })
-            
-            if quality_data:
-                quality_df = pd.DataFrame(quality_data)
-                quality_df.to_excel(writer, index=False, sheet_name='Data Quality Summary')
+        # Quick filter presets; callbacks set the inputs before the fragment reruns
+        st.markdown("**Quick Filters:**")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.button("🔥 High", help="Difference >₹100", use_container_width=True,
+                      on_click=_set_quick_filter, args=(100.0,))
+        with col2:
+            st.button("⚡ Medium", help="Difference >₹50", use_container_width=True,
+                      on_click=_set_quick_filter, args=(50.0,))
+        with col3:
+            st.button("🔄 Reset", help="Clear all filters", use_container_width=True,
+                      on_click=_set_quick_filter, args=(0.0, 0.0))
+    
+    # Apply optional filters
+    filtered_df = variance_df.copy()
+    # Parse Date to datetime for range filters
+    try:
+        filtered_df['__DateDT'] = pd.to_datetime(filtered_df['Date'], errors='coerce')
+    except Exception:
+        filtered_df['__DateDT'] = pd.NaT
+
+    # Filters in collapsible section for cleaner UI
+    with st.expander("🎚️ Advanced Filters", expanded=False):
+        col1, col2 = st.columns(2)
         
-        # Detailed missing values sheet with row locations
-        if quality_issues and quality_issues.get('missing_details'):
-            missing_details_data = []
-            for col, details in quality_issues['missing_details'].items():
-                # Convert row indices to Excel row numbers (add 2 for header)
-                excel_rows = [idx + 2 for idx in details['rows']]
-                rows_str = ", ".join(map(str, excel_rows[:50]))  # Show first 50
-                if len(excel_rows) > 50:
-                    rows_str += f"... and {len(excel_rows) - 50} more"
-                
-                missing_details_data.append({
-                    'Column Name': col,
-                    'Missing Count': details['count'],
-                    'Excel Row Numbers': rows_str,
-                    'Quick Fix': f"Filter: df[df['{col}'].notna()] OR Fill: df['{col}'].fillna('N/A')"
-                })
-            
-            if missing_details_data:
-                missing_df = pd.DataFrame(missing_details_data)
-                missing_df.to_excel(writer, index=False, sheet_name='Missing Values Detail')
+        with col1:
+            # Date range filter control
+            if filtered_df['__DateDT'].notna().any():
+                min_d = pd.to_datetime(filtered_df['__DateDT'].min()).date()
+                max_d = pd.to_datetime(filtered_df['__DateDT'].max()).date()
+                d1, d2 = st.date_input(
+                    "Filter by date range",
+                    value=(min_d, max_d),
+                    min_value=min_d,
+                    max_value=max_d,
+                )
+                if d1 and d2:
+                    mask = (filtered_df['__DateDT'] >= pd.to_datetime(d1)) & (filtered_df['__DateDT'] <= pd.to_datetime(d2))
+                    filtered_df = filtered_df[mask]
         
-        # Duplicate rows detail sheet
-        if quality_issues and quality_issues.get('duplicate_rows'):
-            excel_rows = [idx + 2 for idx in quality_issues['duplicate_rows']]
-            dup_data = [{
-                'Excel Row Number': row,
-                'Status': 'Duplicate',
-                'Action': 'Review and remove'
-            } for row in excel_rows[:100]]  # Limit to 100
-            
-            if dup_data:
-                dup_df = pd.DataFrame(dup_data)
-                dup_df.to_excel(writer, index=False, sheet_name='Duplicate Rows Detail')
-    
-    output.seek(0)
-    return output
+        with col2:
+            # Material filter
+            mats = sorted(variance_df['Material Code'].dropna().unique().tolist()) if 'Material Code' in variance_df.columns else []
+            if mats:
+                sel_mats = st.multiselect("Filter by material(s)", options=mats, default=[], key="material_filter")
+                if sel_mats:
+                    filtered_df = filtered_df[filtered_df['Material Code'].isin(sel_mats)]
+
+    # Threshold filters
+    if min_diff > 0:
+        filtered_df = filtered_df[filtered_df['Difference'] >= float(min_diff)]
+    if min_var > 0:
+        filtered_df = filtered_df[filtered_df['Variance %'] >= float(min_var)]
 
-@st.cache_data(show_spinner=False)
-def _read_uploaded_file(name: str, file_bytes: bytes) -> pd.DataFrame:
-    """Cached reader for uploaded file content."""
-    if name.lower().endswith('.csv'):
-        return pd.read_csv(io.BytesIO(file_bytes))
-    return pd.read_excel(io.BytesIO(file_bytes))
+    # Clean helper column for display
+    if '__DateDT' in filtered_df.columns:
+        filtered_df = filtered_df.drop(columns=['__DateDT'])
 
-def analyze_data_quality(df, critical_columns=None):
-    """Analyze data quality and return issues with row locations.
+    # Show filtered results count
+    if len(filtered_df) < len(variance_df):
+        st.info(f"📊 Showing **{len(filtered_df)}** of **{len(variance_df)}** variance cases (filters applied)")
+    else:
+        st.info(f"📊 Showing all **{len(filtered_df)}** variance cases")
     
-    Args:
-        df: DataFrame to analyze
-        critical_columns: List of column names that are critical for analysis
-    """
-    issues = {
-        'missing': {},
-        'missing_details': {},  # Store specific row numbers
-        'critical_missing': {},  # Missing values in critical columns
-        'other_missing': {},  # Missing values in non-critical columns
-        'duplicates': 0,
-        'duplicate_rows': [],
-        'non_numeric_prices': 0,
-        'date_issues': 0,
-        'customer_inconsistencies': []
-    }
+    table_event = st.dataframe(
+        filtered_df,
+        use_container_width=True,
+        height=400,
+        on_select="rerun",
+        selection_mode="single-row",
+        key="variance_table",
+    )
     
-    # Check missing values with row locations
-    for col in df.columns:
-        missing_mask = df[col].isna()
-        missing_count = missing_mask.sum()
-        if missing_count > 0:
-            issues['missing'][col] = missing_count
-            # Store row indices (Excel row = index + 2 because of header)
-            missing_rows = df[missing_mask].index.tolist()
-            issues['missing_details'][col] = {
-                'count': missing_count,
-                'rows': missing_rows[:100],  # Limit to first 100 rows
-                'sample_preview': len(missing_rows) > 100,
-                'is_critical': col in critical_columns if critical_columns else False
-            }
-            
-            # Categorize as critical or other
-            if critical_columns and col in critical_columns:
-                issues['critical_missing'][col] = missing_count
+    # Drill-down into the order lines behind the selected case
+    case_rows = analysis['case_rows']
+    if case_rows is not None:
+        with st.expander("🔎 Source Rows for Selected Case", expanded=bool(table_event.selection.rows)):
+            if table_event.selection.rows:
+                case_label = filtered_df.index[table_event.selection.rows[0]]
+                source_rows = get_case_source_rows(df_clean, case_rows, [case_label])
+                st.caption(f"{len(source_rows)} order lines (Excel row numbers refer to the uploaded file)")
+                st.dataframe(source_rows.drop(columns=['Case']), use_container_width=True, hide_index=True)
+            else:
+                st.info("👆 Select a row in the table above to see its underlying order lines.")
+    
+    # Every customer's rate behind the selected material-date (cross-customer mode)
+    case_rates = case_rows.get('rates') if case_rows is not None else None
+    if case_rates is not None:
+        with st.expander("📊 Customer Rate Distribution", expanded=bool(table_event.selection.rows)):
+            if table_event.selection.rows:
+                case_label = filtered_df.index[table_event.selection.rows[0]]
+                rates = get_case_rates(case_rates, [case_label]).drop(columns=['Case'])
+                median_rate = rates['Median Rate'].iloc[0]
+                st.caption(f"{len(rates)} customers, median rate ₹{median_rate:,.2f}; "
+                           f"deviation is each customer's rate minus the median")
+                fig = px.bar(
+                    rates, x='Customer', y='Customer Rate', color='Deviation',
+                    color_continuous_scale='RdYlGn_r', color_continuous_midpoint=0,
+                    hover_data=['Lines', 'Deviation %'],
+                )
+                fig.add_hline(y=median_rate, line_dash='dash', annotation_text='Median')
+                st.plotly_chart(fig, use_container_width=True)
+                st.dataframe(rates.drop(columns=['Median Rate']), use_container_width=True, hide_index=True)
             else:
-                issues['other_missing'][col] = missing_count
+                st.info("👆 Select a row in the table above to see every customer's rate on that date.")
+    
+    # Download section
+    st.markdown("---")
+    st.subheader("💾 Download Results")
+    
+    # Prepare metadata for download
+    metadata = {
+        'Analysis Date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'Analyzed By': st.session_state.get('current_user', 'Unknown'),
+        'Analysis Mode': st.session_state.get('analysis_mode', 'unknown'),
+        'Total Records': total_records,
+        'Valid Records': len(df_clean),
+        'Variance Cases Found': len(variance_df),
+        'Filtered Results': len(filtered_df),
+        'Min Difference Filter': f"₹{min_diff}" if min_diff > 0 else "None",
+        'Min Variance Filter': f"{min_var}%" if min_var > 0 else "None",
+    }
+    
+    quality_issues = analysis['quality_issues']
+    
+    include_source_rows = case_rows is not None and st.checkbox(
+        "Include source rows",
+        value=False,
+        help="Adds a 'Source Rows' sheet with every order line behind the exported cases"
+    )
+    include_customer_rates = case_rates is not None and st.checkbox(
+        "Include customer rate distribution",
+        value=False,
+        help="Adds a 'Customer Rates' sheet with every customer's rate and deviation from the median for the exported cases"
+    )
+    perf_profile = st.session_state.get('perf_profile')
+    filter_suffix = f"_min{int(min_diff)}" if min_diff > 0 else ""
+    
+    def _excel_report():
+        source_rows = get_case_source_rows(df_clean, case_rows, filtered_df.index) if include_source_rows else None
+        customer_rates = get_case_rates(case_rates, filtered_df.index) if include_customer_rates else None
+        with stage(perf_profile, 'report building', len(filtered_df)):
+            return create_excel_download(filtered_df, metadata=metadata, quality_issues=quality_issues,
+                                         source_rows=source_rows, customer_rates=customer_rates).getvalue()
+    
+    # Reports are built when their button is clicked, not on every filter change
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        # Enhanced Excel download with metadata
+        st.download_button(
+            label="📥 Download Excel Report (Multi-sheet)",
+            data=_excel_report,
+            file_name=f"price_variance{filter_suffix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            use_container_width=True,
+            help="Includes: Variances + Metadata + Data Quality Report"
+        )
+    
+    with col2:
+        # CSV download
+        st.download_button(
+            label="📥 Download CSV Report",
+            data=lambda: filtered_df.to_csv(index=False).encode('utf-8'),
+            file_name=f"price_variance{filter_suffix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+            mime="text/csv",
+            use_container_width=True
+        )
+    
+    with st.expander("🗂️ Parquet / Arrow exports", expanded=False):
+        if importlib.util.find_spec('pyarrow') is None:
+            st.info("Install the 'pyarrow' package to enable Parquet and Arrow exports.")
+        else:
+            st.caption("Typed, compressed columnar files for BI tools and notebooks; built when clicked.")
+            export_fmt = st.radio("Format", list(COLUMNAR_FORMATS), horizontal=True, key="columnar_format",
+                                  format_func=lambda f: {'parquet': 'Parquet', 'arrow': 'Arrow IPC'}[f])
+            ext, mime = COLUMNAR_FORMATS[export_fmt]
+            stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            exports = [
+                ("Variances", f"price_variance{filter_suffix}", lambda: export_frame(filtered_df, export_fmt)),
+                ("Cleaned data", "sales_clean", lambda: export_frame(df_clean, export_fmt)),
+                ("Quality report", "data_quality", lambda: export_frame(quality_report_frame(quality_issues), export_fmt)),
+            ]
+            for col, (label, stem, build) in zip(st.columns(len(exports)), exports):
+                with col:
+                    st.download_button(
+                        label=f"📥 {label}",
+                        data=build,
+                        file_name=f"{stem}_{stamp}{ext}",
+                        mime=mime,
+                        use_container_width=True,
+                        key=f"columnar_{stem}",
+                    )
     
-    # Check duplicates with row locations
-    duplicate_mask = df.duplicated(keep=False)
-    issues['duplicates'] = df.duplicated().sum()
-    if issues['duplicates'] > 0:
-        duplicate_indices = df[duplicate_mask].index.tolist()
-        issues['duplicate_rows'] = duplicate_indices[:100]  # Limit to first 100
+    with st.expander("🧾 Data quality issue rows", expanded=False):
+        excluded = quality_issues['critical_issue_rows']
+        st.caption(f"Every affected Excel row, not just the first 50 in the report. "
+                   f"{excluded:,} rows have a missing, unparseable date or non-numeric rate in an analysis column "
+                   f"and were left out of the audit.")
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button(
+                label="📥 All issue rows (CSV)",
+                data=lambda: issue_rows_csv(quality_issues),
+                file_name=f"data_quality_rows_{stamp}.csv",
+                mime="text/csv",
+                use_container_width=True,
+                key="issue_rows_all",
+                help="One line per issue: issue type, column and Excel row",
+            )
+        with col2:
+            st.download_button(
+                label="📥 Rows excluded from audit (CSV)",
+                data=lambda: issue_rows_csv(quality_issues, critical_only=True),
+                file_name=f"excluded_rows_{stamp}.csv",
+                mime="text/csv",
+                use_container_width=True,
+                key="issue_rows_critical",
+                disabled=not excluded,
+            )
+
+@st.fragment
+def _render_sql_console(upload_df, fully_loaded):
+    """Ad-hoc SQL over the upload and the last analysis; running a query reruns only this tab."""
+    st.subheader("🧮 SQL Console")
+    if not sql_console.duckdb_available():
+        st.info("Install the 'duckdb' package to query the data with SQL (pip install duckdb).")
+        return
     
-    return issues
+    analysis = _session_frames().get('analysis') or {}
+    tables = {
+        'upload': upload_df,
+        'clean': analysis.get('df_clean'),
+        'variances': analysis.get('variance_df'),
+    }
+    st.caption(" · ".join(
+        f"`{name}` — {sql_console.TABLE_DESCRIPTIONS[name]} ({len(table):,} rows)"
+        for name, table in tables.items() if table is not None
+    ))
+    if not fully_loaded:
+        st.caption("⏳ `upload` holds only the sampled rows until Analyze loads the full data.")
+    
+    with st.form("sql_console_form", border=False):
+        sql = st.text_area("SQL", value=sql_console.EXAMPLE_QUERY, height=140, key="sql_query")
+        run = st.form_submit_button("▶️ Run query", type="primary")
+    if not run or not sql.strip():
+        return
+    
+    try:
+        result, truncated, seconds = sql_console.run_query(sql, tables)
+    except Exception as e:
+        st.error(f"❌ {e}")
+        return
+    if result is None:
+        st.success(f"✅ Done in {seconds * 1000:.0f} ms")
+        return
+    st.caption(
+        f"{len(result):,} rows in {seconds * 1000:.0f} ms"
+        + (f" — showing the first {sql_console.DEFAULT_MAX_ROWS:,}" if truncated else "")
+    )
+    st.dataframe(result, use_container_width=True, hide_index=True)
+    st.download_button(
+        "📥 Download result (CSV)",
+        data=result.to_csv(index=False).encode('utf-8'),
+        file_name=f"query_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+        mime="text/csv",
+        key="sql_result_download",
+    )
 
 def auto_detect_columns(df_columns):
     """Auto-detect column mappings based on common patterns."""
@@ -457,6 +663,30 @@ def auto_detect_columns(df_columns):
     
     return detected
 
+def auto_detect_master_columns(df_columns):
+    """Auto-detect price master column mappings based on common patterns."""
+    column_patterns = {
+        'customer_name': ['customer', 'party', 'sold to', 'client', 'buyer'],
+        'material_code': ['material code', 'mat code', 'sku', 'product code', 'item code', 'material'],
+        'valid_from': ['valid from', 'start date', 'effective from', 'from date', 'from'],
+        'valid_to': ['valid to', 'end date', 'effective to', 'to date', 'to', 'valid till'],
+        'contract_rate': ['contract rate', 'contract price', 'agreed price', 'rate', 'price']
+    }
+
+    # Match patterns against columns (best column per pattern) so that
+    # look-alike headers such as "Valid From" / "Valid To" don't collide
+    lowered = {str(col).lower(): col for col in df_columns}
+    detected = {}
+    for field, patterns in column_patterns.items():
+        candidates = [c for c in lowered if lowered[c] not in detected.values()]
+        for pattern in patterns:
+            matches = get_close_matches(pattern, candidates, n=1, cutoff=0.6)
+            if matches:
+                detected[field] = lowered[matches[0]]
+                break
+
+    return detected
+
 def save_mapping_to_session(column_mapping):
     """Save column mapping to session state."""
     st.session_state['saved_mapping'] = column_mapping
@@ -479,30 +709,98 @@ def main():
     st.sidebar.header("⚙️ Configuration")
     st.sidebar.markdown("Map your data columns to the required fields:")
     
-    # Initialize session state
-    if 'uploaded_file' not in st.session_state:
-        st.session_state.uploaded_file = None
-    if 'df' not in st.session_state:
-        st.session_state.df = None
+    # Large frames live in the shared, memory-budgeted cache rather than in session state
+    frames = _session_frames()
+    _frame_cache().spill_idle(SESSION_IDLE_MINUTES * 60)
+    if st.session_state.get('current_user') in OPERATORS:
+        _render_cache_panel()
     
     # File upload
-    uploaded_file = st.sidebar.file_uploader(
-        "Upload your data file",
-        type=['csv', 'xlsx', 'xls'],
-        help="Upload a CSV or Excel file with your sales data"
+    uploaded_files = st.sidebar.file_uploader(
+        "Upload your data file(s)",
+        type=['csv', 'xlsx', 'xls', 'gz', 'zst', 'zip'],
+        accept_multiple_files=True,
+        help="Upload one or more CSV or Excel files with your sales data; they are combined into one ledger. "
+             "Compressed CSVs (.csv.gz, .csv.zst, .zip) are decompressed while they are parsed"
+    )
+    uploaded_file = uploaded_files[0] if uploaded_files else None
+    progressive = st.sidebar.checkbox(
+        "⏩ Progressive loading (large CSV/XLSX files)",
+        value=False,
+        help="Map columns from the first rows, then load the file in chunks on Analyze while a live top-variance preview is shown"
     )
     
     if uploaded_file is not None:
         try:
             # Read file
             file_bytes = uploaded_file.getvalue()
-            df = _read_uploaded_file(uploaded_file.name, file_bytes)
+            fully_loaded = True
+            ingest_profile = None
+            sources = _select_sources(uploaded_files)
+            multi_source = len(sources) > 1 or sources[0][1] not in (None, _sheet_names(uploaded_file)[0])
+            if multi_source:
+                source_digest = hashlib.sha256(
+                    repr([(_upload_digest(f), sheet) for f, sheet in sources]).encode()
+                ).hexdigest()
+            else:
+                source_digest = _upload_digest(uploaded_file)
+            # Loaded frames and per-file state follow the content, so a re-upload under the same name is re-read
+            file_key = source_digest
+            if multi_source:
+                # Several files/sheets: map columns from a sample of each, parse them all on Analyze
+                df = None
+                if st.session_state.get('loaded_file_key') == file_key:
+                    df = frames.get('loaded_df')
+                if df is None:
+                    df = read_sources([(f.name, f.getvalue(), sheet) for f, sheet in sources], nrows=200)
+                    fully_loaded = False
+            elif progressive:
+                df = None
+                if st.session_state.get('loaded_file_key') == file_key:
+                    df = frames.get('loaded_df')
+                if df is None:
+                    # Header sample only; the full file is streamed on Analyze
+                    df = read_table(file_bytes, uploaded_file.name, nrows=1000)
+                    fully_loaded = False
+            else:
+                # A layout with a saved ingestion profile is parsed with its stored plan
+                if len(_ingestion_profiles()) and st.session_state.get('use_ingestion_profile', True):
+                    ingest_profile = _ingestion_profiles().match(_upload_header(uploaded_file))
+                read_profile = PipelineProfile()
+                with read_profile.stage('file parsing') as record:
+                    df = _read_uploaded_file(uploaded_file.name, file_bytes, source_digest,
+                                             ingest_profile, stats=record)
+                    record['rows_out'] = len(df)
+                # Keep the timing of the real parse, not of later cache hits
+                if st.session_state.get('read_stage_key') != file_key:
+                    st.session_state.read_stage = read_profile.stages[0]
+                    st.session_state.read_stage_key = file_key
             
-            st.session_state.df = df
-            st.session_state.uploaded_file = uploaded_file
+            if multi_source:
+                st.sidebar.success(f"✅ {len(uploaded_files)} file(s), {len(sources)} sheet(s) selected")
+            else:
+                st.sidebar.success(f"✅ File loaded: {uploaded_file.name}")
+            if fully_loaded:
+                st.sidebar.info(f"📝 Total records: {len(df)}")
+            elif multi_source:
+                st.sidebar.info(f"📝 Showing a sample of {len(df)} rows — all files and sheets load when you click Analyze")
+            else:
+                st.sidebar.info(f"📝 Showing first {len(df)} rows — the full file loads when you click Analyze")
             
-            st.sidebar.success(f"✅ File loaded: {uploaded_file.name}")
-            st.sidebar.info(f"📝 Total records: {len(df)}")
+            header = [col for col in df.columns if col not in SOURCE_COLUMNS]
+            if (ingest_profile is None and not fully_loaded and len(_ingestion_profiles())
+                    and st.session_state.get('use_ingestion_profile', True)):
+                # Sampled loads still take the mapping and date options of a known layout
+                ingest_profile = _ingestion_profiles().match(header)
+            if ingest_profile is not None:
+                if st.session_state.get('ingestion_profile_key') != file_key:
+                    # Pre-select the stored mapping once; later changes are the user's
+                    st.session_state['auto_detected'] = ingest_profile['mapping']
+                    st.session_state['ingestion_profile_key'] = file_key
+                projected = ""
+                if ingest_profile['usecols'] and len(ingest_profile['usecols']) < len(ingest_profile['columns']):
+                    projected = f", {len(ingest_profile['usecols'])} of {len(ingest_profile['columns'])} columns read"
+                st.sidebar.info(f"📇 Recognised layout **{ingest_profile['name']}** — saved mapping and date format applied{projected}")
             
             # Column mapping section (moved before Data Health Check)
             st.sidebar.markdown("---")
@@ -577,72 +875,84 @@ def main():
             # Data Health Check (now with critical columns)
             st.sidebar.markdown("---")
             with st.sidebar.expander("🏥 Data Health Check", expanded=False):
-                quality_issues = analyze_data_quality(df, critical_columns=critical_columns)
+                if not fully_loaded:
+                    st.info("⏳ The health check runs once the full file has been loaded by Analyze.")
+                else:
+                    quality_issues = _quality_issues(source_digest, df, critical_columns)
                 
-                # Critical columns missing values
-                if quality_issues.get('critical_missing'):
-                    st.error(f"🚨 **CRITICAL:** Missing values in {len(quality_issues['critical_missing'])} analysis columns")
+                    # Critical columns missing values
+                    if quality_issues.get('critical_missing'):
+                        st.error(f"🚨 **CRITICAL:** Missing values in {len(quality_issues['critical_missing'])} analysis columns")
                     
-                    for col, count in quality_issues['critical_missing'].items():
-                        details = quality_issues['missing_details'][col]
-                        with st.expander(f"🔴 {col}: {count} missing", expanded=True):
-                            # Convert row indices to Excel row numbers (add 2 for header)
-                            excel_rows = [idx + 2 for idx in details['rows'][:20]]
+                        for col, count in quality_issues['critical_missing'].items():
+                            details = quality_issues['missing_details'][col]
+                            with st.expander(f"🔴 {col}: {count} missing", expanded=True):
+                                # Convert row indices to Excel row numbers (add 2 for header)
+                                excel_rows = [idx + 2 for idx in details['rows'][:20]]
                             
-                            st.markdown(f"**⚠️ This column is required for analysis!**")
-                            st.markdown(f"**Missing in Excel rows:**")
-                            # Display in groups of 10 for readability
-                            row_groups = [excel_rows[i:i+10] for i in range(0, len(excel_rows), 10)]
-                            for group in row_groups:
-                                st.code(", ".join(map(str, group)))
+                                st.markdown(f"**⚠️ This column is required for analysis!**")
+                                st.markdown(f"**Missing in Excel rows:**")
+                                # Display in groups of 10 for readability
+                                row_groups = [excel_rows[i:i+10] for i in range(0, len(excel_rows), 10)]
+                                for group in row_groups:
+                                    st.code(", ".join(map(str, group)))
                             
-                            if details['sample_preview']:
-                                st.info(f"📌 Showing first 20 of {count} missing rows")
+                                if details['sample_preview']:
+                                    st.info(f"📌 Showing first 20 of {count} missing rows")
                             
-                            # Quick fix suggestions
-                            st.markdown("**💡 Quick Fixes:**")
-                            st.markdown(f"- Filter: `df[df['{col}'].notna()]`")
-                            st.markdown(f"- Fill: `df['{col}'].fillna('N/A')`")
-                            st.warning("⚠️ Rows with missing values in this column will be excluded from analysis")
+                                # Quick fix suggestions
+                                st.markdown("**💡 Quick Fixes:**")
+                                st.markdown(f"- Filter: `df[df['{col}'].notna()]`")
+                                st.markdown(f"- Fill: `df['{col}'].fillna('N/A')`")
+                                st.warning("⚠️ Rows with missing values in this column will be excluded from analysis")
                 
-                # Other missing values
-                if quality_issues.get('other_missing'):
-                    with st.expander(f"ℹ️ Missing values in {len(quality_issues['other_missing'])} other columns", expanded=False):
-                        st.info("These columns are not used in analysis but may be important for your records.")
+                    # Other missing values
+                    if quality_issues.get('other_missing'):
+                        with st.expander(f"ℹ️ Missing values in {len(quality_issues['other_missing'])} other columns", expanded=False):
+                            st.info("These columns are not used in analysis but may be important for your records.")
                         
-                        # Show top 5 other columns
-                        sorted_other = sorted(quality_issues['other_missing'].items(), 
-                                            key=lambda x: x[1], reverse=True)
+                            # Show top 5 other columns
+                            sorted_other = sorted(quality_issues['other_missing'].items(), 
+                                                key=lambda x: x[1], reverse=True)
                         
-                        for col, count in sorted_other[:5]:
-                            details = quality_issues['missing_details'][col]
-                            st.markdown(f"- **{col}**: {count} missing")
+                            for col, count in sorted_other[:5]:
+                                details = quality_issues['missing_details'][col]
+                                st.markdown(f"- **{col}**: {count} missing")
                         
-                        if len(quality_issues['other_missing']) > 5:
-                            st.markdown(f"... and **{len(quality_issues['other_missing']) - 5} more columns**")
+                            if len(quality_issues['other_missing']) > 5:
+                                st.markdown(f"... and **{len(quality_issues['other_missing']) - 5} more columns**")
                 
-                # Success message if no critical issues
-                if not quality_issues.get('critical_missing'):
-                    st.success("✅ All critical analysis columns are complete!")
+                    # Success message if no critical issues
+                    if not quality_issues.get('critical_missing'):
+                        st.success("✅ All critical analysis columns are complete!")
+                    else:
+                        st.download_button(
+                            label=f"📥 All {quality_issues['critical_issue_rows']:,} incomplete rows (CSV)",
+                            data=lambda: issue_rows_csv(quality_issues, critical_only=True),
+                            file_name="incomplete_rows.csv",
+                            mime="text/csv",
+                            use_container_width=True,
+                            key="health_incomplete_rows",
+                        )
                 
-                # Duplicates
-                if quality_issues['duplicates'] > 0:
-                    with st.expander(f"⚠️ {quality_issues['duplicates']} duplicate rows found", expanded=False):
-                        excel_rows = [idx + 2 for idx in quality_issues['duplicate_rows'][:20]]
-                        st.markdown("**Duplicate rows (Excel row numbers):**")
-                        row_groups = [excel_rows[i:i+10] for i in range(0, len(excel_rows), 10)]
-                        for group in row_groups:
-                            st.code(", ".join(map(str, group)))
+                    # Duplicates
+                    if quality_issues['duplicates'] > 0:
+                        with st.expander(f"⚠️ {quality_issues['duplicates']} duplicate rows found", expanded=False):
+                            excel_rows = [idx + 2 for idx in quality_issues['duplicate_rows'][:20]]
+                            st.markdown("**Duplicate rows (Excel row numbers):**")
+                            row_groups = [excel_rows[i:i+10] for i in range(0, len(excel_rows), 10)]
+                            for group in row_groups:
+                                st.code(", ".join(map(str, group)))
                         
-                        if len(quality_issues['duplicate_rows']) > 20:
-                            st.info(f"📌 Showing first 20 of {quality_issues['duplicates']} duplicates")
+                            if len(quality_issues['duplicate_rows']) > 20:
+                                st.info(f"📌 Showing first 20 of {quality_issues['duplicates']} duplicates")
                         
-                        st.markdown("**💡 Quick Fix:**")
-                        st.code("df.drop_duplicates(inplace=True)")
-                else:
-                    st.success("✅ No duplicate rows")
+                            st.markdown("**💡 Quick Fix:**")
+                            st.code("df.drop_duplicates(inplace=True)")
+                    else:
+                        st.success("✅ No duplicate rows")
                 
-                st.info("💡 Detailed quality report included in Excel download")
+                    st.info("💡 Detailed quality report included in Excel download")
             
             # Save current mapping
             save_mapping_to_session(column_mapping)
@@ -651,10 +961,51 @@ def main():
             st.sidebar.markdown("---")
             with st.sidebar.expander("🗓️ Date parsing options", expanded=False):
                 date_format = st.text_input(
-                    "Custom date format (optional)", value="",
+                    "Custom date format (optional)",
+                    value=(ingest_profile or {}).get('date_format') or "",
                     help="Example: %d/%m/%Y or %Y-%m-%d. Leave empty to auto-detect."
                 )
-                dayfirst = st.checkbox("Day comes first (DD/MM/YYYY)", value=False)
+                dayfirst = st.checkbox("Day comes first (DD/MM/YYYY)",
+                                       value=bool((ingest_profile or {}).get('dayfirst')))
+
+            # Ingestion profile: remember this layout's mapping and read plan
+            with st.sidebar.expander("📇 Ingestion profile", expanded=False):
+                st.checkbox(
+                    "Read recognised layouts with their profile", value=True, key="use_ingestion_profile",
+                    help="A file whose header matches a saved profile is read with the stored mapping, date format, "
+                         "column types and columns, skipping detection and inference"
+                )
+                if ingest_profile is not None:
+                    st.caption(f"Matched **{ingest_profile['name']}**, saved {ingest_profile['saved_at'].replace('T', ' ')}")
+                    if st.button("🗑️ Forget this profile", use_container_width=True, key="forget_ingestion_profile"):
+                        _ingestion_profiles().forget(ingest_profile['fingerprint'])
+                        st.session_state['ingestion_profile_key'] = None
+                        st.rerun()
+                else:
+                    profile_name = st.text_input("Profile name", value=uploaded_file.name.split('.')[0],
+                                                 key="ingestion_profile_name")
+                    profile_project = st.checkbox(
+                        "Read only the mapped columns next time", value=True, key="ingestion_profile_project",
+                        help="Unmapped columns are skipped by the parser; they won't appear in Raw Data or the health check"
+                    )
+                    if st.button("💾 Save profile for this layout", use_container_width=True,
+                                 key="save_ingestion_profile", disabled=multi_source):
+                        saved = build_profile(
+                            profile_name.strip() or uploaded_file.name, df[header], column_mapping,
+                            date_format=date_format.strip() or None, dayfirst=dayfirst, project=profile_project,
+                            extra_columns=st.session_state.get('extra_group_keys') or (),
+                        )
+                        _ingestion_profiles().save(saved)
+                        st.success(f"Saved — date format {saved['date_format'] or 'inferred per file'}. "
+                                   "Files with this header will be read with it.")
+                    if multi_source:
+                        st.caption("Profiles are saved from a single file.")
+
+            with st.sidebar.expander("🔢 Rate precision", expanded=False):
+                rate_precision = st.number_input(
+                    "Decimal places compared", min_value=0, max_value=6, value=RATE_PRECISION, step=1,
+                    help="Rates are compared as exact whole units at this precision (2 = paise). Differences smaller than this are ignored."
+                )
 
             # Analysis mode selection
             st.sidebar.markdown("---")
@@ -662,48 +1013,111 @@ def main():
                 "Choose Analysis Mode",
                 options=(
                     "Within Customer (same customer + material + date)",
-                    "Across Customers (same material + date, different customers)"
+                    "Across Customers (same material + date, different customers)",
+                    "Contract Price Check (billed rate vs. price master)",
+                    "Price Drift (vs. price history of earlier uploads)"
                 ),
                 index=0,
-                help="Pick whether to check price inconsistencies within the same customer, or across different customers on the same date."
+                help="Pick whether to check price inconsistencies within the same customer, across different customers on the same date, against agreed contract prices, or against the customer's own rates in earlier uploads."
             )
 
-            # Threshold and filters
-            st.sidebar.markdown("---")
-            with st.sidebar.expander("🎯 Filters & Quick Actions", expanded=True):
-                # Initialize default values from session state or use defaults
-                default_min_diff = st.session_state.get('quick_filter_diff', 0.0)
-                default_min_var = st.session_state.get('quick_filter_var', 0.0)
-                
-                col1, col2 = st.columns(2)
-                with col1:
-                    min_diff = st.number_input("Min Difference (₹)", min_value=0.0, value=default_min_diff, step=0.5, key="min_diff_filter")
-                with col2:
-                    min_var = st.number_input("Min Variance %", min_value=0.0, value=default_min_var, step=0.5, key="min_var_filter")
-                
-                # Quick filter presets
-                st.markdown("**Quick Filters:**")
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    if st.button("🔥 High", help="Difference >₹100", use_container_width=True):
-                        st.session_state['quick_filter_diff'] = 100.0
-                        st.rerun()
-                with col2:
-                    if st.button("⚡ Medium", help="Difference >₹50", use_container_width=True):
-                        st.session_state['quick_filter_diff'] = 50.0
-                        st.rerun()
-                with col3:
-                    if st.button("🔄 Reset", help="Clear all filters", use_container_width=True):
-                        st.session_state['quick_filter_diff'] = 0.0
-                        st.session_state['quick_filter_var'] = 0.0
-                        st.rerun()
+            # Extra grouping keys: split the within/across groups further, e.g. by plant or sales org
+            group_keys = {'within': None, 'across': None}
+            if analysis_mode.startswith(("Within", "Across")):
+                with st.sidebar.expander("🧩 Grouping keys", expanded=bool(st.session_state.get('extra_group_keys'))):
+                    key_options = [col for col in df.columns if col not in column_mapping.values()]
+                    if 'extra_group_keys' in st.session_state:
+                        # Keep only columns the current file still has
+                        st.session_state['extra_group_keys'] = [
+                            col for col in st.session_state['extra_group_keys'] if col in key_options
+                        ]
+                    extra_keys = st.multiselect(
+                        "Extra grouping keys", options=key_options, key="extra_group_keys",
+                        help="Rates are compared only within rows that also share these columns, "
+                             "each shown as a result column"
+                    )
+                    if extra_keys:
+                        group_keys = {'within': [*WITHIN_KEYS, *extra_keys], 'across': [*ACROSS_KEYS, *extra_keys]}
+                        st.caption("Groups: " + " + ".join(
+                            [column_mapping[f] for f in (WITHIN_KEYS if analysis_mode.startswith("Within") else ACROSS_KEYS)]
+                            + extra_keys
+                        ))
+
+            # Price history: earlier uploads' daily price levels, for the drift check
+            drift_options = None
+            with st.sidebar.expander("📚 Price History", expanded=analysis_mode.startswith("Price Drift")):
+                history_summary = _price_history().summary()
+                if history_summary['uploads']:
+                    st.caption(
+                        f"{history_summary['uploads']} uploads, {history_summary['lines']:,} lines, "
+                        f"{history_summary['first_date']} to {history_summary['last_date']}"
+                    )
+                else:
+                    st.caption("Empty — add uploads to compare future ones against them.")
+                st.checkbox(
+                    "Add this upload to the price history", value=False, key="history_ingest",
+                    help="After Analyze, the cleaned lines are stored as daily price levels per customer and material. "
+                         "An upload is only added once."
+                )
+                if analysis_mode.startswith("Price Drift"):
+                    drift_options = {
+                        'min_change_pct': st.number_input(
+                            "Min change %", min_value=0.0, value=0.0, step=0.5,
+                            help="Ignore rate moves smaller than this"
+                        ),
+                        'max_age_days': st.number_input(
+                            "Compare with history up to (days back)", min_value=0, value=0, step=30,
+                            help="Only compare against price levels at most this many days older; 0 = any age"
+                        ) or None,
+                    }
+
+            # Price master upload (contract price check only)
+            price_master = None
+            master_mapping = None
+            if analysis_mode.startswith("Contract"):
+                with st.sidebar.expander("📑 Price Master", expanded=True):
+                    master_file = st.file_uploader(
+                        "Upload contract price master",
+                        type=['csv', 'xlsx', 'xls'],
+                        key="price_master_file",
+                        help="One row per customer + material with contract rate and validity dates"
+                    )
+                    if master_file is not None:
+                        price_master = _read_uploaded_file(master_file.name, master_file.getvalue(), _upload_digest(master_file))
+                        master_columns = list(price_master.columns)
+                        master_detected = auto_detect_master_columns(master_columns)
+                        st.caption(f"📝 {len(price_master)} contract rows")
+
+                        def _master_select(label, field):
+                            default = master_detected.get(field)
+                            return st.selectbox(
+                                label,
+                                options=master_columns,
+                                index=master_columns.index(default) if default in master_columns else 0,
+                                key=f"master_{field}"
+                            )
+
+                        master_mapping = {
+                            'customer_name': _master_select("Customer Column", 'customer_name'),
+                            'material_code': _master_select("Material Code Column", 'material_code'),
+                            'valid_from': _master_select("Valid From Column", 'valid_from'),
+                            'valid_to': _master_select("Valid To Column", 'valid_to'),
+                            'contract_rate': _master_select("Contract Rate Column", 'contract_rate'),
+                        }
+
+                    quantity_col = st.selectbox(
+                        "Quantity Column (optional)",
+                        options=["(none)"] + columns,
+                        help="Used to compute the rupee impact per sales line (rate gap × quantity)"
+                    )
+                    if quantity_col != "(none)":
+                        column_mapping['quantity'] = quantity_col
 
             clear = st.sidebar.button("🧹 Clear uploaded data", type="secondary", key="clear_data_btn")
             if clear:
-                st.session_state.uploaded_file = None
-                st.session_state.df = None
-                st.session_state.variance_df = None
-                st.session_state.df_clean = None
+                frames.clear()
+                st.session_state.loaded_file_key = None
+                st.session_state.preview_result = None
                 st.session_state.analysis_mode = None
                 st.session_state.auto_detected = None
                 st.rerun()
@@ -712,12 +1126,138 @@ def main():
             
             analyze_button = st.sidebar.button("🔍 Analyze Data", type="primary", use_container_width=True, key="analyze_btn")
             
+            with st.sidebar.expander("⚡ Quick Preview", expanded=False):
+                preview_pct = st.select_slider(
+                    "Sample size (% of key groups)", options=[1, 2, 5, 10, 20], value=5,
+                    help="Whole customer + material + date groups are sampled, so variances inside a group stay intact"
+                )
+                preview_button = st.button(
+                    "⚡ Estimate from sample", use_container_width=True, key="preview_btn",
+                    disabled=not fully_loaded,
+                    help="Estimate variance cases and total difference in a few seconds before running the full audit"
+                )
+            
+            # "Run Full Audit" from a preview triggers the regular analysis
+            if st.session_state.pop('promote_full_run', False):
+                analyze_button = True
+            
             # Main content area
-            tab1, tab2, tab3, tab4 = st.tabs(["📊 Analysis Results", "📈 Visualizations", "📉 Trends", "📄 Raw Data"])
+            tab1, tab2, tab3, tab4, tab5 = st.tabs(
+                ["📊 Analysis Results", "📈 Visualizations", "📉 Trends", "📄 Raw Data", "🧮 SQL Console"]
+            )
             
             with tab1:
+                # Sample-based estimate
+                if preview_button:
+                    preview_mode = (
+                        'within' if analysis_mode.startswith("Within")
+                        else 'contract' if analysis_mode.startswith("Contract")
+                        else 'drift' if analysis_mode.startswith("Price Drift")
+                        else 'across'
+                    )
+                    if preview_mode == 'drift':
+                        st.info("ℹ️ The drift check looks up each pair in the price history and is fast enough to run in full.")
+                    elif preview_mode == 'contract' and price_master is None:
+                        st.error("❌ Upload a contract price master in the sidebar to run the contract price check.")
+                    else:
+                        with st.spinner("Estimating from a sample..."):
+                            st.session_state.preview_result = preview_audit(
+                                df,
+                                column_mapping,
+                                preview_mode,
+                                fraction=preview_pct / 100,
+                                keys=group_keys.get(preview_mode),
+                                price_master=price_master,
+                                master_mapping=master_mapping,
+                                date_format=date_format.strip() or None,
+                                dayfirst=dayfirst,
+                                rate_precision=int(rate_precision),
+                            )
+                
+                if analyze_button:
+                    st.session_state.preview_result = None
+                
+                preview_result = st.session_state.get('preview_result')
+                if preview_result is not None:
+                    st.subheader("⚡ Quick Preview (estimated)")
+                    st.caption(
+                        f"Based on {preview_result['sample_rows']:,} of {preview_result['total_rows']:,} rows "
+                        f"({preview_result['fraction']:.0%} of key groups). Ranges are 95% confidence intervals."
+                    )
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        lo, hi = preview_result['cases_ci']
+                        st.metric("Expected Variance Cases", f"{preview_result['est_cases']:,.0f}",
+                                  help=f"95% CI: {lo:,.0f} – {hi:,.0f}")
+                        st.caption(f"{lo:,.0f} – {hi:,.0f}")
+                    with col2:
+                        lo, hi = preview_result['total_difference_ci']
+                        st.metric("Expected Total Difference", f"₹{preview_result['est_total_difference']:,.2f}",
+                                  help=f"95% CI: ₹{lo:,.2f} – ₹{hi:,.2f}")
+                        st.caption(f"₹{lo:,.2f} – ₹{hi:,.2f}")
+                    with col3:
+                        st.metric("Cases in Sample", preview_result['sample_cases'])
+                    if st.button("🚀 Run Full Audit", type="primary", key="promote_btn"):
+                        st.session_state['promote_full_run'] = True
+                        st.rerun()
+                    st.markdown("---")
+                
                 # Run analysis on button click
                 if analyze_button:
+                    if not fully_loaded and multi_source:
+                        read_profile = PipelineProfile()
+                        with st.spinner(f"Loading {len(sources)} files/sheets in parallel..."):
+                            with read_profile.stage('file parsing') as record:
+                                df = read_sources(
+                                    [(f.name, f.getvalue(), sheet) for f, sheet in sources],
+                                    usecols=list(dict.fromkeys([*column_mapping.values(),
+                                                                *(st.session_state.get('extra_group_keys') or ())])),
+                                )
+                                record['rows_out'] = len(df)
+                        frames['loaded_df'] = df
+                        st.session_state.loaded_file_key = file_key
+                        st.session_state.read_stage = read_profile.stages[0]
+                        st.session_state.read_stage_key = file_key
+                    elif not fully_loaded:
+                        # Stream the file in chunks, previewing the largest cases as they appear
+                        loaded_chunks = []
+                        preview_slot = st.empty()
+                        
+                        def _loading_chunks():
+                            # Compressed CSVs are decompressed and workbooks parsed as each chunk is pulled
+                            for chunk in iter_table_chunks(file_bytes, uploaded_file.name,
+                                                           chunk_rows=PROGRESSIVE_CHUNK_ROWS):
+                                loaded_chunks.append(chunk)
+                                yield chunk
+                        
+                        if analysis_mode.startswith(("Contract", "Price Drift")):
+                            for _ in _loading_chunks():
+                                pass
+                        else:
+                            preview_mode = 'within' if analysis_mode.startswith("Within") else 'across'
+                            for snapshot in stream_top_variances(
+                                _loading_chunks(),
+                                column_mapping,
+                                preview_mode,
+                                keys=group_keys[preview_mode],
+                                date_format=date_format.strip() or None,
+                                dayfirst=dayfirst,
+                                rate_precision=int(rate_precision),
+                            ):
+                                with preview_slot.container():
+                                    st.info(
+                                        f"⏳ Loading… {snapshot['rows_processed']:,} rows processed, "
+                                        f"{snapshot['cases_found']:,} variance cases so far (preview — final results follow)"
+                                    )
+                                    if not snapshot['top'].empty:
+                                        st.dataframe(snapshot['top'], use_container_width=True, height=300)
+                        
+                        df = pd.concat(loaded_chunks)
+                        del loaded_chunks
+                        frames['loaded_df'] = df
+                        st.session_state.loaded_file_key = file_key
+                        preview_slot.empty()
+                    
                     # Progress feedback
                     progress_bar = st.progress(0)
                     status_text = st.empty()
@@ -730,21 +1270,96 @@ def main():
                     progress_bar.progress(66)
                     
                     if analysis_mode.startswith("Within"):
-                        variance_df, df_clean = audit_material_price_variance(
-                            df,
-                            column_mapping,
-                            date_format=date_format.strip() or None,
-                            dayfirst=dayfirst,
-                        )
-                        st.session_state.analysis_mode = 'within'
+                        mode = 'within'
+                    elif analysis_mode.startswith("Contract"):
+                        mode = 'contract'
+                    elif analysis_mode.startswith("Price Drift"):
+                        mode = 'drift'
                     else:
-                        variance_df, df_clean = audit_cross_customer_variance(
-                            df,
-                            column_mapping,
-                            date_format=date_format.strip() or None,
-                            dayfirst=dayfirst,
-                        )
-                        st.session_state.analysis_mode = 'across'
+                        mode = 'across'
+                    if mode == 'contract' and price_master is None:
+                        progress_bar.empty()
+                        status_text.empty()
+                        st.error("❌ Upload a contract price master in the sidebar to run the contract price check.")
+                        st.stop()
+                    
+                    profile = PipelineProfile(trace_memory=st.session_state.get('perf_trace_memory', False))
+                    profile.context = {
+                        'file': ', '.join(dict.fromkeys(f.name for f, _ in sources)) if multi_source else uploaded_file.name,
+                        'file_mb': round(len(file_bytes) / 1024 ** 2, 2),
+                        'rows': len(df),
+                        'columns': len(df.columns),
+                    }
+                    if st.session_state.get('read_stage_key') == file_key:
+                        profile.stages.append(dict(st.session_state.read_stage))
+                    
+                    engine_options = dict(
+                        date_format=date_format.strip() or None,
+                        dayfirst=dayfirst,
+                        return_index=True,
+                        rate_precision=int(rate_precision),
+                        profile=profile,
+                    )
+                    
+                    def _run_analysis():
+                        if mode == 'within':
+                            variance_df, df_clean, case_rows = audit_material_price_variance(
+                                df, column_mapping, keys=group_keys['within'], **engine_options
+                            )
+                        elif mode == 'contract':
+                            variance_df, df_clean, case_rows = audit_contract_price(
+                                df, column_mapping, price_master, master_mapping, **engine_options
+                            )
+                        elif mode == 'drift':
+                            variance_df, df_clean, case_rows = audit_price_drift(
+                                df, column_mapping, _price_history(), **engine_options, **drift_options
+                            )
+                        else:
+                            variance_df, df_clean, case_rows = audit_cross_customer_variance(
+                                df, column_mapping, keys=group_keys['across'], **engine_options
+                            )
+                        with profile.stage('quality check', len(df)):
+                            quality_issues = _quality_issues(
+                                source_digest, df, critical_columns, column_mapping,
+                                engine_options['date_format'], dayfirst,
+                            )
+                        if variance_df is not None and variance_df.empty:
+                            variance_df = None
+                        return {
+                            'variance_df': variance_df,
+                            'df_clean': df_clean,
+                            'case_rows': case_rows if variance_df is not None else None,
+                            'quality_issues': quality_issues,
+                            'stages': profile.to_records(),
+                        }
+                    
+                    # Identical analyses share one computation and one read-only result across sessions
+                    result_key = _result_key(
+                        source_digest, mode, column_mapping,
+                        date_format=engine_options['date_format'],
+                        dayfirst=dayfirst,
+                        rate_precision=engine_options['rate_precision'],
+                        critical_columns=critical_columns,
+                        keys=group_keys.get(mode),
+                        master_digest=_upload_digest(master_file) if mode == 'contract' else None,
+                        master_mapping=master_mapping if mode == 'contract' else None,
+                        # The history changes as uploads are added
+                        drift_options={**drift_options, 'history': _price_history().version()} if mode == 'drift' else None,
+                    )
+                    analysis, computed = _frame_cache().get_or_compute(result_key, _run_analysis, spillable=True)
+                    if not computed:
+                        profile.stages = [dict(record) for record in analysis['stages']]
+                        profile.context['shared_result'] = True
+                    frames.link('analysis', result_key)
+                    st.session_state.analysis_mode = mode
+                    
+                    if st.session_state.get('history_ingest'):
+                        with profile.stage('history ingest', len(analysis['df_clean'])):
+                            added = _price_history().ingest(analysis['df_clean'], profile.context['file'], source_digest)
+                        if added:
+                            st.toast(f"📚 Added {added:,} daily price levels to the price history")
+                        else:
+                            st.toast("📚 This upload is already in the price history")
                     
                     status_text.text("🔄 Step 3/3: Finalizing results...")
                     progress_bar.progress(100)
@@ -754,21 +1369,15 @@ def main():
                     progress_bar.empty()
                     status_text.empty()
                     
-                    if variance_df is not None and not variance_df.empty:
-                        # Store ORIGINAL unfiltered results in session state
-                        st.session_state.variance_df = variance_df
-                        st.session_state.df_clean = df_clean
-                        st.session_state.quality_issues = analyze_data_quality(df, critical_columns=critical_columns)
-                        st.success("✅ Analysis complete!")
-                    else:
-                        st.session_state.variance_df = None
-                        st.session_state.df_clean = df_clean
-                        st.session_state.quality_issues = analyze_data_quality(df, critical_columns=critical_columns)
+                    st.session_state.perf_profile = profile
+                    if analysis['variance_df'] is not None:
+                        st.success("✅ Analysis complete!" if computed else "✅ Analysis complete (shared result of an identical analysis)")
                 
                 # Display results (works on first run AND all subsequent reruns with filters)
-                if 'variance_df' in st.session_state and st.session_state.variance_df is not None:
-                    variance_df = st.session_state.variance_df
-                    df_clean = st.session_state.df_clean
+                analysis = frames.get('analysis')
+                variance_df = analysis['variance_df'] if analysis else None
+                if variance_df is not None:
+                    df_clean = analysis['df_clean']
                     
                     # Summary metrics
                     st.subheader("📈 Summary Statistics")
@@ -801,127 +1410,116 @@ def main():
                             len(df_clean),
                             help="Number of valid records after cleaning"
                         )
-                    
-                    st.markdown("---")
-                    
-                    # Variance table with filters
-                    st.subheader("🔍 Price Variance Details")
-                    
-                    # Apply optional filters
-                    filtered_df = variance_df.copy()
-                    # Parse Date to datetime for range filters
-                    try:
-                        filtered_df['__DateDT'] = pd.to_datetime(filtered_df['Date'], errors='coerce')
-                    except Exception:
-                        filtered_df['__DateDT'] = pd.NaT
 
-                    # Filters in collapsible section for cleaner UI
-                    with st.expander("🎚️ Advanced Filters", expanded=False):
-                        col1, col2 = st.columns(2)
-                        
+                    if st.session_state.get('analysis_mode') == 'contract' and 'Billing Status' in variance_df.columns:
+                        under = variance_df[variance_df['Billing Status'] == 'Under-billed']
+                        over = variance_df[variance_df['Billing Status'] == 'Over-billed']
+                        # Without a quantity column only per-unit gaps are known
+                        has_impact = 'Rupee Impact' in variance_df.columns
+                        impact_col = 'Rupee Impact' if has_impact else 'Rate Gap'
+                        col1, col2, col3, col4 = st.columns(4)
                         with col1:
-                            # Date range filter control
-                            if filtered_df['__DateDT'].notna().any():
-                                min_d = pd.to_datetime(filtered_df['__DateDT'].min()).date()
-                                max_d = pd.to_datetime(filtered_df['__DateDT'].max()).date()
-                                d1, d2 = st.date_input(
-                                    "Filter by date range",
-                                    value=(min_d, max_d),
-                                    min_value=min_d,
-                                    max_value=max_d,
-                                )
-                                if d1 and d2:
-                                    mask = (filtered_df['__DateDT'] >= pd.to_datetime(d1)) & (filtered_df['__DateDT'] <= pd.to_datetime(d2))
-                                    filtered_df = filtered_df[mask]
-                        
+                            st.metric("Under-billed Lines", len(under))
                         with col2:
-                            # Material filter
-                            mats = sorted(variance_df['Material Code'].dropna().unique().tolist()) if 'Material Code' in variance_df.columns else []
-                            if mats:
-                                sel_mats = st.multiselect("Filter by material(s)", options=mats, default=[], key="material_filter")
-                                if sel_mats:
-                                    filtered_df = filtered_df[filtered_df['Material Code'].isin(sel_mats)]
-
-                    # Threshold filters (from sidebar)
-                    if min_diff > 0:
-                        filtered_df = filtered_df[filtered_df['Difference'] >= float(min_diff)]
-                    if min_var > 0:
-                        filtered_df = filtered_df[filtered_df['Variance %'] >= float(min_var)]
+                            st.metric(
+                                "Under-billing Impact" if has_impact else "Under-billing Rate Gap (per unit)",
+                                f"₹{under[impact_col].sum():,.2f}",
+                                help="Revenue lost versus contract rates (negative = billed below contract)" if has_impact
+                                     else "Sum of per-unit gaps; map a quantity column to get the rupee impact"
+                            )
+                        with col3:
+                            st.metric("Over-billed Lines", len(over))
+                        with col4:
+                            st.metric(
+                                "Over-billing Impact" if has_impact else "Over-billing Rate Gap (per unit)",
+                                f"₹{over[impact_col].sum():,.2f}",
+                                help="Amount billed above contract rates" if has_impact
+                                     else "Sum of per-unit gaps; map a quantity column to get the rupee impact"
+                            )
 
-                    # Clean helper column for display
-                    if '__DateDT' in filtered_df.columns:
-                        filtered_df = filtered_df.drop(columns=['__DateDT'])
+                    if st.session_state.get('analysis_mode') == 'drift' and 'Drift' in variance_df.columns:
+                        increases = variance_df[variance_df['Drift'] == 'Increase']
+                        decreases = variance_df[variance_df['Drift'] == 'Decrease']
+                        col1, col2, col3, col4 = st.columns(4)
+                        with col1:
+                            st.metric("Rate Increases", len(increases))
+                        with col2:
+                            st.metric("Avg Increase", f"{increases['Variance %'].mean() if len(increases) else 0:.2f}%")
+                        with col3:
+                            st.metric("Rate Decreases", len(decreases))
+                        with col4:
+                            st.metric("Avg Decrease", f"{decreases['Variance %'].mean() if len(decreases) else 0:.2f}%")
 
-                    # Show filtered results count
-                    if len(filtered_df) < len(variance_df):
-                        st.info(f"📊 Showing **{len(filtered_df)}** of **{len(variance_df)}** variance cases (filters applied)")
-                    else:
-                        st.info(f"📊 Showing all **{len(filtered_df)}** variance cases")
-                    
-                    st.dataframe(filtered_df, use_container_width=True, height=400)
-                    
-                    # Download section
                     st.markdown("---")
-                    st.subheader("💾 Download Results")
                     
-                    # Prepare metadata for download
-                    metadata = {
-                        'Analysis Date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                        'Analyzed By': st.session_state.get('current_user', 'Unknown'),
-                        'Analysis Mode': st.session_state.get('analysis_mode', 'unknown'),
-                        'Total Records': len(df),
-                        'Valid Records': len(df_clean),
-                        'Variance Cases Found': len(variance_df),
-                        'Filtered Results': len(filtered_df),
-                        'Min Difference Filter': f"₹{min_diff}" if min_diff > 0 else "None",
-                        'Min Variance Filter': f"{min_var}%" if min_var > 0 else "None",
-                    }
-                    
-                    quality_issues = st.session_state.get('quality_issues', {})
-                    
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        # Enhanced Excel download with metadata
-                        excel_file = create_excel_download(filtered_df, metadata=metadata, quality_issues=quality_issues)
-                        filter_suffix = f"_min{int(min_diff)}" if min_diff > 0 else ""
-                        st.download_button(
-                            label="📥 Download Excel Report (Multi-sheet)",
-                            data=excel_file,
-                            file_name=f"price_variance{filter_suffix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                            use_container_width=True,
-                            help="Includes: Variances + Metadata + Data Quality Report"
-                        )
-                    
-                    with col2:
-                        # CSV download
-                        csv = filtered_df.to_csv(index=False).encode('utf-8')
-                        st.download_button(
-                            label="📥 Download CSV Report",
-                            data=csv,
-                            file_name=f"price_variance{filter_suffix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                            mime="text/csv",
-                            use_container_width=True
-                        )
+                    _render_variance_details(len(df))
                 
-                elif 'variance_df' in st.session_state and st.session_state.variance_df is None:
+                elif analysis is not None:
                     st.success("✅ No price variances detected!")
-                    st.info("All materials have consistent basic rates for the same customer on the same date.")
+                    if st.session_state.get('analysis_mode') == 'contract':
+                        st.info("All sales lines covered by a valid contract were billed at the contract rate.")
+                    elif st.session_state.get('analysis_mode') == 'drift':
+                        st.info("No customer's rate moved from its level in the price history (or the history has no earlier prices for these customers and materials).")
+                    else:
+                        st.info("All materials have consistent basic rates for the same customer on the same date.")
+                
+                elif 'analysis' in frames:
+                    st.warning("⌛ The results of this analysis are no longer cached. Click 'Analyze Data' to run it again.")
                 
                 else:
                     st.info("👈 Configure column mappings in the sidebar and click 'Analyze Data' to start.")
+                
+                # Stage timings of the last analysis
+                perf_profile = st.session_state.get('perf_profile')
+                if perf_profile is not None:
+                    with st.expander("⏱️ Performance", expanded=False):
+                        perf_df = pd.DataFrame(perf_profile.to_records())
+                        perf_df = perf_df.rename(columns={
+                            'stage': 'Stage', 'seconds': 'Seconds', 'rows_in': 'Rows In', 'rows_out': 'Rows Out',
+                            'peak_mb': 'Peak Memory (MB)', 'rss_mb': 'Process RSS (MB)',
+                            'reader': 'Reader', 'rows_per_sec': 'Rows/s'
+                        })
+                        st.caption(
+                            f"Total {perf_profile.total_seconds():.2f}s · "
+                            + " · ".join(f"{k}: {v}" for k, v in perf_profile.context.items())
+                        )
+                        st.dataframe(perf_df, use_container_width=True, hide_index=True)
+                        st.checkbox(
+                            "Track peak memory per stage on the next analysis (tracemalloc, slower)",
+                            key="perf_trace_memory"
+                        )
             
             with tab2:
-                if 'variance_df' in st.session_state and st.session_state.variance_df is not None:
-                    variance_df = st.session_state.variance_df
+                variance_df = (frames.get('analysis') or {}).get('variance_df')
+                if variance_df is not None:
                     mode = st.session_state.get('analysis_mode', 'within')
                     
                     st.subheader("📊 Visual Insights")
                     
                     # Top 10 variances chart (adapt by mode)
                     st.markdown("#### Top 10 Price Variances")
-                    if mode == 'within' and 'Customer' in variance_df.columns:
+                    if mode == 'contract':
+                        fig1 = px.bar(
+                            variance_df.head(10),
+                            x='Customer',
+                            y='Difference',
+                            color='Billing Status',
+                            hover_data=['Material Code', 'Date', 'Billed Rate', 'Contract Rate',
+                                        'Rupee Impact' if 'Rupee Impact' in variance_df.columns else 'Rate Gap'],
+                            title="Top 10 Deviations from Contract Rate",
+                            labels={'Difference': 'Rate Gap (₹)'}
+                        )
+                    elif mode == 'drift':
+                        fig1 = px.bar(
+                            variance_df.head(10),
+                            x='Customer',
+                            y='Difference',
+                            color='Drift',
+                            hover_data=['Material Code', 'Date', 'Previous Date', 'Previous Rate', 'Current Rate'],
+                            title="Top 10 Rate Moves since the Price History",
+                            labels={'Difference': 'Rate Change (₹)'}
+                        )
+                    elif mode == 'within' and 'Customer' in variance_df.columns:
                         fig1 = px.bar(
                             variance_df.head(10),
                             x='Customer',
@@ -970,7 +1568,7 @@ def main():
                         st.plotly_chart(fig3, use_container_width=True)
                     
                     # Customer-wise or Material-wise variance count depending on mode
-                    if mode == 'within' and 'Customer' in variance_df.columns:
+                    if mode in ('within', 'contract', 'drift') and 'Customer' in variance_df.columns:
                         st.markdown("#### Top Customers by Variance Count")
                         customer_counts = variance_df['Customer'].value_counts().head(10)
                         fig4 = px.bar(
@@ -1008,8 +1606,8 @@ def main():
             
             with tab3:
                 # Trend Analysis Tab
-                if 'variance_df' in st.session_state and st.session_state.variance_df is not None:
-                    variance_df = st.session_state.variance_df
+                variance_df = (frames.get('analysis') or {}).get('variance_df')
+                if variance_df is not None:
                     
                     st.subheader("📉 Variance Trends Over Time")
                     
@@ -1128,6 +1726,9 @@ def main():
                 st.subheader("📄 Raw Data Preview")
                 st.dataframe(df.head(100), use_container_width=True)
                 st.info(f"Showing first 100 rows of {len(df)} total records.")
+            
+            with tab5:
+                _render_sql_console(df, fully_loaded)
         
         except Exception as e:
             st.error(f"❌ Error processing file: {str(e)}")
@@ -0,0 +1,1700 @@
+"""
+Core audit logic with no UI dependencies.
+
+Holds the variance engines, the contract price check, progressive and
+sampled previews, the file reader, the data quality analyzer and the Excel
+report writer. The Streamlit app, the command-line script, the HTTP service
+and the benchmarks all import from here.
+
+pandas and numpy are loaded lazily on first use (the Excel readers only
+when a workbook is read or written), so importing this module is
+cheap for CLI start-up, ``--help`` and worker processes that may not run
+an audit at all.
+"""
+
+import csv
+import gzip
+import heapq
+import importlib.util
+import multiprocessing
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack, contextmanager
+from io import BytesIO, StringIO
+
+from perf import stage
+
+
+def _lazy_import(name):
+    """Import a module on first attribute access instead of now."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+np = _lazy_import('numpy')
+pd = _lazy_import('pandas')
+
+# Decimal places kept when rates are held as integer units (2 = paise)
+RATE_PRECISION = 2
+
+def to_rate_units(rates, precision=RATE_PRECISION):
+    """Convert rupee rates to exact int64 units (paise at the default precision), rounding half-up.
+
+    Float noise is trimmed before rounding, so 1.005 and 1.0050000000000001
+    (neighbouring floats either side of the tie) both become 101 paise.
+    """
+    scaled = np.round(np.asarray(rates, dtype='float64') * 10 ** precision, 6)
+    return np.floor(scaled + 0.5).astype('int64')
+
+def from_rate_units(units, precision=RATE_PRECISION):
+    """Convert int64 rate units back to rupees for display and export."""
+    return np.asarray(units, dtype='int64') / 10 ** precision
+
+def _mean_units(units_sum, units_count):
+    """Mean of integer rate units per group, rounded half-up to whole units with integer arithmetic."""
+    units_sum = np.asarray(units_sum, dtype='int64')
+    units_count = np.asarray(units_count, dtype='int64')
+    return (2 * units_sum + units_count) // (2 * units_count)
+
+def _variance_pct(diff_units, base_units):
+    """Percentage difference of integer rate units, 0 where the base rate is zero."""
+    diff_units = np.asarray(diff_units)
+    base_units = np.asarray(base_units)
+    safe_base = np.where(base_units != 0, base_units, 1)
+    return np.where(base_units != 0, np.round(diff_units / safe_base * 100, 2), 0.0)
+
+def _rename_map(column_mapping):
+    """Actual column name -> audit column name for every mapped field."""
+    rename_map = {
+        column_mapping['material_description']: 'MATERIAL DESCRIPTION',
+        column_mapping['date_column']: 'SO CREATED ON',
+        column_mapping['material_code']: 'MATERIAL CODE',
+        column_mapping['customer_name']: 'SOLD TO PARTY NAME',
+        column_mapping['basic_rate']: 'BASIC RATE'
+    }
+    if column_mapping.get('quantity'):
+        rename_map[column_mapping['quantity']] = 'QUANTITY'
+    return rename_map
+
+# Grouping keys of the variance engines, in order, as mapping fields. Other
+# columns of the data (a plant, sales organisation, price list, ...) can be
+# added anywhere in the list.
+WITHIN_KEYS = ('customer_name', 'material_code', 'date_column')
+ACROSS_KEYS = ('material_code', 'date_column')
+
+# Audit column and result label of each key field
+KEY_FIELDS = {
+    'customer_name': ('SOLD TO PARTY NAME', 'Customer'),
+    'material_code': ('MATERIAL CODE', 'Material Code'),
+    'date_column': ('SO CREATED ON', 'Date'),
+}
+
+def resolve_group_keys(column_mapping, keys, required, df=None):
+    """Cleaned-frame columns and result labels of an ordered list of grouping keys.
+
+    Args:
+        column_mapping: Dictionary mapping required columns to actual column names
+        keys: Mapping fields from KEY_FIELDS and/or other input columns, in
+            grouping order (None for required)
+        required: Key fields the engine needs, e.g. WITHIN_KEYS
+        df: Input frame the key columns are checked against
+    """
+    keys = list(required if keys is None else keys)
+    missing = [field for field in required if field not in keys]
+    if missing:
+        raise ValueError(f"Grouping keys must include {', '.join(missing)}")
+    if df is not None:
+        absent = [column for column in key_source_columns(column_mapping, keys) if column not in df.columns]
+        if absent:
+            raise ValueError(f"Grouping key column(s) not in the data: {', '.join(map(str, absent))}")
+    rename_map = _rename_map(column_mapping)
+    columns, labels = [], []
+    for key in keys:
+        if key in KEY_FIELDS:
+            column, label = KEY_FIELDS[key]
+        else:
+            column, label = rename_map.get(key, key), str(key)
+        if column in columns:
+            raise ValueError(f"Grouping key {key!r} is given twice")
+        columns.append(column)
+        labels.append(label)
+    return columns, labels
+
+def key_source_columns(column_mapping, keys):
+    """Input column names of grouping keys (mapping fields resolved), e.g. for sampling key groups."""
+    return [column_mapping[key] if key in KEY_FIELDS else key for key in keys]
+
+def compile_group_ids(columns):
+    """Compile several key columns into one dense int64 group id per row.
+
+    Each column is factorized with sorted uniques and the codes are packed by
+    mixed radix, id = (c0 * n1 + c1) * n2 + c2 ..., so group ids follow the
+    sorted order of the keys and grouping works on one integer array however
+    many key columns there are. When the next radix would overflow int64, the
+    partial ids are first renumbered densely.
+
+    Returns:
+        (ids, n_groups); ids is -1 for rows with a missing key value
+    """
+    limit = np.iinfo('int64').max
+    packed, radix, missing = None, 1, None
+    for column in columns:
+        codes, uniques = pd.factorize(column, sort=True)
+        codes = codes.astype('int64', copy=False)
+        size = max(len(uniques), 1)
+        if packed is None:
+            packed, radix, missing = codes, size, codes < 0
+            continue
+        missing |= codes < 0
+        if radix > limit // size:
+            packed = np.where(missing, -1, packed)
+            dense, uniques = pd.factorize(packed, sort=True)
+            packed, radix = dense.astype('int64', copy=False), len(uniques)
+        packed = packed * size + codes
+        radix *= size
+    if packed is None:
+        raise ValueError("compile_group_ids needs at least one key column")
+    ids = np.full(len(packed), -1, dtype='int64')
+    kept = ~missing
+    dense, uniques = pd.factorize(packed[kept], sort=True)
+    ids[kept] = dense
+    return ids, len(uniques)
+
+def group_spans(ids, n_groups):
+    """Rows ordered by group id (rows with id -1 left out) and each group's offsets into that order.
+
+    Group ``g`` owns ``order[offsets[g]:offsets[g + 1]]``, rows in their original order.
+    """
+    order = np.argsort(ids, kind='stable')
+    order = order[np.count_nonzero(ids < 0):]
+    offsets = np.zeros(n_groups + 1, dtype='int64')
+    np.cumsum(np.bincount(ids[order], minlength=n_groups), out=offsets[1:])
+    return order, offsets
+
+def _first_present(values, order, offsets):
+    """Each group's first non-missing value (NaN where it has none), like groupby().first()."""
+    present = values.notna().to_numpy()[order]
+    sorted_positions = np.flatnonzero(present)
+    groups = np.searchsorted(offsets, sorted_positions, side='right') - 1
+    first = np.r_[True, groups[1:] != groups[:-1]] if len(groups) else np.empty(0, dtype=bool)
+    out = np.full(len(offsets) - 1, np.nan, dtype=object)
+    out[groups[first]] = values.iloc[order[sorted_positions[first]]].to_numpy(dtype=object)
+    return out
+
+def _prepare_sales_frame(df, column_mapping, *, date_format=None, dayfirst=False, profile=None):
+    """Rename mapped columns to their audit names, coerce types and drop incomplete rows."""
+    rows = len(df)
+    with stage(profile, 'date & rate coercion', rows):
+        # Rename columns based on mapping
+        df_renamed = df.rename(columns=_rename_map(column_mapping))
+
+        # Ensure numeric for BASIC RATE
+        df_renamed['BASIC RATE'] = pd.to_numeric(df_renamed['BASIC RATE'], errors='coerce')
+        # Convert date column to datetime
+        if date_format:
+            df_renamed['SO CREATED ON'] = pd.to_datetime(df_renamed['SO CREATED ON'], format=date_format, errors='coerce')
+        else:
+            df_renamed['SO CREATED ON'] = pd.to_datetime(df_renamed['SO CREATED ON'], errors='coerce', dayfirst=dayfirst)
+
+    with stage(profile, 'cleaning', rows) as record:
+        # Remove rows with missing critical data
+        df_clean = df_renamed.dropna(subset=[
+            'MATERIAL CODE',
+            'SO CREATED ON',
+            'SOLD TO PARTY NAME',
+            'BASIC RATE'
+        ])
+        record['rows_out'] = len(df_clean)
+
+    return df_clean
+
+# Columns a cleaned row must have
+REQUIRED_AUDIT_COLUMNS = ['MATERIAL CODE', 'SO CREATED ON', 'SOLD TO PARTY NAME', 'BASIC RATE']
+
+class PandasBackend:
+    """Eager pandas implementation of the row-level audit steps (the reference)."""
+
+    name = 'pandas'
+
+    def prepare(self, df, column_mapping, *, date_format=None, dayfirst=False, profile=None):
+        """Cleaned frame: mapped columns renamed, rate and date coerced, incomplete rows dropped."""
+        return _prepare_sales_frame(df, column_mapping, date_format=date_format, dayfirst=dayfirst, profile=profile)
+
+    def rate_ranges(self, df, column_mapping, keys, *, date_format=None, dayfirst=False,
+                    rate_precision=RATE_PRECISION, with_rows=False, profile=None):
+        """Key groups of the cleaned frame whose rates differ.
+
+        keys are columns of the cleaned frame, in grouping order; rows with a
+        missing key value are left out of the groups.
+
+        Returns (df_clean, stats, descriptions, case_rows): stats has the
+        groups' min and max rate units, indexed by keys in sorted order;
+        descriptions holds each group's first material description (or
+        None without a description column); case_rows holds each group's
+        row positions in df_clean (see build_case_rows) when with_rows is set.
+        """
+        df_clean = self.prepare(df, column_mapping, date_format=date_format, dayfirst=dayfirst, profile=profile)
+
+        with stage(profile, 'grouping', len(df_clean)) as record:
+            # Rates compared as exact integer units (paise at the default precision)
+            units = to_rate_units(df_clean['BASIC RATE'], rate_precision)
+
+            # One integer id per key group, then min and max over the id-sorted rows
+            ids, n_groups = compile_group_ids([df_clean[k] for k in keys])
+            order, offsets = group_spans(ids, n_groups)
+            starts = offsets[:-1]
+            sorted_units = units[order]
+            if n_groups:
+                mins = np.minimum.reduceat(sorted_units, starts)
+                maxs = np.maximum.reduceat(sorted_units, starts)
+            else:
+                mins = maxs = np.empty(0, dtype='int64')
+
+            # A group has a variance when its rates are not all identical
+            varied = mins != maxs
+            first_rows = order[starts[varied]]
+            index = pd.MultiIndex.from_arrays(
+                [pd.Index(df_clean[k].iloc[first_rows], name=k) for k in keys]
+            )
+            stats = pd.DataFrame({'min': mins[varied], 'max': maxs[varied]}, index=index)
+            record['rows_out'] = len(stats)
+
+            descriptions = None
+            if 'MATERIAL DESCRIPTION' in df_clean.columns and not stats.empty:
+                descriptions = _first_present(df_clean['MATERIAL DESCRIPTION'], order, offsets)[varied]
+            case_rows = None
+            if with_rows:
+                # Rows of the varied groups are already contiguous in the sorted order
+                sizes = np.diff(offsets)[varied]
+                case_offsets = np.zeros(len(sizes) + 1, dtype='int64')
+                np.cumsum(sizes, out=case_offsets[1:])
+                case_rows = {
+                    'offsets': case_offsets,
+                    'positions': order[np.repeat(varied, np.diff(offsets))].astype('int64', copy=False),
+                }
+        return df_clean, stats, descriptions, case_rows
+
+class PolarsBackend(PandasBackend):
+    """Lazy Polars implementation: rename, cast, filter and aggregate run as one multi-threaded plan.
+
+    Results match the pandas backend exactly. Date inference without a
+    date format and non-numeric rate columns are coerced by pandas first,
+    so both backends parse them the same way. Inputs Polars can't take
+    (e.g. mixed-type object columns) fall back to pandas.
+    """
+
+    name = 'polars'
+
+    def _plan(self, df, column_mapping, *, date_format, dayfirst, keys=()):
+        """Lazy frame of the cleaned rows with '__row' (position in df) and '__pos' (position in df_clean).
+
+        keys adds grouping key columns beyond the mapped ones (by cleaned-frame name).
+        """
+        import polars as pl
+
+        rates = df[column_mapping['basic_rate']]
+        if not pd.api.types.is_numeric_dtype(rates):
+            rates = pd.to_numeric(rates, errors='coerce')
+        dates = df[column_mapping['date_column']]
+        parse_format = None
+        if not pd.api.types.is_datetime64_any_dtype(dates):
+            if date_format:
+                parse_format = date_format
+            else:
+                dates = pd.to_datetime(dates, errors='coerce', dayfirst=dayfirst)
+        inputs = {
+            'SOLD TO PARTY NAME': df[column_mapping['customer_name']],
+            'MATERIAL CODE': df[column_mapping['material_code']],
+            'SO CREATED ON': dates,
+            'BASIC RATE': rates,
+        }
+        if column_mapping.get('material_description') in df.columns:
+            inputs['MATERIAL DESCRIPTION'] = df[column_mapping['material_description']]
+        source_names = {audit: column for column, audit in _rename_map(column_mapping).items()}
+        for key in keys:
+            if key not in inputs:
+                inputs[key] = df[source_names.get(key, key)]
+        for key in ('SOLD TO PARTY NAME', 'MATERIAL CODE', *keys):
+            dtype = inputs[key].dtype
+            if isinstance(dtype, pd.CategoricalDtype) and not dtype.categories.is_monotonic_increasing:
+                # pandas orders these groups by category, not by value
+                raise TypeError(f"{key!r} has unsorted categories")
+        # Arrow-backed columns are handed over without copying
+        frame = pl.from_pandas(pd.DataFrame(inputs))
+
+        lazy = frame.lazy().with_row_index('__row')
+        if parse_format:
+            lazy = lazy.with_columns(
+                pl.col('SO CREATED ON').cast(pl.String).str.strptime(pl.Datetime('us'), parse_format, strict=False)
+            )
+        # NaN rates (and NaN float keys) count as missing, as in pandas
+        lazy = lazy.with_columns(pl.col('BASIC RATE').cast(pl.Float64).fill_nan(None))
+        float_keys = [key for key in keys if key not in REQUIRED_AUDIT_COLUMNS
+                      and pd.api.types.is_float_dtype(inputs[key].dtype)]
+        if float_keys:
+            lazy = lazy.with_columns([pl.col(key).fill_nan(None) for key in float_keys])
+        return lazy.drop_nulls(REQUIRED_AUDIT_COLUMNS).with_row_index('__pos')
+
+    def _clean_frame(self, df, column_mapping, kept):
+        """df_clean from the plan's kept rows, built with one take from df."""
+        df_clean = df.iloc[kept['__row'].to_numpy()].rename(columns=_rename_map(column_mapping))
+        dates = kept['SO CREATED ON'].to_numpy()
+        if pd.api.types.is_datetime64_any_dtype(df_clean['SO CREATED ON']):
+            dates = dates.astype(df_clean['SO CREATED ON'].dtype)
+        df_clean['SO CREATED ON'] = dates
+        if not pd.api.types.is_numeric_dtype(df_clean['BASIC RATE']):
+            df_clean['BASIC RATE'] = kept['BASIC RATE'].to_numpy()
+        return df_clean
+
+    def prepare(self, df, column_mapping, *, date_format=None, dayfirst=False, profile=None):
+        try:
+            with stage(profile, 'polars plan', len(df)) as record:
+                lazy = self._plan(df, column_mapping, date_format=date_format, dayfirst=dayfirst)
+                kept = lazy.select('__row', 'SO CREATED ON', 'BASIC RATE').collect()
+                df_clean = self._clean_frame(df, column_mapping, kept)
+                record['rows_out'] = len(df_clean)
+        except (TypeError, ValueError, ArithmeticError) as e:
+            if not _polars_input_error(e):
+                raise
+            return super().prepare(df, column_mapping, date_format=date_format, dayfirst=dayfirst, profile=profile)
+        return df_clean
+
+    def rate_ranges(self, df, column_mapping, keys, *, date_format=None, dayfirst=False,
+                    rate_precision=RATE_PRECISION, with_rows=False, profile=None):
+        import polars as pl
+
+        try:
+            with stage(profile, 'polars plan', len(df)) as record:
+                lazy = self._plan(df, column_mapping, date_format=date_format, dayfirst=dayfirst, keys=keys)
+                # Same float arithmetic and half-to-even rounding as to_rate_units
+                units = (pl.col('BASIC RATE') * 10 ** rate_precision).round(0).cast(pl.Int64)
+                aggregations = [units.min().alias('min'), units.max().alias('max')]
+                has_descriptions = 'MATERIAL DESCRIPTION' in lazy.collect_schema().names()
+                if has_descriptions:
+                    aggregations.append(pl.col('MATERIAL DESCRIPTION').drop_nulls().first().alias('description'))
+                if with_rows:
+                    aggregations.append(pl.col('__pos').alias('rows'))
+                # Rows missing an extra key belong to no group, as with pandas
+                extra_keys = [key for key in keys if key not in REQUIRED_AUDIT_COLUMNS]
+                ranges = (
+                    lazy.drop_nulls(extra_keys).group_by(keys).agg(aggregations)
+                    .filter(pl.col('max') != pl.col('min'))
+                    .sort(keys)
+                )
+                kept, ranges = pl.collect_all([lazy.select('__row', 'SO CREATED ON', 'BASIC RATE'), ranges])
+                df_clean = self._clean_frame(df, column_mapping, kept)
+                record['rows_out'] = len(ranges)
+        except (TypeError, ValueError, ArithmeticError) as e:
+            if not _polars_input_error(e):
+                raise
+            return super().rate_ranges(df, column_mapping, keys, date_format=date_format, dayfirst=dayfirst,
+                                       rate_precision=rate_precision, with_rows=with_rows, profile=profile)
+
+        with stage(profile, 'grouping', len(df_clean)):
+            index = pd.MultiIndex.from_arrays(
+                [pd.Index(ranges[k].to_numpy(), name=k) for k in keys]
+            )
+            stats = pd.DataFrame(
+                {'min': ranges['min'].to_numpy(), 'max': ranges['max'].to_numpy()}, index=index
+            )
+            # Group keys keep the cleaned frame's dtypes (datetime resolution, categories)
+            stats.index = stats.index.set_levels(
+                [stats.index.levels[i].astype(df_clean[k].dtype) for i, k in enumerate(keys)]
+            )
+            descriptions = ranges['description'].to_numpy() if has_descriptions and len(ranges) else None
+            case_rows = None
+            if with_rows:
+                case_rows = build_case_rows([np.asarray(rows, dtype='int64') for rows in ranges['rows'].to_list()])
+        return df_clean, stats, descriptions, case_rows
+
+def _polars_input_error(error):
+    """True when Polars rejected the input data itself rather than failing in our code."""
+    try:
+        import polars as pl
+    except ImportError:
+        return False
+    return isinstance(error, (pl.exceptions.PolarsError, TypeError)) or 'arrow' in type(error).__module__.lower()
+
+BACKENDS = {'pandas': PandasBackend, 'polars': PolarsBackend}
+
+def get_backend(backend=None):
+    """Backend instance by name; defaults to the SALES_AUDIT_BACKEND setting, then pandas.
+
+    Asking for Polars when it is not installed raises ImportError.
+    """
+    if backend is None or isinstance(backend, str):
+        name = backend or os.environ.get('SALES_AUDIT_BACKEND', 'pandas')
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown backend {name!r}; use one of {', '.join(BACKENDS)}")
+        if name == 'polars' and importlib.util.find_spec('polars') is None:
+            raise ImportError("The polars backend needs the 'polars' package (pip install polars)")
+        return BACKENDS[name]()
+    return backend
+
+def _key_frame(index, labels):
+    """Result columns of grouping key values (dates as YYYY-MM-DD), one per index level."""
+    columns = {}
+    for level, label in enumerate(labels):
+        values = index.get_level_values(level)
+        columns[label] = values.strftime('%Y-%m-%d') if pd.api.types.is_datetime64_any_dtype(values) else values
+    return columns
+
+def audit_material_price_variance(df, column_mapping, *, keys=None, date_format=None, dayfirst=False,
+                                  return_index=False, rate_precision=RATE_PRECISION, profile=None, backend=None):
+    """
+    Audits material sales to identify when same customer bought same material 
+    on same date at different basic rates.
+    
+    Parameters:
+    df: Input DataFrame
+    column_mapping: Dictionary mapping required columns to actual column names
+    keys: Grouping keys in order (default WITHIN_KEYS); mapping fields and/or
+          other columns such as a plant, each becoming a result column
+    return_index: Also return a case-to-source-rows index (see build_case_rows)
+    rate_precision: Decimal places kept when comparing rates (2 = paise)
+    profile: Optional perf.PipelineProfile that records per-stage timings
+    backend: 'pandas', 'polars' or a backend instance (default: get_backend())
+    """
+    
+    # Group by customer, material code, and date (plus any extra key columns)
+    key_columns, key_labels = resolve_group_keys(column_mapping, keys, WITHIN_KEYS, df)
+    df_clean, stats, descriptions, case_rows = get_backend(backend).rate_ranges(
+        df, column_mapping, key_columns, date_format=date_format, dayfirst=dayfirst,
+        rate_precision=rate_precision, with_rows=return_index, profile=profile,
+    )
+
+    if stats.empty:
+        if return_index:
+            return None, df_clean, None
+        return None, df_clean
+    
+    with stage(profile, 'result building', len(stats)):
+        if descriptions is None:
+            descriptions = 'N/A'
+
+        min_units = stats['min'].to_numpy()
+        max_units = stats['max'].to_numpy()
+        diff_units = max_units - min_units
+
+        variance_df = pd.DataFrame({
+            **_key_frame(stats.index, key_labels),
+            'Material Description': descriptions,
+            'Max Rate': from_rate_units(max_units, rate_precision),
+            'Min Rate': from_rate_units(min_units, rate_precision),
+            'Difference': from_rate_units(diff_units, rate_precision),
+            'Variance %': _variance_pct(diff_units, min_units),
+        })
+
+        variance_df = variance_df.sort_values('Difference', ascending=False, kind='stable')
+
+    if return_index:
+        return variance_df, df_clean, case_rows
+    return variance_df, df_clean
+
+def empty_variance_frame(column_mapping, keys=None):
+    """Within-customer result with no cases: the columns and dtypes of a real one, for exports of clean ledgers."""
+    _, key_labels = resolve_group_keys(column_mapping, keys, WITHIN_KEYS)
+    return pd.DataFrame({
+        **{label: pd.Series(dtype=object) for label in key_labels},
+        'Material Description': pd.Series(dtype=object),
+        **{col: pd.Series(dtype='float64') for col in ('Max Rate', 'Min Rate', 'Difference', 'Variance %')},
+    })
+
+def audit_cross_customer_variance(df, column_mapping, *, keys=None, date_format=None, dayfirst=False,
+                                  return_index=False, rate_precision=RATE_PRECISION, profile=None, backend=None):
+    """
+    Audits sales to identify cases where on the same date the same material code
+    was sold to DIFFERENT customers at DIFFERENT prices.
+
+    Parameters:
+    df: Input DataFrame
+    column_mapping: Dictionary mapping required columns to actual column names
+    keys: Grouping keys in order (default ACROSS_KEYS); mapping fields and/or
+          other columns such as a plant, each becoming a result column.
+          Customers are compared within a group, so they can't be a key.
+    return_index: Also return a case-to-source-rows index (see build_case_rows)
+    rate_precision: Decimal places kept when comparing rates (2 = paise)
+    profile: Optional perf.PipelineProfile that records per-stage timings
+    backend: 'pandas', 'polars' or a backend instance (default: get_backend())
+             for cleaning only; the grouping here runs on numpy either way
+
+    With return_index, the index also holds 'rates': every customer's rate
+    in each case (see build_case_rates and get_case_rates).
+    """
+
+    key_columns, key_labels = resolve_group_keys(column_mapping, keys, ACROSS_KEYS, df)
+    if 'SOLD TO PARTY NAME' in key_columns:
+        raise ValueError("Customers are compared within each group, so the customer can't be a grouping key")
+    df_clean = get_backend(backend).prepare(df, column_mapping, date_format=date_format, dayfirst=dayfirst, profile=profile)
+
+    with stage(profile, 'grouping', len(df_clean)) as record:
+        # Aggregate to customer-level first (to avoid within-customer duplicates).
+        # Rates are exact integer units; a customer's average is rounded half-up
+        # to whole units with integer arithmetic so ties compare exactly.
+        units = to_rate_units(df_clean['BASIC RATE'], rate_precision)
+        key_ids, n_keys = compile_group_ids([df_clean[k] for k in key_columns])
+        customer_codes, customer_names = pd.factorize(df_clean['SOLD TO PARTY NAME'], sort=True)
+        # Customer-level entries are numbered by key group, then customer
+        valid = key_ids >= 0
+        entry_ids = np.full(len(key_ids), -1, dtype='int64')
+        dense, entry_keys = pd.factorize(key_ids[valid] * max(len(customer_names), 1) + customer_codes[valid], sort=True)
+        entry_ids[valid] = dense
+        n_entries = len(entry_keys)
+        entry_order, entry_offsets = group_spans(entry_ids, n_entries)
+        entry_first = entry_order[entry_offsets[:-1]]
+        units_count = np.diff(entry_offsets)
+        if n_entries:
+            units_sum = np.add.reduceat(units[entry_order], entry_offsets[:-1])
+        else:
+            units_sum = np.empty(0, dtype='int64')
+        customer_units = _mean_units(units_sum, units_count)
+        entry_key = key_ids[entry_first]
+        entry_customer = customer_codes[entry_first]
+
+        # For each key group (material + date by default), compare prices across customers;
+        # its entries are contiguous and ordered by customer
+        key_offsets = np.zeros(n_keys + 1, dtype='int64')
+        np.cumsum(np.bincount(entry_key, minlength=n_keys), out=key_offsets[1:])
+        if n_keys:
+            mins = np.minimum.reduceat(customer_units, key_offsets[:-1])
+            maxs = np.maximum.reduceat(customer_units, key_offsets[:-1])
+        else:
+            mins = maxs = np.empty(0, dtype='int64')
+        varied = mins != maxs
+        record['rows_out'] = int(varied.sum())
+
+    if not varied.any():
+        if return_index:
+            return None, df_clean, None
+        return None, df_clean
+
+    with stage(profile, 'result building', int(varied.sum())):
+        def _first_entry_where(mask):
+            # First entry (in customer order) of each key group where mask holds, like idxmin/idxmax
+            hits = np.flatnonzero(mask)
+            first = np.r_[True, entry_key[hits[1:]] != entry_key[hits[:-1]]]
+            out = np.empty(n_keys, dtype='int64')
+            out[entry_key[hits[first]]] = hits[first]
+            return out[varied]
+
+        entry_min = _first_entry_where(customer_units == mins[entry_key])
+        entry_max = _first_entry_where(customer_units == maxs[entry_key])
+        min_units = mins[varied]
+        max_units = maxs[varied]
+        diff_units = max_units - min_units
+        names = np.asarray(customer_names, dtype=object)
+
+        if 'MATERIAL DESCRIPTION' in df_clean.columns:
+            descriptions = _first_present(df_clean['MATERIAL DESCRIPTION'], entry_order, entry_offsets)[entry_min]
+        else:
+            descriptions = 'N/A'
+        first_rows = entry_order[entry_offsets[key_offsets[:-1][varied]]]
+        index = pd.MultiIndex.from_arrays(
+            [pd.Index(df_clean[k].iloc[first_rows], name=k) for k in key_columns]
+        )
+
+        out_df = pd.DataFrame({
+            **_key_frame(index, key_labels),
+            'Material Description': descriptions,
+            'Min Rate': from_rate_units(min_units, rate_precision),
+            'Min Customer': names[entry_customer[entry_min]],
+            'Max Rate': from_rate_units(max_units, rate_precision),
+            'Max Customer': names[entry_customer[entry_max]],
+            'Difference': from_rate_units(diff_units, rate_precision),
+            'Variance %': _variance_pct(diff_units, min_units),
+            'Unique Customers': np.diff(key_offsets)[varied],
+        })
+        case_rows = None
+        if return_index:
+            # Row positions in df_clean of every case, in their original order
+            key_order, key_row_offsets = group_spans(key_ids, n_keys)
+            case_offsets = np.zeros(len(min_units) + 1, dtype='int64')
+            np.cumsum(np.diff(key_row_offsets)[varied], out=case_offsets[1:])
+            case_rows = {
+                'offsets': case_offsets,
+                'positions': key_order[varied[key_ids[key_order]]].astype('int64', copy=False),
+            }
+            in_case = varied[entry_key]
+            # Every customer's rate in each case, from the same customer-level entries
+            case_rows['rates'] = build_case_rates(
+                (np.cumsum(varied) - 1)[entry_key[in_case]],
+                len(min_units),
+                entry_customer[in_case],
+                customer_names,
+                customer_units[in_case],
+                units_count[in_case],
+                rate_precision,
+            )
+
+        out_df = out_df.sort_values('Difference', ascending=False, kind='stable')
+
+    if return_index:
+        return out_df, df_clean, case_rows
+    return out_df, df_clean
+
+def audit_contract_price(df, column_mapping, price_master, master_mapping, *, date_format=None, dayfirst=False,
+                         return_index=False, rate_precision=RATE_PRECISION, profile=None, backend=None):
+    """
+    Audits billed rates against a contract price master to identify sales lines
+    billed below or above the price agreed for that customer and material on
+    the order date.
+
+    Contracts are matched with an as-of join: each sales line takes the latest
+    contract whose validity starts on or before the order date, provided the
+    order date is not past its validity end. Customer and material are encoded
+    as integer category codes so the join never does per-row lookups.
+
+    Parameters:
+    df: Input DataFrame
+    column_mapping: Dictionary mapping required columns to actual column names
+                    (an optional 'quantity' entry enables rupee impact per line;
+                    without it each line gets its signed per-unit 'Rate Gap')
+    price_master: DataFrame with contract prices per customer and material
+    master_mapping: Dictionary mapping price master fields to actual column names
+    return_index: Also return a case-to-source-rows index (see build_case_rows)
+    rate_precision: Decimal places kept when comparing rates (2 = paise)
+    profile: Optional perf.PipelineProfile that records per-stage timings
+    backend: 'pandas', 'polars' or a backend instance (default: get_backend())
+             for cleaning only; the grouping here runs on numpy either way
+    """
+
+    df_clean = get_backend(backend).prepare(df, column_mapping, date_format=date_format, dayfirst=dayfirst, profile=profile)
+
+    with stage(profile, 'price master preparation', len(price_master)) as record:
+        # Prepare the price master the same way
+        master = price_master.rename(columns={
+            master_mapping['customer_name']: 'SOLD TO PARTY NAME',
+            master_mapping['material_code']: 'MATERIAL CODE',
+            master_mapping['valid_from']: 'VALID FROM',
+            master_mapping['valid_to']: 'VALID TO',
+            master_mapping['contract_rate']: 'CONTRACT RATE'
+        })
+        master['CONTRACT RATE'] = pd.to_numeric(master['CONTRACT RATE'], errors='coerce')
+        for col in ('VALID FROM', 'VALID TO'):
+            if date_format:
+                master[col] = pd.to_datetime(master[col], format=date_format, errors='coerce')
+            else:
+                master[col] = pd.to_datetime(master[col], errors='coerce', dayfirst=dayfirst)
+        master = master.dropna(subset=['SOLD TO PARTY NAME', 'MATERIAL CODE', 'VALID FROM', 'CONTRACT RATE'])
+        record['rows_out'] = len(master)
+
+    if master.empty or df_clean.empty:
+        return (None, df_clean, None) if return_index else (None, df_clean)
+
+    with stage(profile, 'as-of join', len(df_clean)) as record:
+        # Encode (customer, material) as one integer key shared by both sides.
+        # Sales lines whose customer or material never appears in the master
+        # cannot have a contract and are left out of the join entirely.
+        def _category_codes(values, categories):
+            # Factorize first so string normalisation only touches distinct values
+            codes, uniques = pd.factorize(values)
+            return categories.get_indexer(pd.Index(uniques).astype(str).str.strip()).astype('int64')[codes]
+
+        customers = pd.Index(master['SOLD TO PARTY NAME'].astype(str).str.strip().unique())
+        materials = pd.Index(master['MATERIAL CODE'].astype(str).str.strip().unique())
+        n_materials = len(materials)
+
+        master_key = (
+            _category_codes(master['SOLD TO PARTY NAME'], customers) * n_materials
+            + _category_codes(master['MATERIAL CODE'], materials)
+        )
+        sales_cust = _category_codes(df_clean['SOLD TO PARTY NAME'], customers)
+        sales_mat = _category_codes(df_clean['MATERIAL CODE'], materials)
+        known = (sales_cust >= 0) & (sales_mat >= 0)
+
+        left = pd.DataFrame({
+            '__POS': np.flatnonzero(known),
+            '__KEY': sales_cust[known] * n_materials + sales_mat[known],
+            'SO CREATED ON': df_clean['SO CREATED ON'].to_numpy()[known],
+        }).sort_values('SO CREATED ON', kind='stable')
+        right = pd.DataFrame({
+            '__KEY': master_key,
+            'VALID FROM': master['VALID FROM'].to_numpy(),
+            'VALID TO': master['VALID TO'].to_numpy(),
+            'CONTRACT RATE': master['CONTRACT RATE'].to_numpy(),
+        }).sort_values('VALID FROM', kind='stable')
+
+        joined = pd.merge_asof(
+            left, right,
+            left_on='SO CREATED ON', right_on='VALID FROM',
+            by='__KEY', direction='backward'
+        )
+
+        # Keep lines covered by a contract that is still valid on the order date
+        in_force = joined['CONTRACT RATE'].notna() & (
+            joined['VALID TO'].isna() | (joined['SO CREATED ON'] <= joined['VALID TO'])
+        )
+        joined = joined[in_force]
+
+        # Compare in exact integer rate units
+        billed = to_rate_units(df_clean['BASIC RATE'].to_numpy()[joined['__POS'].to_numpy()], rate_precision)
+        contract = to_rate_units(joined['CONTRACT RATE'].to_numpy(), rate_precision)
+        gap = billed - contract
+        mismatch = gap != 0
+        record['rows_out'] = int(mismatch.sum())
+
+    if not mismatch.any():
+        return (None, df_clean, None) if return_index else (None, df_clean)
+
+    with stage(profile, 'result building', int(mismatch.sum())):
+        # Largest deviations first
+        order = np.flatnonzero(mismatch)
+        order = order[np.argsort(-np.abs(gap[order]), kind='stable')]
+        pos = joined['__POS'].to_numpy()[order]
+        lines = df_clean.iloc[pos]
+        billed, contract, gap = billed[order], contract[order], gap[order]
+
+        # Format each distinct date once rather than once per line
+        date_codes, date_uniques = pd.factorize(lines['SO CREATED ON'])
+
+        out_df = pd.DataFrame({
+            'Customer': lines['SOLD TO PARTY NAME'].to_numpy(),
+            'Material Code': lines['MATERIAL CODE'].to_numpy(),
+            'Date': np.asarray(date_uniques.strftime('%Y-%m-%d'), dtype=object)[date_codes],
+            'Material Description': lines['MATERIAL DESCRIPTION'].to_numpy() if 'MATERIAL DESCRIPTION' in lines.columns else 'N/A',
+            'Billed Rate': from_rate_units(billed, rate_precision),
+            'Contract Rate': from_rate_units(contract, rate_precision),
+            'Difference': from_rate_units(np.abs(gap), rate_precision),
+            'Variance %': _variance_pct(np.abs(gap), contract),
+            'Billing Status': np.where(gap < 0, 'Under-billed', 'Over-billed'),
+        })
+        if 'QUANTITY' in lines.columns:
+            quantity = pd.to_numeric(lines['QUANTITY'], errors='coerce').to_numpy()
+            out_df['Quantity'] = quantity
+            out_df['Rupee Impact'] = np.round(from_rate_units(gap, rate_precision) * quantity, 2)
+        else:
+            # Per unit only; a distinct name so it's never summed as a rupee total
+            out_df['Rate Gap'] = from_rate_units(gap, rate_precision)
+        # Excel row = index + 2 because of header
+        out_df['Excel Row'] = lines.index.to_numpy() + 2
+
+    if return_index:
+        # One source line per case
+        case_rows = {'offsets': np.arange(len(pos) + 1, dtype='int64'), 'positions': pos.astype('int64')}
+        return out_df, df_clean, case_rows
+    return out_df, df_clean
+
+def audit_price_drift(df, column_mapping, history, *, date_format=None, dayfirst=False, return_index=False,
+                      rate_precision=RATE_PRECISION, min_change_pct=0.0, max_age_days=None, profile=None, backend=None):
+    """
+    Audits each customer's current rate for a material against the price
+    level recorded for that customer and material in earlier uploads.
+
+    The current level of a (customer, material) pair is its mean rate on the
+    latest date in this upload; the previous level is the mean rate on the
+    latest date in the price history before the pair's first date in this
+    upload, found by an index lookup in the store. Pairs whose level moved are
+    drift cases.
+
+    Parameters:
+    df: Input DataFrame
+    column_mapping: Dictionary mapping required columns to actual column names
+    history: price_history.PriceHistory holding earlier uploads
+    return_index: Also return a case-to-source-rows index (see build_case_rows)
+    rate_precision: Decimal places kept when comparing rates (2 = paise)
+    min_change_pct: Ignore moves smaller than this percentage
+    max_age_days: Only compare against history at most this many days older
+    profile: Optional perf.PipelineProfile that records per-stage timings
+    backend: 'pandas', 'polars' or a backend instance (default: get_backend())
+             for cleaning only; the grouping here runs on numpy either way
+    """
+    from price_history import epoch_days, sales_keys
+
+    df_clean = get_backend(backend).prepare(df, column_mapping, date_format=date_format, dayfirst=dayfirst, profile=profile)
+    if df_clean.empty:
+        return (None, df_clean, None) if return_index else (None, df_clean)
+
+    with stage(profile, 'current price levels', len(df_clean)) as record:
+        customers, materials = sales_keys(df_clean)
+        work = pd.DataFrame({
+            'customer': customers,
+            'material': materials,
+            'day': epoch_days(df_clean['SO CREATED ON']),
+            'units': to_rate_units(df_clean['BASIC RATE'], rate_precision),
+        })
+        pairs = work.groupby(['customer', 'material'], sort=False)['day']
+        # Lines on each pair's latest day in this upload set its current level
+        latest = work[work['day'] == pairs.transform('max')]
+        current = latest.groupby(['customer', 'material'], sort=False).agg(
+            day=('day', 'first'), units_sum=('units', 'sum'), units_count=('units', 'size')
+        )
+        current['first_day'] = pairs.min().reindex(current.index)
+        record['rows_out'] = len(current)
+
+    with stage(profile, 'history lookup', len(current)) as record:
+        keys = current.index
+        since_days = None if max_age_days is None else current['first_day'].to_numpy() - int(max_age_days)
+        baseline = history.baselines(
+            keys.get_level_values(0), keys.get_level_values(1), current['first_day'].to_numpy(), since_days
+        ).set_index(['customer', 'material'])
+        record['rows_out'] = len(baseline)
+
+    compared = current.join(baseline, how='inner', rsuffix='_prev')
+    # Rounded like the cross-customer engine's customer averages, so both modes agree to the unit
+    current_units = _mean_units(compared['units_sum'].to_numpy(), compared['units_count'].to_numpy())
+    previous_units = to_rate_units(compared['rate'].to_numpy(), rate_precision)
+    gap = current_units - previous_units
+    change_pct = _variance_pct(np.abs(gap), previous_units)
+    drifted = (gap != 0) & (change_pct >= min_change_pct)
+    if not drifted.any():
+        return (None, df_clean, None) if return_index else (None, df_clean)
+
+    with stage(profile, 'result building', int(drifted.sum())):
+        compared = compared[drifted]
+        gap, change_pct = gap[drifted], change_pct[drifted]
+        current_units, previous_units = current_units[drifted], previous_units[drifted]
+
+        def _iso(days):
+            return np.asarray(days, dtype='int64').astype('datetime64[D]').astype(str).astype(object)
+
+        descriptions = 'N/A'
+        if 'MATERIAL DESCRIPTION' in df_clean.columns:
+            latest_desc = df_clean['MATERIAL DESCRIPTION'].iloc[latest.index.to_numpy()]
+            descriptions = (
+                latest_desc.groupby([latest['customer'].to_numpy(), latest['material'].to_numpy()], sort=False)
+                .first().reindex(compared.index).to_numpy()
+            )
+
+        out_df = pd.DataFrame({
+            'Customer': compared.index.get_level_values(0),
+            'Material Code': compared.index.get_level_values(1),
+            'Date': _iso(compared['day']),
+            'Material Description': descriptions,
+            'Previous Date': _iso(compared['day_prev']),
+            'Previous Rate': from_rate_units(previous_units, rate_precision),
+            'Current Rate': from_rate_units(current_units, rate_precision),
+            'Difference': from_rate_units(np.abs(gap), rate_precision),
+            'Variance %': change_pct,
+            'Drift': np.where(gap > 0, 'Increase', 'Decrease'),
+            'Days Since Previous': (compared['day'] - compared['day_prev']).to_numpy(),
+        })
+        case_rows = None
+        if return_index:
+            # The lines on the latest day behind each current level
+            groups = latest.groupby(['customer', 'material'], sort=False).indices
+            case_rows = build_case_rows([latest.index.to_numpy()[groups[key]] for key in compared.index])
+
+        out_df = out_df.sort_values('Difference', ascending=False, kind='stable')
+
+    if return_index:
+        return out_df, df_clean, case_rows
+    return out_df, df_clean
+
+# Rows per chunk when a CSV is loaded progressively
+PROGRESSIVE_CHUNK_ROWS = 200_000
+
+def stream_top_variances(chunks, column_mapping, mode='within', *, k=50, keys=None, date_format=None,
+                         dayfirst=False, rate_precision=RATE_PRECISION):
+    """Yield a bounded top-K preview of variance cases as chunks are audited.
+
+    Each chunk is run through the regular engine and its cases are merged
+    into at most ``k`` tracked cases by key, so memory stays at one chunk
+    plus ``k`` rows however large the file is. A group split across chunks
+    only shows up once one chunk holds differing rates, so the preview is a
+    lower bound that the full audit replaces.
+
+    Args:
+        chunks: Iterable of DataFrames in file order
+        column_mapping: Dictionary mapping required columns to actual column names
+        mode: 'within' or 'across'
+        k: Number of largest cases to keep
+        keys: Grouping keys passed to the engine (default: the mode's own)
+
+    Yields:
+        Dict with 'top' (DataFrame), 'rows_processed' and 'cases_found'
+    """
+    if mode == 'within':
+        audit = audit_material_price_variance
+        _, key_cols = resolve_group_keys(column_mapping, keys, WITHIN_KEYS)
+    else:
+        audit = audit_cross_customer_variance
+        _, key_cols = resolve_group_keys(column_mapping, keys, ACROSS_KEYS)
+
+    top = {}
+    rows_processed = 0
+    cases_found = 0
+
+    for chunk in chunks:
+        rows_processed += len(chunk)
+        variance_df, _ = audit(chunk, column_mapping, keys=keys, date_format=date_format, dayfirst=dayfirst,
+                               rate_precision=rate_precision)
+        if variance_df is not None:
+            cases_found += len(variance_df)
+            case_keys = list(variance_df[key_cols].itertuples(index=False, name=None))
+            # Only cases already tracked or among this chunk's top k can make the cut
+            candidates = set(range(min(k, len(case_keys))))
+            candidates.update(i for i, key in enumerate(case_keys) if key in top)
+            records = variance_df.to_dict('records')
+            for i in candidates:
+                key, case = case_keys[i], records[i]
+                if key in top:
+                    case = _merge_variance_cases(top[key], case, rate_precision)
+                top[key] = case
+            if len(top) > k:
+                kept = heapq.nlargest(k, top.items(), key=lambda item: item[1]['Difference'])
+                top = dict(kept)
+
+        top_df = pd.DataFrame(list(top.values()))
+        if not top_df.empty:
+            top_df = top_df.sort_values('Difference', ascending=False, kind='stable').reset_index(drop=True)
+        yield {'top': top_df, 'rows_processed': rows_processed, 'cases_found': cases_found}
+
+def _merge_variance_cases(seen, new, rate_precision=RATE_PRECISION):
+    """Combine two partial results for the same case key."""
+    merged = dict(seen)
+    if new['Min Rate'] < seen['Min Rate']:
+        merged['Min Rate'] = new['Min Rate']
+        if 'Min Customer' in new:
+            merged['Min Customer'] = new['Min Customer']
+    if new['Max Rate'] > seen['Max Rate']:
+        merged['Max Rate'] = new['Max Rate']
+        if 'Max Customer' in new:
+            merged['Max Customer'] = new['Max Customer']
+    min_units, max_units = to_rate_units([merged['Min Rate'], merged['Max Rate']], rate_precision)
+    merged['Difference'] = float(from_rate_units(max_units - min_units, rate_precision))
+    merged['Variance %'] = float(_variance_pct(max_units - min_units, min_units))
+    return merged
+
+def sample_key_groups(df, key_columns, fraction, *, salt='sales-audit-prev'):
+    """Return the rows whose key group falls in a deterministic hash sample.
+
+    Rows are kept or dropped by a hash of their key values, so every row of a
+    sampled (customer, material, date) group is kept together and group-level
+    variances survive sampling intact.
+
+    Args:
+        df: DataFrame to sample
+        key_columns: Columns forming the group key
+        fraction: Share of key groups to keep (0-1]
+        salt: 16-character hash key; change it to draw a different sample
+    """
+    hashes = pd.util.hash_pandas_object(df[key_columns], index=False, hash_key=salt).to_numpy()
+    buckets = hashes % np.uint64(1_000_000)
+    return df[buckets < np.uint64(round(fraction * 1_000_000))]
+
+def preview_audit(df, column_mapping, mode='within', *, fraction=0.05, keys=None, price_master=None,
+                  master_mapping=None, date_format=None, dayfirst=False, rate_precision=RATE_PRECISION, z=1.96):
+    """Estimate variance cases and total rupee difference from a key-group sample.
+
+    Runs the regular engine on a hash sample of complete key groups and scales
+    the results up with Horvitz-Thompson estimators. Each group is sampled
+    independently with probability ``fraction``, so the variance of an
+    estimated total is ``(1 - f) / f**2 * sum(y**2)`` over the sampled cases.
+    keys sets the within/across grouping keys, and so the sampled groups.
+
+    Returns:
+        Dict with the sample size, the sampled variance frame, and estimates
+        with ``z``-sigma confidence intervals for case count and total difference
+    """
+    if mode == 'contract':
+        key_fields = ['customer_name', 'material_code']
+    elif keys is not None:
+        key_fields = keys
+    else:
+        key_fields = WITHIN_KEYS if mode == 'within' else ACROSS_KEYS
+    sample = sample_key_groups(df, key_source_columns(column_mapping, key_fields), fraction)
+
+    if mode == 'within':
+        variance_df, _ = audit_material_price_variance(sample, column_mapping, keys=keys, date_format=date_format,
+                                                       dayfirst=dayfirst, rate_precision=rate_precision)
+    elif mode == 'across':
+        variance_df, _ = audit_cross_customer_variance(sample, column_mapping, keys=keys, date_format=date_format,
+                                                       dayfirst=dayfirst, rate_precision=rate_precision)
+    else:
+        variance_df, _ = audit_contract_price(sample, column_mapping, price_master, master_mapping,
+                                              date_format=date_format, dayfirst=dayfirst,
+                                              rate_precision=rate_precision)
+
+    differences = variance_df['Difference'].to_numpy() if variance_df is not None else np.empty(0)
+    scale = (1 - fraction) / fraction ** 2
+
+    est_cases = len(differences) / fraction
+    cases_margin = z * np.sqrt(scale * len(differences))
+    est_total = float(differences.sum()) / fraction
+    total_margin = z * float(np.sqrt(scale * np.square(differences).sum()))
+
+    return {
+        'fraction': fraction,
+        'sample_rows': len(sample),
+        'total_rows': len(df),
+        'sample_cases': len(differences),
+        'variance_df': variance_df,
+        'est_cases': est_cases,
+        'cases_ci': (max(est_cases - cases_margin, float(len(differences))), float(est_cases + cases_margin)),
+        'est_total_difference': est_total,
+        'total_difference_ci': (max(est_total - total_margin, float(differences.sum())), est_total + total_margin),
+    }
+
+def build_case_rows(case_groups):
+    """Pack per-case source row positions into one offset-indexed array.
+
+    Case ``i`` (the index label of the variance row built from the ``i``-th
+    group) owns ``positions[offsets[i]:offsets[i + 1]]``, which are positional
+    rows of ``df_clean``. Looking a case up is a slice, so drill-down costs
+    O(group size) instead of a scan of the cleaned data.
+    """
+    sizes = np.fromiter((len(g) for g in case_groups), dtype='int64', count=len(case_groups))
+    offsets = np.zeros(len(case_groups) + 1, dtype='int64')
+    np.cumsum(sizes, out=offsets[1:])
+    positions = np.concatenate(case_groups).astype('int64') if case_groups else np.empty(0, dtype='int64')
+    return {'offsets': offsets, 'positions': positions}
+
+def build_case_rates(case_ids, n_cases, customer_codes, customer_names, rate_units, lines,
+                     rate_precision=RATE_PRECISION):
+    """Pack every customer's rate per cross-customer case into offset-indexed arrays.
+
+    Like build_case_rows, case ``i`` owns entries ``offsets[i]:offsets[i + 1]``,
+    ordered by rate. Customers are stored as codes into ``names``, and each
+    case's median customer rate is taken from the middle of its sorted slice,
+    so no per-case frame or grouping is needed.
+
+    Args:
+        case_ids: Case number of each customer-level entry
+        n_cases: Number of cases
+        customer_codes: Customer of each entry, as a position in customer_names
+        customer_names: Distinct customer names
+        rate_units: The customer's (average) rate in integer units
+        lines: Sales lines behind each entry
+        rate_precision: Decimal places of the rate units
+    """
+    order = np.lexsort((rate_units, case_ids))
+    rate_units = np.asarray(rate_units, dtype='int64')[order]
+    sizes = np.bincount(np.asarray(case_ids, dtype='int64'), minlength=n_cases)
+    offsets = np.zeros(n_cases + 1, dtype='int64')
+    np.cumsum(sizes, out=offsets[1:])
+    lower = offsets[:-1] + (sizes - 1) // 2
+    upper = offsets[:-1] + sizes // 2
+    return {
+        'offsets': offsets,
+        'customers': np.asarray(customer_codes)[order].astype('int32'),
+        'names': np.asarray(customer_names, dtype=object),
+        'rate_units': rate_units,
+        'lines': np.asarray(lines, dtype='int64')[order],
+        'median_units': (rate_units[lower] + rate_units[upper]) / 2,
+        'rate_precision': rate_precision,
+    }
+
+def _case_slices(offsets, labels):
+    """Positions of the given cases' entries in an offset-indexed array, and each case's entry count."""
+    starts, ends = offsets[labels], offsets[labels + 1]
+    sizes = ends - starts
+    # Gather every case's slice in one vectorized step
+    within = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    return np.repeat(starts, sizes) + within, sizes
+
+def get_case_rates(case_rates, case_labels):
+    """Long-format customer rates of the given cross-customer cases.
+
+    One row per case and customer, lowest rate first, with the deviation
+    from the case's median customer rate.
+
+    Args:
+        case_rates: case_rows['rates'] from audit_cross_customer_variance
+        case_labels: Index labels of the variance rows to expand
+    """
+    labels = np.asarray(list(case_labels), dtype='int64')
+    entries, sizes = _case_slices(case_rates['offsets'], labels)
+    precision = case_rates['rate_precision']
+    rate_units = case_rates['rate_units'][entries]
+    median_units = np.repeat(case_rates['median_units'][labels], sizes)
+    deviation_units = rate_units - median_units
+    return pd.DataFrame({
+        'Case': np.repeat(labels, sizes) + 1,
+        'Customer': case_rates['names'][case_rates['customers'][entries]],
+        'Customer Rate': from_rate_units(rate_units, precision),
+        'Lines': case_rates['lines'][entries],
+        'Median Rate': median_units / 10 ** precision,
+        'Deviation': deviation_units / 10 ** precision,
+        'Deviation %': _variance_pct(deviation_units, median_units),
+    })
+
+def get_case_source_rows(df_clean, case_rows, case_labels):
+    """Return the original rows behind the given variance cases.
+
+    Args:
+        df_clean: Cleaned DataFrame returned by the audit
+        case_rows: Index returned by the audit with ``return_index=True``
+        case_labels: Index labels of the variance rows to expand
+    """
+    labels = np.asarray(list(case_labels), dtype='int64')
+    entries, sizes = _case_slices(case_rows['offsets'], labels)
+    positions = case_rows['positions'][entries]
+
+    rows = df_clean.iloc[positions].copy()
+    # Excel row = index + 2 because of header; multi-source loads carry their own 'Source Row'
+    if 'Source Row' not in rows.columns:
+        rows.insert(0, 'Excel Row', rows.index.to_numpy() + 2)
+    rows.insert(0, 'Case', np.repeat(labels, sizes) + 1)
+    return rows.reset_index(drop=True)
+
+def create_excel_download(df, metadata=None, quality_issues=None, source_rows=None, customer_rates=None):
+    """Create an enhanced multi-sheet Excel file in memory for download"""
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        # Main variance sheet (with a case number linking to 'Source Rows' / 'Customer Rates')
+        linked = [frame for frame in (source_rows, customer_rates) if frame is not None and not frame.empty]
+        if linked:
+            df = df.copy()
+            df.insert(0, 'Case', df.index + 1)
+        df.to_excel(writer, index=False, sheet_name='Price Variances')
+        
+        # Source order lines behind each variance case
+        if source_rows is not None and not source_rows.empty:
+            # Excel sheets hold at most 1,048,576 rows including the header
+            source_rows.head(1_048_575).to_excel(writer, index=False, sheet_name='Source Rows')
+        
+        # Every customer's rate per case (cross-customer mode), long format
+        if customer_rates is not None and not customer_rates.empty:
+            customer_rates.head(1_048_575).to_excel(writer, index=False, sheet_name='Customer Rates')
+        
+        # Metadata sheet
+        if metadata:
+            meta_df = pd.DataFrame(list(metadata.items()), columns=['Property', 'Value'])
+            meta_df.to_excel(writer, index=False, sheet_name='Metadata')
+        
+        # Data quality summary sheet
+        if quality_issues:
+            quality_data = []
+            if quality_issues.get('missing'):
+                for col, count in quality_issues['missing'].items():
+                    quality_data.append({
+                        'Issue Type': 'Missing Values', 
+                        'Column': col, 
+                        'Count': count,
+                        'Impact': '⚠️ High' if count > 100 else '⚠️ Medium' if count > 10 else '⚠️ Low'
+                    })
+            for issue, counter in (('invalid_date', 'date_issues'), ('non_numeric', 'non_numeric_prices')):
+                if quality_issues.get(counter):
+                    count = quality_issues[counter]
+                    quality_data.append({
+                        'Issue Type': ISSUE_TYPES[issue],
+                        'Column': ', '.join(col for _, col in quality_issues['index'].keys(issue)),
+                        'Count': count,
+                        'Impact': '⚠️ High' if count > 100 else '⚠️ Medium' if count > 10 else '⚠️ Low'
+                    })
+            if quality_issues.get('duplicates'):
+                quality_data.append({
+                    'Issue Type': 'Duplicate Rows', 
+                    'Column': 'All', 
+                    'Count': quality_issues['duplicates'],
+                    'Impact': '⚠️ High' if quality_issues['duplicates'] > 100 else '⚠️ Medium'
+                })
+            if quality_issues.get('critical_issue_rows'):
+                quality_data.append({
+                    'Issue Type': 'Rows Excluded From Audit',
+                    'Column': 'Any critical',
+                    'Count': quality_issues['critical_issue_rows'],
+                    'Impact': '⚠️ High'
+                })
+            
+            if quality_data:
+                quality_df = pd.DataFrame(quality_data)
+                quality_df.to_excel(writer, index=False, sheet_name='Data Quality Summary')
+        
+        # Detailed missing values sheet with row locations
+        if quality_issues and quality_issues.get('missing_details'):
+            missing_details_data = []
+            for col, details in quality_issues['missing_details'].items():
+                # Convert row indices to Excel row numbers (add 2 for header)
+                excel_rows = [idx + 2 for idx in details['rows']]
+                rows_str = ", ".join(map(str, excel_rows[:50]))  # Show first 50
+                if details['count'] > 50:
+                    rows_str += f"... and {details['count'] - 50} more (all rows: issue rows CSV export)"
+                
+                missing_details_data.append({
+                    'Column Name': col,
+                    'Missing Count': details['count'],
+                    'Excel Row Numbers': rows_str,
+                    'Quick Fix': f"Filter: df[df['{col}'].notna()] OR Fill: df['{col}'].fillna('N/A')"
+                })
+            
+            if missing_details_data:
+                missing_df = pd.DataFrame(missing_details_data)
+                missing_df.to_excel(writer, index=False, sheet_name='Missing Values Detail')
+        
+        # Duplicate rows detail sheet
+        if quality_issues and quality_issues.get('duplicate_rows'):
+            excel_rows = [idx + 2 for idx in quality_issues['duplicate_rows']]
+            dup_data = [{
+                'Excel Row Number': row,
+                'Status': 'Duplicate',
+                'Action': 'Review and remove'
+            } for row in excel_rows[:100]]  # Limit to 100
+            
+            if dup_data:
+                dup_df = pd.DataFrame(dup_data)
+                dup_df.to_excel(writer, index=False, sheet_name='Duplicate Rows Detail')
+    
+    output.seek(0)
+    return output
+
+# Columnar export formats: file extension and MIME type
+COLUMNAR_FORMATS = {
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('.arrow', 'application/vnd.apache.arrow.file'),
+}
+
+def quality_report_frame(quality_issues):
+    """Data quality issues as a typed frame: one row per issue type and column, with every affected row."""
+    rows = []
+    if quality_issues:
+        index = quality_issues['index']
+        critical = set(critical_issue_keys(quality_issues))
+        for key in index.keys():
+            excel_rows = index.labels(index.positions([key])) + 2
+            rows.append({
+                'Issue Type': ISSUE_TYPES[key[0]],
+                'Column': str(key[1]),
+                # Duplicates count the extra copies; the rows list every copy
+                'Count': int(quality_issues['duplicates']) if key[0] == 'duplicate' else len(excel_rows),
+                'Critical': key in critical,
+                # Excel row = index + 2 because of header
+                'Excel Rows': excel_rows.astype('int64'),
+            })
+    return pd.DataFrame(rows, columns=['Issue Type', 'Column', 'Count', 'Critical', 'Excel Rows'])
+
+def _is_text(values):
+    if values.dtype == object:
+        return pd.api.types.infer_dtype(values, skipna=True) == 'string'
+    return pd.api.types.is_string_dtype(values.dtype)
+
+def _arrow_table(df):
+    """Arrow table with BI-friendly types: dates as date32, repetitive strings dictionary-encoded."""
+    import pyarrow as pa
+
+    changed = {
+        col: df[col].astype('category')
+        for col in df.columns
+        if len(df) and _is_text(df[col]) and df[col].nunique() <= len(df) // 2
+    }
+    frame = df.assign(**changed) if changed else df
+    try:
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        # Mixed-type cells (common in hand-edited Excel sheets) export as text
+        mixed = {
+            col: frame[col].astype('string')
+            for col in frame.columns
+            if frame[col].dtype == object and pd.api.types.infer_dtype(frame[col], skipna=True).startswith('mixed')
+        }
+        table = pa.Table.from_pandas(frame.assign(**mixed), preserve_index=False)
+
+    # The engines emit case dates as ISO strings
+    if 'Date' in table.column_names:
+        i = table.column_names.index('Date')
+        dates = pd.to_datetime(df['Date'], format='%Y-%m-%d', errors='coerce')
+        if dates.notna().sum() == df['Date'].notna().sum():
+            table = table.set_column(i, 'Date', pa.array(dates.dt.date, type=pa.date32()))
+    return table
+
+def export_frame(df, fmt='parquet', destination=None, *, compression='zstd'):
+    """Write df as compressed Parquet or Arrow IPC (file format).
+
+    Returns the bytes, or writes to the destination path and returns it.
+    Needs pyarrow.
+    """
+    if fmt not in COLUMNAR_FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; use one of {', '.join(COLUMNAR_FORMATS)}")
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise ImportError("Parquet and Arrow exports need the 'pyarrow' package (pip install pyarrow)") from e
+
+    table = _arrow_table(df)
+    sink = pa.BufferOutputStream() if destination is None else pa.OSFile(str(destination), 'wb')
+    with sink:
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            pq.write_table(table, sink, compression=compression)
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=compression)
+            with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+                writer.write_table(table)
+        if destination is None:
+            return sink.getvalue().to_pybytes()
+    return destination
+
+# CSV inputs, plain or compressed (a .zip holds a CSV file)
+CSV_SUFFIXES = ('.csv', '.csv.gz', '.csv.zst', '.zip')
+
+def is_csv_name(name):
+    """True for CSV file names, compressed or not."""
+    return str(name).lower().endswith(CSV_SUFFIXES)
+
+def _zstd_reader(raw):
+    try:
+        from compression import zstd  # Python 3.14+
+        return zstd.ZstdFile(raw)
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError("Reading .zst files needs the 'zstandard' package (pip install zstandard)") from e
+    return zstandard.ZstdDecompressor().stream_reader(raw)
+
+@contextmanager
+def open_csv_stream(source, name=None):
+    """Yield a binary stream of CSV text from a path or raw bytes.
+
+    .csv.gz, .csv.zst and .zip (first CSV member) inputs are decompressed
+    on the fly as the parser reads, so no decompressed copy of the file is
+    ever held in memory or written to disk.
+    """
+    name = str(name or source).lower()
+    with ExitStack() as stack:
+        if isinstance(source, (bytes, bytearray)):
+            raw = BytesIO(source)
+        else:
+            raw = stack.enter_context(open(source, 'rb'))
+        if name.endswith('.gz'):
+            stream = stack.enter_context(gzip.GzipFile(fileobj=raw))
+        elif name.endswith('.zst'):
+            stream = stack.enter_context(_zstd_reader(raw))
+        elif name.endswith('.zip'):
+            archive = stack.enter_context(zipfile.ZipFile(raw))
+            members = [m for m in archive.namelist()
+                       if m.lower().endswith('.csv') and not m.startswith('__MACOSX/')]
+            if not members:
+                raise ValueError(f"{name} does not contain a .csv file")
+            stream = stack.enter_context(archive.open(members[0]))
+        else:
+            stream = raw
+        yield stream
+
+def read_table(source, name=None, *, usecols=None, dtype=None, nrows=None, stats=None):
+    """Read a CSV (plain or compressed) or Excel file from a path, or from raw bytes named by name.
+
+    usecols, dtype and nrows are passed to the parser, so a known layout
+    can be read without parsing unused columns or inferring types. Workbooks
+    go through the streaming reader (excel_reader). stats, if given,
+    receives the reader used and the parse throughput in rows per second.
+    """
+    name = name or source
+    if not is_csv_name(name):
+        import excel_reader
+        return excel_reader.read_excel(source, name, usecols=usecols, dtype=dtype, nrows=nrows, stats=stats)
+    start = time.perf_counter()
+    with open_csv_stream(source, name) as stream:
+        df = pd.read_csv(stream, usecols=usecols, dtype=dtype, nrows=nrows)
+    if stats is not None:
+        seconds = time.perf_counter() - start
+        stats.update(reader='csv', rows_per_sec=round(len(df) / seconds) if seconds > 0 else None)
+    return df
+
+def iter_table_chunks(source, name=None, *, chunk_rows=None):
+    """Yield a CSV or Excel file as DataFrames of chunk_rows rows, each parsed as it is read."""
+    name = name or source
+    chunk_rows = chunk_rows or PROGRESSIVE_CHUNK_ROWS
+    if not is_csv_name(name):
+        import excel_reader
+        yield from excel_reader.iter_excel_chunks(source, name, chunk_rows=chunk_rows)
+        return
+    with open_csv_stream(source, name) as stream:
+        yield from pd.read_csv(stream, chunksize=chunk_rows)
+
+# Columns that tag each row of a multi-file/multi-sheet load with its origin
+SOURCE_COLUMNS = ['Source File', 'Source Sheet', 'Source Row']
+
+def list_sheets(source, name=None):
+    """Sheet names of an Excel workbook, or [None] for a CSV file."""
+    name = name or source
+    if is_csv_name(name):
+        return [None]
+    if isinstance(source, (bytes, bytearray)):
+        source = BytesIO(source)
+    with pd.ExcelFile(source) as book:
+        return list(book.sheet_names)
+
+def _read_source_part(name, source, sheet, usecols, nrows):
+    """Parse one file or sheet, keeping only the wanted columns."""
+    wanted = set(usecols) if usecols else None
+    use = (lambda col: col in wanted) if wanted else None
+    if is_csv_name(name):
+        with open_csv_stream(source, name) as stream:
+            return pd.read_csv(stream, usecols=use, nrows=nrows)
+    import excel_reader
+    return excel_reader.read_excel(source, name, sheet=sheet, usecols=use, nrows=nrows)
+
+def read_sources(sources, *, usecols=None, nrows=None, max_workers=None):
+    """Parse several files/sheets concurrently into one frame tagged with their origin.
+
+    Args:
+        sources: (name, path-or-bytes, sheet) tuples; sheet is None for CSV
+            files and for the first sheet of a workbook
+        usecols: Columns to keep; the rest are dropped while parsing
+        nrows: Rows to read from each source (None for all)
+        max_workers: Parallel parsers (default: one per source, up to the CPU count)
+
+    Returns:
+        DataFrame with the kept columns plus 'Source File', 'Source Sheet'
+        (categoricals) and 'Source Row' (the row's number in its own sheet,
+        counting the header as row 1)
+    """
+    sources = list(sources)
+    workers = min(len(sources), max_workers or os.cpu_count() or 1)
+    jobs = [(name, source, sheet, usecols, nrows) for name, source, sheet in sources]
+    if workers <= 1:
+        parts = [_read_source_part(*job) for job in jobs]
+    else:
+        # Workbook parsing holds the GIL, so workbooks get processes; pandas' CSV parser is fine on threads
+        excel = any(not is_csv_name(name) for name, _, _ in sources)
+        parts = None
+        if excel:
+            try:
+                with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                    parts = list(pool.map(_read_source_part, *zip(*jobs)))
+            except (BrokenProcessPool, OSError):
+                parts = None
+        if parts is None:
+            with ThreadPoolExecutor(workers) as pool:
+                parts = list(pool.map(lambda job: _read_source_part(*job), jobs))
+
+    lengths = np.array([len(part) for part in parts], dtype='int64')
+    df = pd.concat(parts, ignore_index=True)
+    del parts
+
+    # Tags are built once over the combined frame: categorical codes and one
+    # vectorized row counter, instead of a constant column per part
+    part_of_row = np.repeat(np.arange(len(sources)), lengths)
+    names = [name for name, _, _ in sources]
+    file_categories = list(dict.fromkeys(names))
+    file_codes = np.array([file_categories.index(name) for name in names])
+    df['Source File'] = pd.Categorical.from_codes(file_codes[part_of_row], categories=file_categories)
+    sheets = [sheet for _, _, sheet in sources]
+    # CSV files (and unnamed first sheets) get an empty sheet tag, not a missing value
+    sheet_labels = ['' if sheet is None else str(sheet) for sheet in sheets]
+    sheet_categories = list(dict.fromkeys(sheet_labels))
+    sheet_codes = np.array([sheet_categories.index(label) for label in sheet_labels])
+    df['Source Sheet'] = pd.Categorical.from_codes(sheet_codes[part_of_row], categories=sheet_categories)
+    starts = np.cumsum(lengths) - lengths
+    df['Source Row'] = np.arange(len(df), dtype='int64') - np.repeat(starts, lengths) + 2
+    return df
+
+# Issue types recorded in the row-level issue index, with their report names
+ISSUE_TYPES = {
+    'missing': 'Missing Values',
+    'invalid_date': 'Invalid Date',
+    'non_numeric': 'Non-numeric Rate',
+    'duplicate': 'Duplicate Rows',
+}
+
+# Row positions shown inline in the UI and the Excel report
+ISSUE_PREVIEW_ROWS = 100
+
+class IssueIndex:
+    """Every row with a data quality issue, one packed bitmap per (issue type, column).
+
+    A bitmap holds one bit per row (np.packbits), so recording an issue
+    costs rows / 8 bytes however many rows are affected, and rows with any
+    of several issues are a bitwise OR of bitmaps. Row positions are
+    unpacked chunk by chunk when read, so complete lists can be streamed
+    without materialising them.
+    """
+
+    def __init__(self, n_rows, row_labels=None):
+        self.n_rows = n_rows
+        # Index labels of the rows; None when a row's label is its position
+        self.row_labels = row_labels
+        self._bitmaps = {}
+
+    def add(self, issue, column, mask):
+        bitmap = np.packbits(np.asarray(mask, dtype=bool))
+        if bitmap.any():
+            self._bitmaps[issue, column] = bitmap
+
+    def keys(self, issue=None):
+        return [key for key in self._bitmaps if issue is None or key[0] == issue]
+
+    def bitmap(self, keys=None):
+        """Packed bitmap of rows with any of the given issues (all when keys is None)."""
+        keys = self.keys() if keys is None else [key for key in keys if key in self._bitmaps]
+        if not keys:
+            return np.zeros((self.n_rows + 7) // 8, dtype=np.uint8)
+        return np.bitwise_or.reduce([self._bitmaps[key] for key in keys])
+
+    def count(self, keys=None):
+        """Rows with any of the given issues."""
+        return int(np.bitwise_count(self.bitmap(keys)).sum(dtype='int64'))
+
+    def iter_positions(self, keys=None, chunk_rows=1 << 20):
+        """Row positions of rows with any of the given issues, in chunks of up to chunk_rows rows scanned."""
+        bitmap = self.bitmap(keys)
+        chunk_bytes = max(chunk_rows // 8, 1)
+        for start in range(0, len(bitmap), chunk_bytes):
+            block = bitmap[start:start + chunk_bytes]
+            if block.any():
+                bits = np.unpackbits(block, count=min(len(block) * 8, self.n_rows - start * 8))
+                yield np.flatnonzero(bits) + start * 8
+
+    def positions(self, keys=None, limit=None):
+        """Row positions as one array, stopping once limit rows are found."""
+        found, total = [], 0
+        for chunk in self.iter_positions(keys):
+            found.append(chunk)
+            total += len(chunk)
+            if limit is not None and total >= limit:
+                break
+        positions = np.concatenate(found) if found else np.array([], dtype='int64')
+        return positions[:limit]
+
+    def labels(self, positions):
+        """Index labels of row positions (Excel row = label + 2 because of header)."""
+        return positions if self.row_labels is None else self.row_labels[positions]
+
+    @property
+    def nbytes(self):
+        return sum(bitmap.nbytes for bitmap in self._bitmaps.values()) + (
+            self.row_labels.nbytes if self.row_labels is not None else 0
+        )
+
+def critical_issue_keys(quality_issues):
+    """Issue index keys that make a row unusable for the audit."""
+    index = quality_issues['index']
+    required = quality_issues['required_columns']
+    return [key for key in index.keys() if (key[0] == 'missing' and key[1] in required)
+            or key[0] in ('invalid_date', 'non_numeric')]
+
+def write_issue_rows(quality_issues, fh, keys=None, *, chunk_rows=1 << 20):
+    """Stream the complete issue list as CSV (Issue Type, Column, Excel Row) to a text file.
+
+    keys selects (issue type, column) pairs; all are written when None.
+    Returns the number of lines written.
+    """
+    index = quality_issues['index']
+    writer = csv.writer(fh, lineterminator='\n')
+    writer.writerow(['Issue Type', 'Column', 'Excel Row'])
+    written = 0
+    for key in (index.keys() if keys is None else keys):
+        prefix = StringIO()
+        csv.writer(prefix, lineterminator='').writerow([ISSUE_TYPES[key[0]], key[1], ''])
+        prefix = prefix.getvalue()
+        for positions in index.iter_positions([key], chunk_rows=chunk_rows):
+            excel_rows = (index.labels(positions) + 2).tolist()
+            fh.write(''.join(f"{prefix}{row}\n" for row in excel_rows))
+            written += len(excel_rows)
+    return written
+
+def write_critical_rows(quality_issues, fh, *, chunk_rows=1 << 20):
+    """Stream the Excel rows with any critical issue, one per line, as CSV; returns the row count."""
+    index = quality_issues['index']
+    fh.write('Excel Row\n')
+    written = 0
+    for positions in index.iter_positions(critical_issue_keys(quality_issues), chunk_rows=chunk_rows):
+        excel_rows = (index.labels(positions) + 2).tolist()
+        fh.write(''.join(f"{row}\n" for row in excel_rows))
+        written += len(excel_rows)
+    return written
+
+def issue_rows_csv(quality_issues, critical_only=False):
+    """write_issue_rows (or write_critical_rows) into UTF-8 CSV bytes, for downloads."""
+    buffer = StringIO()
+    if critical_only:
+        write_critical_rows(quality_issues, buffer)
+    else:
+        write_issue_rows(quality_issues, buffer)
+    return buffer.getvalue().encode('utf-8')
+
+def _invalid_values(values, kind, *, date_format=None, dayfirst=False):
+    """Mask of present values that don't parse as kind ('date' or 'number')."""
+    if kind == 'date':
+        if pd.api.types.is_datetime64_any_dtype(values):
+            return np.zeros(len(values), dtype=bool)
+        if date_format:
+            parsed = pd.to_datetime(values, format=date_format, errors='coerce')
+        else:
+            parsed = pd.to_datetime(values, errors='coerce', dayfirst=dayfirst)
+    else:
+        if pd.api.types.is_numeric_dtype(values):
+            return np.zeros(len(values), dtype=bool)
+        parsed = pd.to_numeric(values, errors='coerce')
+    return (parsed.isna() & values.notna()).to_numpy()
+
+def analyze_data_quality(df, critical_columns=None, column_mapping=None, *, date_format=None, dayfirst=False):
+    """Analyze data quality and return issues with row locations.
+    
+    Every affected row is recorded in issues['index'], an IssueIndex of
+    packed bitmaps; the 'rows' lists only preview the first rows.
+    
+    Args:
+        df: DataFrame to analyze
+        critical_columns: List of column names that are critical for analysis
+        column_mapping: Optional column mapping; when given, dates and rates
+            that don't parse (as the audit would parse them) are recorded too
+    """
+    issues = {
+        'missing': {},
+        'missing_details': {},  # Store specific row numbers
+        'critical_missing': {},  # Missing values in critical columns
+        'other_missing': {},  # Missing values in non-critical columns
+        'duplicates': 0,
+        'duplicate_rows': [],
+        'non_numeric_prices': 0,
+        'date_issues': 0,
+        'customer_inconsistencies': [],
+        # Columns whose missing values drop a row from the audit
+        'required_columns': (
+            [column_mapping[field] for field in ('customer_name', 'material_code', 'date_column', 'basic_rate')]
+            if column_mapping else list(critical_columns or [])
+        ),
+    }
+    row_labels = None
+    if not (isinstance(df.index, pd.RangeIndex) and df.index.start == 0 and df.index.step == 1):
+        row_labels = df.index.to_numpy()
+    index = issues['index'] = IssueIndex(len(df), row_labels)
+    
+    # Check missing values with row locations
+    for col in df.columns:
+        missing_mask = df[col].isna().to_numpy()
+        missing_count = int(missing_mask.sum())
+        if missing_count > 0:
+            index.add('missing', col, missing_mask)
+            issues['missing'][col] = missing_count
+            # Store row indices (Excel row = index + 2 because of header)
+            missing_rows = index.labels(index.positions([('missing', col)], limit=ISSUE_PREVIEW_ROWS))
+            issues['missing_details'][col] = {
+                'count': missing_count,
+                'rows': missing_rows.tolist(),  # First rows only; the index has them all
+                'sample_preview': missing_count > ISSUE_PREVIEW_ROWS,
+                'is_critical': col in critical_columns if critical_columns else False
+            }
+            
+            # Categorize as critical or other
+            if critical_columns and col in critical_columns:
+                issues['critical_missing'][col] = missing_count
+            else:
+                issues['other_missing'][col] = missing_count
+    
+    # Dates and rates the audit would drop as unparseable
+    if column_mapping:
+        checks = [('invalid_date', column_mapping.get('date_column'), 'date', 'date_issues'),
+                  ('non_numeric', column_mapping.get('basic_rate'), 'number', 'non_numeric_prices')]
+        for issue, col, kind, counter in checks:
+            if col in df.columns:
+                invalid_mask = _invalid_values(df[col], kind, date_format=date_format, dayfirst=dayfirst)
+                index.add(issue, col, invalid_mask)
+                issues[counter] = int(invalid_mask.sum())
+    
+    # Check duplicates with row locations (origin tags of multi-source loads don't count)
+    data_columns = [col for col in df.columns if col not in SOURCE_COLUMNS]
+    duplicate_mask = df.duplicated(subset=data_columns, keep=False)
+    issues['duplicates'] = df.duplicated(subset=data_columns).sum()
+    if issues['duplicates'] > 0:
+        index.add('duplicate', 'All', duplicate_mask.to_numpy())
+        issues['duplicate_rows'] = index.labels(index.positions([('duplicate', 'All')], limit=ISSUE_PREVIEW_ROWS)).tolist()
+    
+    # Rows the audit can't use, whatever the reason (a bitwise OR of the bitmaps)
+    issues['critical_issue_rows'] = index.count(critical_issue_keys(issues))
+    
+    return issues
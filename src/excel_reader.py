@@ -0,0 +1,290 @@
+"""
+Streaming Excel reader.
+
+``pd.read_excel`` builds a full openpyxl cell object for every cell of the
+sheet before pandas sees any data, which makes it by far the slowest part
+of opening a workbook. This reader pulls plain row values instead, from
+python-calamine (Rust, ``pip install python-calamine``) when it is
+installed or from openpyxl in read-only mode otherwise. Only the wanted
+columns are kept from each row, and every ``chunk_rows`` rows are turned
+into a DataFrame of typed columns, so memory holds one chunk of Python
+values at a time.
+
+Columns are typed like ``pd.read_excel`` types them: whole numbers as
+int64 (float64 when cells are blank), dates as datetime64, text as str and
+mixed columns as object. Blank rows are skipped and blank or repeated
+header cells are named as pandas names them.
+
+The reader is picked by ``SALES_AUDIT_EXCEL_READER`` ('auto', 'calamine',
+'openpyxl' or 'pandas'; default 'auto'). When the chosen reader can't open
+a workbook (e.g. a legacy .xls without calamine) or fails partway through
+a sheet, the next reader takes over, ending with ``pd.read_excel``; rows
+already handed out are skipped, not repeated.
+"""
+
+import importlib.util
+import os
+import time
+from io import BytesIO
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
+
+READERS = ('calamine', 'openpyxl', 'pandas')
+
+# Rows turned into one typed DataFrame at a time
+DEFAULT_CHUNK_ROWS = 50_000
+
+# Formats each streaming reader opens
+CALAMINE_SUFFIXES = ('.xlsx', '.xlsm', '.xlsb', '.xls', '.ods')
+OPENPYXL_SUFFIXES = ('.xlsx', '.xlsm')
+
+
+def calamine_available():
+    return importlib.util.find_spec('python_calamine') is not None
+
+
+def reader_chain(name=None, reader=None):
+    """Readers to try in order for a workbook name, per reader or SALES_AUDIT_EXCEL_READER.
+
+    Asking for calamine when it is not installed raises ImportError.
+    """
+    reader = reader or os.environ.get('SALES_AUDIT_EXCEL_READER', 'auto')
+    if reader != 'auto' and reader not in READERS:
+        raise ValueError(f"Unknown Excel reader {reader!r}; use auto or one of {', '.join(READERS)}")
+    if reader == 'calamine' and not calamine_available():
+        raise ImportError("The calamine Excel reader needs the 'python-calamine' package (pip install python-calamine)")
+    suffix = os.path.splitext(str(name or '').lower())[1]
+    chain = []
+    if reader in ('auto', 'calamine') and calamine_available() and suffix in CALAMINE_SUFFIXES + ('',):
+        chain.append('calamine')
+    if reader in ('auto', 'openpyxl') and suffix in OPENPYXL_SUFFIXES + ('',):
+        chain.append('openpyxl')
+    chain.append('pandas')
+    return chain
+
+
+def _open_source(source):
+    """A fresh file-like object or path for one reader attempt."""
+    if isinstance(source, (bytes, bytearray)):
+        return BytesIO(source)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return source
+
+
+def _calamine_rows(source, sheet):
+    from python_calamine import CalamineWorkbook
+
+    if isinstance(source, (str, os.PathLike)):
+        book = CalamineWorkbook.from_path(str(source))
+    else:
+        book = CalamineWorkbook.from_filelike(source)
+    try:
+        if sheet is None or isinstance(sheet, int):
+            worksheet = book.get_sheet_by_index(sheet or 0)
+        else:
+            worksheet = book.get_sheet_by_name(sheet)
+        yield from worksheet.iter_rows()
+    finally:
+        book.close()
+
+
+def _openpyxl_rows(source, sheet):
+    import openpyxl
+
+    book = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        if sheet is None or isinstance(sheet, int):
+            worksheet = book.worksheets[sheet or 0]
+        else:
+            worksheet = book[sheet]
+        yield from worksheet.iter_rows(values_only=True)
+    finally:
+        book.close()
+
+
+def _pandas_rows(source, sheet, usecols, nrows):
+    # The fallback: a whole-sheet read, handed on as rows of the kept columns.
+    # Blank cells come back as None, as from the streaming readers, so blank
+    # rows are skipped and counted the same way after a mid-sheet handover
+    df = pd.read_excel(source, sheet_name=0 if sheet is None else sheet, usecols=usecols, nrows=nrows)
+    yield tuple(df.columns)
+    yield from df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+
+_ROW_SOURCES = {'calamine': _calamine_rows, 'openpyxl': _openpyxl_rows}
+
+
+def _header_names(header):
+    """Column names of a header row: blanks become 'Unnamed: i', repeats get .1, .2 ..."""
+    names, seen = [], {}
+    for i, value in enumerate(header):
+        name = f"Unnamed: {i}" if value is None or value == '' else value
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _typed_column(values):
+    """Series of one column's cell values with the dtype pd.read_excel would give it."""
+    kind = pd.api.types.infer_dtype(values, skipna=True)
+    if kind == 'empty':
+        return pd.Series(values, dtype='float64')
+    if kind in ('date', 'datetime'):
+        return pd.Series(pd.to_datetime(pd.Series(values, dtype=object)).to_numpy('datetime64[us]'))
+    column = pd.Series(values)
+    if column.dtype == object:
+        if kind in ('mixed', 'mixed-integer'):
+            # Numbers among text: whole ones as int, cell by cell, in these columns only
+            column = pd.Series([int(v) if type(v) is float and v.is_integer() else v for v in values], dtype=object)
+        # Blanks as NaN
+        return column.where(column.notna(), np.nan)
+    if column.dtype == 'float64' and np.isfinite(column).all() and np.array_equal(column, np.floor(column)):
+        # Excel keeps numbers as floats; whole ones are read as integers
+        column = column.astype('int64')
+    return column
+
+
+def _chunk_frame(rows, names, start):
+    """DataFrame of picked row tuples indexed from start; calamine's '' for empty cells becomes missing."""
+    columns = {}
+    for name, values in zip(names, zip(*rows) if rows else [()] * len(names)):
+        if '' in values:
+            values = [None if value == '' else value for value in values]
+        columns[name] = _typed_column(list(values)).array
+    return pd.DataFrame(columns, index=pd.RangeIndex(start, start + len(rows)))
+
+
+def _harmonize(chunks):
+    """Concatenate typed chunks, re-typing columns whose chunks disagree (e.g. text and all-blank)."""
+    if len(chunks) == 1:
+        return chunks[0].reset_index(drop=True)
+    df = pd.concat(chunks, ignore_index=True)
+    for col in df.columns:
+        if len({str(chunk[col].dtype) for chunk in chunks}) > 1:
+            df[col] = _typed_column(df[col].astype(object).where(df[col].notna(), None).tolist())
+    return df
+
+
+class _ColumnsNotFound(ValueError):
+    """Wanted columns missing from the header; no other reader would find them either."""
+
+
+def iter_excel_chunks(source, name=None, *, sheet=None, usecols=None, nrows=None,
+                      chunk_rows=DEFAULT_CHUNK_ROWS, reader=None, stats=None):
+    """Yield a worksheet as DataFrames of at most chunk_rows rows, parsed as they are read.
+
+    Row labels run on across chunks (0, 1, ... over the whole sheet), as
+    with ``pd.read_csv(chunksize=...)``. A reader that fails, on opening the
+    workbook or partway through it, hands over to the next reader in the
+    chain, which skips the rows already yielded.
+
+    Args:
+        source: Path, raw bytes or file-like object of the workbook
+        name: File name used to pick readers by format (default: source, if a path)
+        sheet: Sheet name or index (default: the first sheet)
+        usecols: Column names to keep, or a callable on each column name
+        nrows: Data rows to read (None for all)
+        chunk_rows: Rows per yielded DataFrame
+        reader: 'auto', 'calamine', 'openpyxl' or 'pandas' (see reader_chain)
+        stats: Optional dict that receives the reader used and the parse
+            throughput so far (rows_per_sec), updated after every chunk
+
+    At least one chunk is yielded, so a sheet without data rows still gives
+    its columns.
+    """
+    if name is None and isinstance(source, (str, os.PathLike)):
+        name = source
+    stats = {} if stats is None else stats
+    chain = reader_chain(name, reader)
+    progress = {'start': time.perf_counter(), 'rows': 0, 'yielded': False}
+    for i, candidate in enumerate(chain):
+        try:
+            yield from _reader_chunks(candidate, source, sheet, usecols, nrows, chunk_rows, stats, progress)
+            return
+        except _ColumnsNotFound:
+            raise
+        except Exception:
+            # Each reader has its own errors for a workbook it can't read; the next one resumes the sheet
+            if i == len(chain) - 1:
+                raise
+
+
+def _reader_chunks(candidate, source, sheet, usecols, nrows, chunk_rows, stats, progress):
+    """iter_excel_chunks with one reader, skipping the progress['rows'] data rows already yielded."""
+    if candidate == 'pandas':
+        rows = _pandas_rows(_open_source(source), sheet, usecols, nrows)
+    else:
+        rows = _ROW_SOURCES[candidate](_open_source(source), sheet)
+    try:
+        header = next(rows, None)
+        stats['reader'] = candidate
+        if header is None:
+            if not progress['yielded']:
+                progress['yielded'] = True
+                yield pd.DataFrame()
+            return
+
+        names = _header_names(header)
+        width = len(names)
+        if usecols is None:
+            keep = list(range(width))
+        elif callable(usecols):
+            keep = [i for i, col in enumerate(names) if usecols(col)]
+        else:
+            missing = [col for col in usecols if col not in names]
+            if missing:
+                raise _ColumnsNotFound(f"Usecols do not match columns, columns expected but not found: {missing}")
+            wanted = set(usecols)
+            keep = [i for i, col in enumerate(names) if col in wanted]
+        kept_names = [names[i] for i in keep]
+        pick = itemgetter(*keep) if len(keep) > 1 else (lambda row: (row[keep[0]],) if keep else ())
+        padding = (None,) * width
+
+        total = skip = progress['rows']
+        limit = float('inf') if nrows is None else nrows
+        while True:
+            batch = []
+            for row in rows if total < limit else ():
+                if len(row) < width:
+                    row = (*row, *padding[len(row):])
+                if row.count(None) + row.count('') >= len(row):
+                    continue
+                if skip:
+                    skip -= 1
+                    continue
+                batch.append(pick(row))
+                if len(batch) >= chunk_rows or total + len(batch) >= limit:
+                    break
+            if not batch and progress['yielded']:
+                break
+            first = total
+            total += len(batch)
+            chunk = _chunk_frame(batch, kept_names, first)
+            seconds = time.perf_counter() - progress['start']
+            stats['rows_per_sec'] = round(total / seconds) if seconds > 0 else None
+            progress.update(rows=total, yielded=True)
+            yield chunk
+            if len(batch) < chunk_rows or total >= limit:
+                break
+    finally:
+        rows.close()
+
+
+def read_excel(source, name=None, *, sheet=None, usecols=None, dtype=None, nrows=None, reader=None, stats=None):
+    """Read a worksheet into one DataFrame with the streaming reader (see iter_excel_chunks).
+
+    dtype maps columns to dtypes applied after reading; a value that doesn't
+    fit raises ValueError or TypeError as pd.read_excel does.
+    """
+    df = _harmonize(list(iter_excel_chunks(source, name, sheet=sheet, usecols=usecols, nrows=nrows,
+                                           reader=reader, stats=stats)))
+    if dtype:
+        df = df.astype({col: kind for col, kind in dtype.items() if col in df.columns})
+    return df
@@ -0,0 +1,200 @@
+"""
+Saved ingestion profiles for recurring export layouts.
+
+A profile remembers how a file layout was read the last time: the column
+mapping, the date format and day-first flag, the dtypes of the kept
+columns and which columns to keep at all. Profiles are keyed by a
+fingerprint of the header row (the column names in order), so when a file
+with the same header arrives again it is parsed with the stored plan
+directly: unused columns are skipped by the parser, types are not
+inferred, and mapping auto-detection and date-format inference are not
+needed. Any change to the header is a different layout and is not matched.
+
+Profiles live in one JSON file shared by the app and the CLI.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+import audit_core
+
+DEFAULT_PROFILES_PATH = os.environ.get(
+    'SALES_AUDIT_PROFILES', os.path.join(os.path.expanduser('~'), '.sales_audit', 'ingestion_profiles.json')
+)
+
+# Rows used to pick and check a date format when none was given
+DATE_SAMPLE_ROWS = 1000
+
+
+def header_fingerprint(columns):
+    """SHA-256 of a header row: its column names, in order."""
+    return hashlib.sha256(json.dumps([str(col) for col in columns]).encode('utf-8')).hexdigest()
+
+
+def read_header(source, name=None):
+    """Column names of a CSV or Excel file (path or raw bytes) without reading its rows."""
+    return list(audit_core.read_table(source, name, nrows=0).columns)
+
+
+def infer_date_format(values, dayfirst=False):
+    """strftime format that parses the sampled dates exactly as inference does, or None.
+
+    Pinning the format in a profile lets later reads skip per-file format
+    inference; values that are already datetimes (Excel dates) need none.
+    """
+    if not (pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values)):
+        return None
+    sample = values.dropna().astype(str).head(DATE_SAMPLE_ROWS)
+    if sample.empty:
+        return None
+    fmt = pd.tseries.api.guess_datetime_format(sample.iloc[0], dayfirst=dayfirst)
+    if fmt is None:
+        return None
+    inferred = pd.to_datetime(sample, errors='coerce', dayfirst=dayfirst)
+    pinned = pd.to_datetime(sample, format=fmt, errors='coerce')
+    return fmt if pinned.equals(inferred) else None
+
+
+def _reader_dtype(dtype):
+    """dtype string to pass to the parser for a column read as dtype, or None to leave it inferred."""
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'bool'
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'int64'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'float64'
+    if pd.api.types.is_string_dtype(dtype) or pd.api.types.is_object_dtype(dtype):
+        return 'str'
+    # Datetimes and anything else are left to the parser
+    return None
+
+
+def build_profile(name, df, column_mapping, *, date_format=None, dayfirst=False, project=True, extra_columns=()):
+    """Ingestion profile of a frame read with its file's header.
+
+    Args:
+        name: Label shown when the profile is matched
+        df: The frame as read, all columns, in header order
+        column_mapping: Field name -> column of df
+        date_format: Date format in use; when empty one is inferred from the data
+        dayfirst: Day-first flag in use
+        project: Keep only the mapped columns when the layout is read again
+        extra_columns: Unmapped columns kept as well, e.g. extra grouping keys
+
+    Returns:
+        dict ready for IngestionProfiles.save
+    """
+    columns = [str(col) for col in df.columns]
+    mapped = {*column_mapping.values(), *extra_columns}
+    usecols = [col for col in columns if col in mapped] if project else None
+    kept = usecols or columns
+    dtypes = {}
+    for col in kept:
+        reader_dtype = _reader_dtype(df[col].dtype)
+        if reader_dtype is not None:
+            dtypes[col] = reader_dtype
+    date_column = column_mapping.get('date_column')
+    if not date_format and date_column in df.columns:
+        date_format = infer_date_format(df[date_column], dayfirst)
+    return {
+        'name': name,
+        'fingerprint': header_fingerprint(columns),
+        'columns': columns,
+        'mapping': dict(column_mapping),
+        'date_format': date_format or None,
+        'dayfirst': bool(dayfirst),
+        'usecols': usecols,
+        'dtypes': dtypes,
+        'saved_at': datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def read_with_profile(source, name, profile, stats=None):
+    """Read a file of a profile's layout with its stored column projection and dtypes."""
+    try:
+        return audit_core.read_table(source, name, usecols=profile['usecols'], dtype=profile['dtypes'] or None,
+                                     stats=stats)
+    except (ValueError, TypeError):
+        # A column no longer fits its stored type (e.g. blanks in an integer column)
+        return audit_core.read_table(source, name, usecols=profile['usecols'], stats=stats)
+
+
+def read_plan(profile):
+    """Hashable summary of how a profile reads its layout, for cache keys."""
+    if profile is None:
+        return None
+    return (tuple(profile['usecols'] or ()), tuple(sorted(profile['dtypes'].items())))
+
+
+class IngestionProfiles:
+    """JSON file of ingestion profiles keyed by header fingerprint.
+
+    The file is re-read only when it changes on disk, so the app and the CLI
+    see each other's profiles; writes replace it atomically.
+    """
+
+    def __init__(self, path=DEFAULT_PROFILES_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._profiles = {}
+        self._mtime_ns = None
+
+    def _load_locked(self):
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            self._profiles, self._mtime_ns = {}, None
+            return self._profiles
+        if mtime_ns != self._mtime_ns:
+            try:
+                with open(self.path, encoding='utf-8') as fh:
+                    self._profiles = json.load(fh)
+            except (OSError, ValueError) as e:
+                print(f"✗ Ignoring unreadable ingestion profiles {self.path}: {e}", flush=True)
+                self._profiles = {}
+            self._mtime_ns = mtime_ns
+        return self._profiles
+
+    def _save_locked(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as fh:
+            json.dump(self._profiles, fh, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self._mtime_ns = os.stat(self.path).st_mtime_ns
+
+    def __len__(self):
+        with self._lock:
+            return len(self._load_locked())
+
+    def list(self):
+        """All profiles, most recently saved first."""
+        with self._lock:
+            profiles = list(self._load_locked().values())
+        return sorted(profiles, key=lambda p: p['saved_at'], reverse=True)
+
+    def match(self, columns):
+        """Profile saved for this exact header row, or None."""
+        with self._lock:
+            return self._load_locked().get(header_fingerprint(columns))
+
+    def save(self, profile):
+        """Store a profile, replacing any earlier one for the same header."""
+        with self._lock:
+            self._load_locked()
+            self._profiles[profile['fingerprint']] = profile
+            self._save_locked()
+
+    def forget(self, fingerprint):
+        """Remove a profile; True if there was one."""
+        with self._lock:
+            if self._load_locked().pop(fingerprint, None) is None:
+                return False
+            self._save_locked()
+            return True
@@ -0,0 +1,376 @@
+"""
+Byte-budgeted in-process cache for parsed uploads and per-session results.
+
+Every entry is sized when it is stored (DataFrames by their column buffers,
+object columns estimated from a sample) and the least recently used entries
+are evicted once the total passes a global budget. Entries stored as
+spillable, such as a session's analysis results, are pickled to a spill
+directory instead of being dropped, both on eviction and after sitting idle,
+and are loaded back transparently on their next access. One cache is shared
+by every session in the process.
+"""
+
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Object columns are sized from at most this many evenly spaced values
+_OBJECT_SAMPLE = 1000
+
+_MISSING = object()
+
+
+def _object_payload(values):
+    """Estimated bytes held by the Python objects of a 1-D object array."""
+    n = len(values)
+    if n == 0:
+        return 0
+    sample = values[::max(1, n // _OBJECT_SAMPLE)]
+    return int(sum(sys.getsizeof(v) for v in sample) / len(sample) * n)
+
+
+def estimate_nbytes(obj):
+    """Approximate memory held by obj, cheap enough to run on every store."""
+    if obj is None:
+        return 0
+    if isinstance(obj, pd.DataFrame):
+        total = int(obj.memory_usage(index=True, deep=False).sum())
+        for i, dtype in enumerate(obj.dtypes):
+            if dtype == object:
+                total += _object_payload(obj.iloc[:, i].to_numpy())
+        return total
+    if isinstance(obj, (pd.Series, pd.Index)):
+        total = int(obj.memory_usage(deep=False))
+        if obj.dtype == object:
+            total += _object_payload(obj.to_numpy())
+        return total
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes + (_object_payload(obj.ravel()) if obj.dtype == object else 0)
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_nbytes(k) + estimate_nbytes(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(estimate_nbytes(v) for v in obj)
+    if isinstance(getattr(obj, 'nbytes', None), int):
+        # Objects that report their own size (e.g. audit_core.IssueIndex)
+        return obj.nbytes
+    return sys.getsizeof(obj)
+
+
+def _kind(key):
+    return key[0] if isinstance(key, tuple) and key else 'other'
+
+
+class FrameCache:
+    """Thread-safe LRU cache bounded by the estimated byte size of its entries.
+
+    Keys are tuples whose first element names the kind of entry ('upload',
+    'session', ...); hit, miss and eviction counters are kept per kind.
+    """
+
+    def __init__(self, budget_bytes, spill_dir=None, spill_ttl_seconds=24 * 3600):
+        self.budget_bytes = budget_bytes
+        self.spill_dir = spill_dir or os.path.join(tempfile.gettempdir(), 'sales-audit-spill')
+        self.spill_ttl_seconds = spill_ttl_seconds
+        self.nbytes = 0
+        self._entries = OrderedDict()  # key -> entry dict, least recently used first
+        self._pending = {}  # key -> entry being written to disk
+        self._spilled = {}  # key -> {'path', 'nbytes', 'spilled_at'}
+        self._restoring = {}  # key -> Event set once a spilled entry is back in memory
+        self._inflight = {}  # key -> computation in progress, see get_or_compute
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _count(self, key, counter, n=1):
+        counts = self._counters.setdefault(
+            _kind(key), {'hits': 0, 'misses': 0, 'waits': 0, 'evictions': 0, 'spills': 0, 'restores': 0}
+        )
+        counts[counter] += n
+
+    def get(self, key, default=None):
+        """Return the cached value, reloading it from disk if it was spilled.
+
+        Callers asking for a key that is being reloaded wait for that reload
+        instead of reporting a miss.
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    entry['last_access'] = time.monotonic()
+                    self._count(key, 'hits')
+                    return entry['value']
+                if key in self._pending:
+                    self._count(key, 'hits')
+                    return self._pending[key]['value']
+                restoring = self._restoring.get(key)
+                if restoring is None:
+                    spilled = self._spilled.pop(key, None)
+                    if spilled is None:
+                        self._count(key, 'misses')
+                        return default
+                    restoring = self._restoring[key] = threading.Event()
+                    break
+            restoring.wait()
+
+        value, loaded, victims = default, False, []
+        try:
+            with open(spilled['path'], 'rb') as fh:
+                value = pickle.load(fh)
+            loaded = True
+        except (OSError, pickle.UnpicklingError, EOFError):
+            pass
+        finally:
+            self._unlink(spilled['path'])
+            with self._lock:
+                # Popped or re-stored while loading: the newer state wins
+                current = self._restoring.get(key) is restoring
+                if current:
+                    del self._restoring[key]
+                if not loaded:
+                    self._count(key, 'misses')
+                else:
+                    self._count(key, 'restores')
+                    if current:
+                        victims = self._store_locked(key, value, True, spilled['nbytes'])
+            restoring.set()
+        self._spill(victims)
+        return value
+
+    def put(self, key, value, *, spillable=False, nbytes=None):
+        """Store value, evicting least recently used entries beyond the budget.
+
+        Evicted spillable entries are written to the spill directory; others
+        are dropped. The new entry itself is never evicted by its own store,
+        even when it alone exceeds the budget.
+        """
+        nbytes = estimate_nbytes(value) if nbytes is None else nbytes
+        with self._lock:
+            victims = self._store_locked(key, value, spillable, nbytes)
+        self._spill(victims)
+        return value
+
+    def _store_locked(self, key, value, spillable, nbytes):
+        now = time.monotonic()
+        self._remove_locked(key)
+        self._entries[key] = {
+            'value': value, 'nbytes': nbytes, 'spillable': spillable,
+            'created': now, 'last_access': now,
+        }
+        self.nbytes += nbytes
+        victims = []
+        while self.nbytes > self.budget_bytes and len(self._entries) > 1:
+            victim_key = next(iter(self._entries))
+            victims.append((victim_key, self._evict_locked(victim_key)))
+        return victims
+
+    def get_or_compute(self, key, compute, *, spillable=False):
+        """Return (value, computed) for key, running compute() at most once at a time.
+
+        Concurrent callers asking for the same missing key wait for the first
+        caller's computation (single-flight) instead of repeating it; if it
+        raises, every waiter sees the same exception and nothing is cached.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value, False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                # Stored by a flight that finished since our lookup
+                return entry['value'], False
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = {'done': threading.Event(), 'value': None, 'error': None}
+            else:
+                self._count(key, 'waits')
+
+        if not leader:
+            flight['done'].wait()
+            if flight['error'] is not None:
+                raise flight['error']
+            return flight['value'], False
+
+        try:
+            flight['value'] = self.put(key, compute(), spillable=spillable)
+        except BaseException as exc:
+            flight['error'] = exc
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight['done'].set()
+        return flight['value'], True
+
+    def pop(self, key):
+        """Forget key, in memory or on disk."""
+        with self._lock:
+            path = self._remove_locked(key)
+        if path:
+            self._unlink(path)
+
+    def spill_idle(self, idle_seconds):
+        """Spill spillable entries untouched for idle_seconds and expire old spill files."""
+        cutoff = time.monotonic() - idle_seconds
+        expired = []
+        victims = []
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry['spillable'] and entry['last_access'] < cutoff:
+                    victims.append((key, self._evict_locked(key)))
+            expire_before = time.time() - self.spill_ttl_seconds
+            for key, spilled in list(self._spilled.items()):
+                if spilled['spilled_at'] < expire_before:
+                    expired.append(self._spilled.pop(key)['path'])
+        self._spill(victims)
+        for path in expired:
+            self._unlink(path)
+        return len(victims)
+
+    def _remove_locked(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry['nbytes']
+        self._pending.pop(key, None)
+        self._restoring.pop(key, None)
+        spilled = self._spilled.pop(key, None)
+        return spilled['path'] if spilled else None
+
+    def _evict_locked(self, key):
+        entry = self._entries.pop(key)
+        self.nbytes -= entry['nbytes']
+        if entry['spillable']:
+            # Stays readable from memory until the file is written
+            self._pending[key] = entry
+            self._count(key, 'spills')
+        else:
+            self._count(key, 'evictions')
+        return entry
+
+    def _spill(self, victims):
+        """Write evicted spillable entries to disk, outside the lock."""
+        for key, entry in victims:
+            if not entry['spillable']:
+                continue
+            path = None
+            try:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                path = os.path.join(self.spill_dir, f"{uuid.uuid4().hex}.pkl")
+                with open(path, 'wb') as fh:
+                    pickle.dump(entry['value'], fh, protocol=pickle.HIGHEST_PROTOCOL)
+            except (OSError, pickle.PicklingError):
+                # Nowhere to put it: the entry is dropped like a non-spillable one
+                if path:
+                    self._unlink(path)
+                path = None
+            with self._lock:
+                # The key may have been re-stored or popped while we were writing
+                current = self._pending.get(key) is entry
+                if current:
+                    del self._pending[key]
+                    if path is None:
+                        self._count(key, 'evictions')
+                    else:
+                        self._spilled[key] = {'path': path, 'nbytes': entry['nbytes'], 'spilled_at': time.time()}
+            if not current and path:
+                self._unlink(path)
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self):
+        """Budget, usage and per-kind counters for operators."""
+        with self._lock:
+            return {
+                'budget_mb': self.budget_bytes / 1024 ** 2,
+                'used_mb': self.nbytes / 1024 ** 2,
+                'entries': len(self._entries),
+                'spilled_entries': len(self._spilled),
+                'spilled_mb': sum(s['nbytes'] for s in self._spilled.values()) / 1024 ** 2,
+                'by_kind': {kind: dict(counts) for kind, counts in self._counters.items()},
+            }
+
+    def entries(self):
+        """One row per entry, most recently used first."""
+        now_mono = time.monotonic()
+        now = time.time()
+        with self._lock:
+            rows = [
+                {'kind': _kind(key), 'key': key[1:] if isinstance(key, tuple) else key,
+                 'size_mb': entry['nbytes'] / 1024 ** 2, 'idle_seconds': now_mono - entry['last_access'],
+                 'location': 'memory'}
+                for key, entry in reversed(self._entries.items())
+            ]
+            rows += [
+                {'kind': _kind(key), 'key': key[1:] if isinstance(key, tuple) else key,
+                 'size_mb': spilled['nbytes'] / 1024 ** 2, 'idle_seconds': now - spilled['spilled_at'],
+                 'location': 'disk'}
+                for key, spilled in self._spilled.items()
+            ]
+        return rows
+
+
+class SessionFrames:
+    """One session's large objects, held in the shared cache instead of st.session_state.
+
+    Values are stored spillable under ('session', session_id, name), so an
+    idle session's results move to disk and come back on its next rerun.
+    A name can instead be linked to an entry shared with other sessions.
+    ``name in frames`` is True once a name has been assigned, even to None.
+    """
+
+    def __init__(self, cache, session_id=None):
+        self.cache = cache
+        self.session_id = session_id or uuid.uuid4().hex
+        self._names = set()
+        self._links = {}
+
+    def _key(self, name):
+        return self._links.get(name, ('session', self.session_id, name))
+
+    def link(self, name, key):
+        """Point name at a shared cache entry; the entry is read, never owned."""
+        if name not in self._links:
+            self.cache.pop(self._key(name))
+        self._names.add(name)
+        self._links[name] = key
+
+    def __setitem__(self, name, value):
+        self._links.pop(name, None)
+        self._names.add(name)
+        if value is None:
+            self.cache.pop(self._key(name))
+        else:
+            self.cache.put(self._key(name), value, spillable=True)
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def get(self, name, default=None):
+        if name not in self._names:
+            return default
+        return self.cache.get(self._key(name), default)
+
+    def clear(self):
+        for name in self._names - self._links.keys():
+            self.cache.pop(self._key(name))
+        self._names.clear()
+        self._links.clear()
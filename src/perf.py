@@ -0,0 +1,96 @@
+"""
+Stage-level timing and memory instrumentation for the audit pipeline.
+
+A PipelineProfile collects one record per stage (wall time, rows in/out,
+process RSS after the stage and, when memory tracing is on, the stage's
+peak Python-heap allocation from tracemalloc). The Streamlit app shows
+the records in its Performance panel and the CLI emits them as JSON lines.
+"""
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB, or None if unavailable."""
+    try:
+        with open('/proc/self/statm') as fh:
+            pages = int(fh.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS and kilobytes elsewhere
+        return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+    except (ImportError, OSError):
+        return None
+
+
+class PipelineProfile:
+    """Collects per-stage timing, row counts and memory for one pipeline run."""
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = []
+        self.context = {}
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """Time a stage; set ``record['rows_out']`` inside the block if rows change."""
+        started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+
+        record = {'stage': name, 'rows_in': rows}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            if self.trace_memory:
+                _, peak = tracemalloc.get_traced_memory()
+                record['peak_mb'] = (peak - base) / 1024 ** 2
+                if started_tracing:
+                    tracemalloc.stop()
+            record['rss_mb'] = current_rss_mb()
+            # A re-run stage (e.g. report rebuilt after a filter change) replaces the old entry
+            self.stages = [s for s in self.stages if s['stage'] != name]
+            self.stages.append(record)
+
+    def total_seconds(self):
+        return sum(s['seconds'] for s in self.stages)
+
+    def to_records(self):
+        return [dict(s) for s in self.stages]
+
+    def log_json(self, stream=None, **context):
+        """Write one JSON line per stage plus a summary line with the file shape."""
+        stream = stream or sys.stderr
+        summary = {**self.context, **context}
+        for record in self.stages:
+            stream.write(json.dumps({'event': 'stage', **summary, **record}) + '\n')
+        stream.write(json.dumps({
+            'event': 'pipeline_complete',
+            **summary,
+            'total_seconds': self.total_seconds(),
+            'stages': len(self.stages),
+            'rss_mb': current_rss_mb(),
+        }) + '\n')
+        stream.flush()
+
+
+def stage(profile, name, rows=None):
+    """``profile.stage(...)`` when profiling, otherwise a no-op context."""
+    if profile is None:
+        return nullcontext({})
+    return profile.stage(name, rows)
@@ -0,0 +1,156 @@
+"""
+Persistent price history for period-over-period drift checks.
+
+Cleaned audit frames are ingested into a local SQLite database as one row
+per customer, material, day and upload: the day's rate total and line count
+in integer rate units. Rows are indexed on (customer, material, day), so
+the drift audit (audit_core.audit_price_drift) finds each pair's latest
+earlier price level with an index lookup instead of re-reading old files.
+An upload is ingested at most once, recognised by its content digest.
+"""
+
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from audit_core import to_rate_units
+
+# Rates are stored at this many decimal places, finer than any compare precision in use
+HISTORY_PRECISION = 4
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    digest TEXT NOT NULL UNIQUE,
+    ingested_at TEXT NOT NULL,
+    lines INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS prices (
+    customer TEXT NOT NULL,
+    material TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    rate_sum INTEGER NOT NULL,
+    lines INTEGER NOT NULL,
+    batch_id INTEGER NOT NULL REFERENCES batches(id)
+);
+CREATE INDEX IF NOT EXISTS prices_by_key ON prices (customer, material, day);
+"""
+
+# Latest history day before each wanted pair's cutoff, then that day's level
+_BASELINE_QUERY = """
+SELECT w.customer, w.material, p.day, SUM(p.rate_sum), SUM(p.lines)
+FROM want w
+JOIN prices p ON p.customer = w.customer AND p.material = w.material AND p.day = (
+    SELECT MAX(q.day) FROM prices q
+    WHERE q.customer = w.customer AND q.material = w.material
+      AND q.day < w.before_day AND q.day >= w.since_day
+)
+GROUP BY w.customer, w.material, p.day
+"""
+
+
+def epoch_days(dates):
+    """Whole days since 1970-01-01 of a datetime Series, as int64."""
+    return dates.to_numpy().astype('datetime64[D]').astype('int64')
+
+
+def sales_keys(df_clean):
+    """Customer and material of every cleaned sales line as normalised strings."""
+    return (
+        df_clean['SOLD TO PARTY NAME'].astype(str).str.strip().to_numpy(dtype=object),
+        df_clean['MATERIAL CODE'].astype(str).str.strip().to_numpy(dtype=object),
+    )
+
+
+class PriceHistory:
+    """SQLite store of daily price levels per customer and material.
+
+    Every call opens its own connection, so one instance can be shared by
+    threads (e.g. Streamlit sessions).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def ingest(self, df_clean, source, digest):
+        """Add a cleaned audit frame; returns the rows stored, 0 if this digest is already in."""
+        if df_clean.empty:
+            return 0
+        customers, materials = sales_keys(df_clean)
+        daily = pd.DataFrame({
+            'customer': customers,
+            'material': materials,
+            'day': epoch_days(df_clean['SO CREATED ON']),
+            'rate': to_rate_units(df_clean['BASIC RATE'], HISTORY_PRECISION),
+        }).groupby(['customer', 'material', 'day'], sort=False)['rate'].agg(['sum', 'size'])
+
+        with closing(self._connect()) as conn, conn:
+            try:
+                batch_id = conn.execute(
+                    'INSERT INTO batches (source, digest, ingested_at, lines) VALUES (?, ?, ?, ?)',
+                    (source, digest, datetime.now().isoformat(timespec='seconds'), len(df_clean)),
+                ).lastrowid
+            except sqlite3.IntegrityError:
+                return 0
+            conn.executemany(
+                'INSERT INTO prices (customer, material, day, rate_sum, lines, batch_id) VALUES (?, ?, ?, ?, ?, ?)',
+                zip(
+                    daily.index.get_level_values(0), daily.index.get_level_values(1),
+                    daily.index.get_level_values(2).tolist(), daily['sum'].tolist(), daily['size'].tolist(),
+                    [batch_id] * len(daily),
+                ),
+            )
+        return len(daily)
+
+    def baselines(self, customers, materials, before_days, since_days=None):
+        """Latest price level of each (customer, material) strictly before its cutoff day.
+
+        Returns a DataFrame with customer, material, day and rate (the mean
+        rate of that day across uploads); pairs without earlier history are
+        absent. since_days optionally bounds how far back a level may be.
+        """
+        if since_days is None:
+            since_days = np.full(len(customers), np.iinfo('int64').min)
+        with closing(self._connect()) as conn:
+            conn.execute(
+                'CREATE TEMP TABLE want (customer TEXT, material TEXT, before_day INTEGER, since_day INTEGER)'
+            )
+            conn.executemany(
+                'INSERT INTO want VALUES (?, ?, ?, ?)',
+                zip(customers, materials, np.asarray(before_days).tolist(), np.asarray(since_days).tolist()),
+            )
+            rows = conn.execute(_BASELINE_QUERY).fetchall()
+        out = pd.DataFrame(rows, columns=['customer', 'material', 'day', 'rate_sum', 'lines'])
+        out['rate'] = out['rate_sum'] / out['lines'] / 10 ** HISTORY_PRECISION
+        return out.drop(columns=['rate_sum', 'lines'])
+
+    def version(self):
+        """Changes whenever an upload is ingested; part of cached drift results' keys."""
+        with closing(self._connect()) as conn:
+            return conn.execute('SELECT COUNT(*), COALESCE(MAX(id), 0) FROM batches').fetchone()
+
+    def summary(self):
+        """Uploads, stored rows and covered date range, for display."""
+        with closing(self._connect()) as conn:
+            uploads, lines = conn.execute('SELECT COUNT(*), COALESCE(SUM(lines), 0) FROM batches').fetchone()
+            rows, first_day, last_day = conn.execute('SELECT COUNT(*), MIN(day), MAX(day) FROM prices').fetchone()
+
+        def _date(day):
+            return None if day is None else str(np.datetime64(day, 'D'))
+
+        return {'uploads': uploads, 'lines': lines, 'rows': rows,
+                'first_date': _date(first_day), 'last_date': _date(last_day)}
@@ -1,7 +1,214 @@
-import pandas as pd
+import argparse
+import hashlib
+import os
+import sys
 from datetime import datetime
 
-def audit_material_price_variance(input_file, output_file='price_variance_report.xlsx'):
+import audit_core
+from perf import PipelineProfile, stage
+
+# Columns are upper-cased on load, so the mapping is fixed
+COLUMN_MAPPING = {
+    'material_description': 'MATERIAL DESCRIPTION',
+    'date_column': 'SO CREATED ON',
+    'material_code': 'MATERIAL CODE',
+    'customer_name': 'SOLD TO PARTY NAME',
+    'basic_rate': 'BASIC RATE',
+}
+
+# Price master columns for --price-master, also upper-cased on load
+MASTER_MAPPING = {
+    'customer_name': 'SOLD TO PARTY NAME',
+    'material_code': 'MATERIAL CODE',
+    'valid_from': 'VALID FROM',
+    'valid_to': 'VALID TO',
+    'contract_rate': 'CONTRACT RATE',
+}
+
+def _input_sources(input_files, sheets):
+    """(name, path, sheet) for every file, with the requested sheets of each workbook."""
+    sources = []
+    for path in input_files:
+        available = audit_core.list_sheets(path)
+        if available == [None]:
+            chosen = [None]
+        elif sheets == ['*']:
+            chosen = available
+        elif sheets:
+            chosen = [sheet for sheet in available if sheet in sheets]
+        else:
+            chosen = available[:1]
+        sources += [(os.path.basename(path), path, sheet) for sheet in chosen]
+    return sources
+
+def _write_columnar_exports(output_file, fmt, frames):
+    """Write each named frame next to the report as <report stem>_<name><ext>."""
+    stem = os.path.splitext(output_file)[0]
+    ext = audit_core.COLUMNAR_FORMATS[fmt][0]
+    return [audit_core.export_frame(frame, fmt, f"{stem}_{name}{ext}") for name, frame in frames.items()]
+
+def _export_columnar(output_file, fmt, variance_df, df_clean, quality_issues, profile=None):
+    with stage(profile, 'columnar export', len(df_clean)):
+        exported = _write_columnar_exports(output_file, fmt, {
+            'variances': variance_df,
+            'clean': df_clean,
+            'quality': audit_core.quality_report_frame(quality_issues),
+        })
+    for path in exported:
+        print(f"✓ {fmt.capitalize()} export written: {path}")
+
+def _inputs_digest(paths):
+    """SHA-256 over the content of every input file, identifying this upload in the price history."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as fh:
+            for block in iter(lambda: fh.read(1024 * 1024), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+def run_price_history(df, df_clean, input_files, output_file, history_db, *, drift=False, add=False,
+                      date_options=None, profile=None):
+    """Check drift against the price history and/or add this upload to it."""
+    from price_history import PriceHistory
+    history = PriceHistory(history_db)
+    
+    if drift:
+        drift_df, _ = audit_core.audit_price_drift(df, COLUMN_MAPPING, history, profile=profile,
+                                                   **(date_options or {}))
+        if drift_df is None:
+            print("\n✓ No rate moved from its level in the price history.")
+        else:
+            drift_file = f"{os.path.splitext(output_file)[0]}_drift.xlsx"
+            with stage(profile, 'drift report writing', len(drift_df)):
+                metadata = {
+                    'Analysis Date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    'Source File': os.path.basename(input_files[0]),
+                    'Price History': history_db,
+                    'Drift Cases Found': len(drift_df),
+                }
+                with open(drift_file, 'wb') as fh:
+                    fh.write(audit_core.create_excel_download(drift_df, metadata=metadata).getvalue())
+            increases = int((drift_df['Drift'] == 'Increase').sum())
+            print(f"\n✓ Price drift report generated: {drift_file}")
+            print(f"  {increases} rate increases, {len(drift_df) - increases} decreases since the price history")
+    
+    if add:
+        with stage(profile, 'history ingest', len(df_clean)):
+            added = history.ingest(df_clean, ', '.join(os.path.basename(p) for p in input_files),
+                                   _inputs_digest(input_files))
+        print(f"✓ Added {added:,} daily price levels to {history_db}" if added
+              else "✓ This input is already in the price history")
+
+def run_contract_check(df, input_files, output_file, price_master_path, *, date_options=None, profile=None):
+    """Reconcile billed rates with a contract price master and write <report>_contract.xlsx."""
+    master = audit_core.read_table(price_master_path)
+    master.columns = [str(col).upper() for col in master.columns]
+    missing_cols = [col for col in MASTER_MAPPING.values() if col not in master.columns]
+    if missing_cols:
+        print(f"✗ Price master is missing columns: {missing_cols}")
+        return
+    # A QUANTITY column turns per-unit rate gaps into rupee impact
+    mapping = {**COLUMN_MAPPING, 'quantity': 'QUANTITY'} if 'QUANTITY' in df.columns else COLUMN_MAPPING
+    contract_df, _ = audit_core.audit_contract_price(df, mapping, master, MASTER_MAPPING, profile=profile,
+                                                     **(date_options or {}))
+    if contract_df is None:
+        print("\n✓ Every sales line covered by a valid contract was billed at the contract rate.")
+        return
+    contract_file = f"{os.path.splitext(output_file)[0]}_contract.xlsx"
+    with stage(profile, 'contract report writing', len(contract_df)):
+        metadata = {
+            'Analysis Date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'Source File': os.path.basename(input_files[0]),
+            'Price Master': os.path.basename(price_master_path),
+            'Contract Deviations Found': len(contract_df),
+        }
+        with open(contract_file, 'wb') as fh:
+            fh.write(audit_core.create_excel_download(contract_df, metadata=metadata).getvalue())
+    under = int((contract_df['Billing Status'] == 'Under-billed').sum())
+    print(f"\n✓ Contract price report generated: {contract_file}")
+    print(f"  {under} under-billed and {len(contract_df) - under} over-billed lines")
+
+def query_input(input_file, sql, *, extra_inputs=None, sheets=None, max_rows=None, output_file=None):
+    """Run SQL over the input as tables upload, clean and variances; print the result or save it as CSV."""
+    import sql_console
+    
+    if extra_inputs or sheets:
+        df = audit_core.read_sources(_input_sources([input_file, *(extra_inputs or [])], sheets))
+    else:
+        df = audit_core.read_table(input_file)
+    df.columns = [col if col in audit_core.SOURCE_COLUMNS else str(col).upper() for col in df.columns]
+    tables = {'upload': df, 'clean': None, 'variances': None}
+    if all(col in df.columns for col in COLUMN_MAPPING.values()):
+        tables['variances'], tables['clean'] = audit_core.audit_material_price_variance(df, COLUMN_MAPPING)
+    
+    result, truncated, seconds = sql_console.run_query(
+        sql, tables, max_rows=max_rows or sql_console.DEFAULT_MAX_ROWS
+    )
+    if result is None:
+        print(f"✓ Done in {seconds:.3f}s")
+        return
+    if output_file:
+        result.to_csv(output_file, index=False)
+        print(f"✓ {len(result):,} rows written to {output_file} in {seconds:.3f}s")
+    else:
+        print(result.to_string(index=False))
+        print(f"\n{len(result):,} rows in {seconds:.3f}s")
+    if truncated:
+        print(f"(result cut off at {len(result):,} rows; raise --max-rows to see more)")
+
+def _quality_check(df, required_cols, profile=None, date_options=None):
+    with stage(profile, 'quality check', len(df)):
+        return audit_core.analyze_data_quality(df, critical_columns=required_cols, column_mapping=COLUMN_MAPPING,
+                                               **(date_options or {}))
+
+def _read_with_ingestion_profile(input_file, profiles_path, stats=None):
+    """Read the input with the saved ingestion profile of its header, if there is one.
+
+    Returns (df, ingestion profile); mapped columns are renamed to the
+    names in COLUMN_MAPPING so the file needn't use them.
+    """
+    import ingestion_profiles
+    
+    store = ingestion_profiles.IngestionProfiles(profiles_path)
+    if not len(store):
+        return audit_core.read_table(input_file, stats=stats), None
+    ingest_profile = store.match(ingestion_profiles.read_header(input_file))
+    if ingest_profile is None:
+        return audit_core.read_table(input_file, stats=stats), None
+    df = ingestion_profiles.read_with_profile(input_file, None, ingest_profile, stats=stats)
+    mapping = ingest_profile['mapping']
+    df = df.rename(columns={mapping[field]: col for field, col in COLUMN_MAPPING.items() if field in mapping})
+    return df, ingest_profile
+
+def save_ingestion_profile(df, profiles_path, name, extra_columns=()):
+    """Save the layout of a just-read input (original column names) as an ingestion profile."""
+    import ingestion_profiles
+    
+    mapping = {field: col for col in df.columns for field, wanted in COLUMN_MAPPING.items()
+               if str(col).upper() == wanted}
+    if len(mapping) < len(COLUMN_MAPPING):
+        print("✗ Ingestion profile not saved: the input lacks required columns")
+        return
+    wanted_extra = {str(col).upper() for col in extra_columns}
+    ingest_profile = ingestion_profiles.build_profile(
+        name, df, mapping, extra_columns=[col for col in df.columns if str(col).upper() in wanted_extra]
+    )
+    ingestion_profiles.IngestionProfiles(profiles_path).save(ingest_profile)
+    print(f"✓ Ingestion profile '{name}' saved to {profiles_path} "
+          f"({len(ingest_profile['usecols'])} of {len(df.columns)} columns, "
+          f"date format {ingest_profile['date_format'] or 'inferred per file'})")
+
+def write_issue_rows(quality_issues, path):
+    """Stream every row with a data quality issue to a CSV file."""
+    with open(path, 'w', encoding='utf-8', newline='') as fh:
+        lines = audit_core.write_issue_rows(quality_issues, fh)
+    print(f"✓ Issue rows written: {path} ({lines:,} issue rows, "
+          f"{quality_issues['critical_issue_rows']:,} rows excluded from the audit)")
+
+def audit_material_price_variance(input_file, output_file='price_variance_report.xlsx', profile=None,
+                                  extra_inputs=None, sheets=None, export_format=None,
+                                  history_db=None, drift=False, add_to_history=False, issue_rows=None,
+                                  profiles_path=None, save_profile=None, group_by=None, price_master=None):
     """
     Audits material sales to identify when same customer bought same material 
     on same date at different basic rates.
@@ -9,22 +216,63 @@ def audit_material_price_variance(input_file, output_file='price_variance_report
     Parameters:
     input_file: Path to input Excel/CSV file
     output_file: Path to output Excel file (default: price_variance_report.xlsx)
+    profile: Optional perf.PipelineProfile that records per-stage timings
+    extra_inputs: More Excel/CSV files combined with input_file
+    sheets: Workbook sheets to read (['*'] for all); default is the first sheet
+    export_format: Also write variances, cleaned data and quality report as 'parquet' or 'arrow'
+    history_db: Price history database used by drift and add_to_history
+    drift: Also compare rates with the price history and write <report>_drift.xlsx
+    add_to_history: Store this input's cleaned lines in the price history
+    issue_rows: Also write every row with a data quality issue to this CSV file
+    profiles_path: Ingestion profile file; a single input whose header has a
+        saved profile is read with its column mapping, projection, dtypes and date format
+    save_profile: Save the single input's layout under this name in profiles_path
+    group_by: More columns (e.g. PLANT) that split the customer + material + date groups
+    price_master: Contract price master file; billed rates are also checked
+        against it and written to <report>_contract.xlsx
+    
+    Returns the number of variance cases found (0 when there are none), or
+    None when the input could not be read or the report could not be written.
     """
     
-    # Read the input file
+    # Read the input file(s)
+    ingest_profile = None
     try:
-        if input_file.endswith('.csv'):
-            df = pd.read_csv(input_file)
-        else:
-            df = pd.read_excel(input_file)
+        with stage(profile, 'file parsing') as record:
+            if extra_inputs or sheets:
+                # Parsed in parallel; rows are tagged with source file, sheet and row
+                df = audit_core.read_sources(_input_sources([input_file, *(extra_inputs or [])], sheets))
+            elif profiles_path and not save_profile:
+                df, ingest_profile = _read_with_ingestion_profile(input_file, profiles_path, stats=record)
+            else:
+                df = audit_core.read_table(input_file, stats=record)
+            record['rows_out'] = len(df)
+        if profile is not None:
+            profile.context.update({
+                'file': input_file,
+                'file_mb': round(os.path.getsize(input_file) / 1024 ** 2, 2),
+                'rows': len(df),
+                'columns': len(df.columns),
+            })
         
         print(f"✓ File loaded successfully. Total records: {len(df)}")
+        if record.get('rows_per_sec'):
+            print(f"✓ Parsed with the {record['reader']} reader at {record['rows_per_sec']:,} rows/s")
+        if ingest_profile is not None:
+            print(f"✓ Ingestion profile '{ingest_profile['name']}' matched: "
+                  f"read {len(df.columns)} of {len(ingest_profile['columns'])} columns")
     except Exception as e:
         print(f"✗ Error reading file: {e}")
         return
     
-    # Normalize column names to uppercase for consistency
-    df.columns = df.columns.str.upper()
+    if save_profile and profiles_path:
+        try:
+            save_ingestion_profile(df, profiles_path, save_profile, group_by or ())
+        except Exception as e:
+            print(f"✗ Error saving ingestion profile: {e}")
+    
+    # Normalize column names to uppercase for consistency (source tags keep their names)
+    df.columns = [col if col in audit_core.SOURCE_COLUMNS else str(col).upper() for col in df.columns]
     
     # Required columns (uppercase)
     required_cols = [
@@ -41,62 +289,87 @@ def audit_material_price_variance(input_file, output_file='price_variance_report
         print(f"✗ Missing required columns: {missing_cols}")
         return
     
-    # Convert 'SO CREATED ON' to datetime
-    df['SO CREATED ON'] = pd.to_datetime(df['SO CREATED ON'], errors='coerce')
+    group_by = [str(col).upper() for col in group_by or ()]
+    missing_keys = [col for col in group_by if col not in df.columns]
+    if missing_keys:
+        print(f"✗ Missing grouping columns: {missing_keys}")
+        return
     
-    # Remove rows with missing critical data
-    df_clean = df.dropna(subset=[
-        'MATERIAL CODE',
-        'SO CREATED ON',
-        'SOLD TO PARTY NAME',
-        'BASIC RATE'
-    ])
+    # A matched profile pins the date format, so it needn't be inferred
+    date_options = {}
+    if ingest_profile is not None:
+        date_options = {'date_format': ingest_profile['date_format'], 'dayfirst': ingest_profile['dayfirst']}
+    
+    keys = [*audit_core.WITHIN_KEYS, *group_by] if group_by else None
+    variance_df, df_clean = audit_core.audit_material_price_variance(df, COLUMN_MAPPING, keys=keys, profile=profile,
+                                                                     **date_options)
     
     print(f"✓ Records after cleaning: {len(df_clean)}")
     
-    # Group by customer, material code, and date
-    grouped = df_clean.groupby(['SOLD TO PARTY NAME', 'MATERIAL CODE', 'SO CREATED ON'])
+    if history_db and (drift or add_to_history):
+        try:
+            run_price_history(df, df_clean, [input_file, *(extra_inputs or [])], output_file, history_db,
+                              drift=drift, add=add_to_history, date_options=date_options, profile=profile)
+        except Exception as e:
+            print(f"✗ Price history error: {e}")
     
-    variance_groups = []
+    if price_master:
+        try:
+            run_contract_check(df, [input_file, *(extra_inputs or [])], output_file, price_master,
+                               date_options=date_options, profile=profile)
+        except Exception as e:
+            print(f"✗ Contract price check error: {e}")
     
-    for (party_name, material_code, doc_date), group in grouped:
-        unique_rates = group['BASIC RATE'].unique()
-        
-        if len(unique_rates) > 1:
-            max_rate = group['BASIC RATE'].max()
-            min_rate = group['BASIC RATE'].min()
-            
-            row_label = f"{party_name} | {material_code} | {doc_date.strftime('%Y-%m-%d')}"
-            
-            variance_groups.append({
-                'Customer_Material_Date': row_label,
-                'Max Rate': max_rate,
-                'Min Rate': min_rate,
-                'Diff': round(max_rate - min_rate, 2)
-            })
+    quality_issues = None
+    if issue_rows:
+        try:
+            quality_issues = _quality_check(df, required_cols, profile, date_options)
+            write_issue_rows(quality_issues, issue_rows)
+        except Exception as e:
+            print(f"✗ Error writing issue rows: {e}")
+            return None
     
-    if not variance_groups:
+    if variance_df is None:
         print("\n✓ No price variances detected. All materials have consistent basic rates.")
-        return
-    
-    # Create DataFrame from variance records
-    variance_df = pd.DataFrame(variance_groups)
-    
-    # Sort by difference descending
-    variance_df = variance_df.sort_values('Diff', ascending=False)
+        if export_format:
+            # Pipelines still get the cleaned data and quality report, beside an empty variances file
+            try:
+                if quality_issues is None:
+                    quality_issues = _quality_check(df, required_cols, profile, date_options)
+                _export_columnar(output_file, export_format, audit_core.empty_variance_frame(COLUMN_MAPPING, keys),
+                                 df_clean, quality_issues, profile)
+            except Exception as e:
+                print(f"✗ Error writing {export_format} exports: {e}")
+                return None
+        return 0
     
     # Save to Excel
     try:
-        variance_df.to_excel(output_file, index=False, sheet_name='Price Variances')
+        if quality_issues is None:
+            quality_issues = _quality_check(df, required_cols, profile, date_options)
+        with stage(profile, 'report writing', len(variance_df)):
+            metadata = {
+                'Analysis Date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'Source File': os.path.basename(input_file),
+                'Total Records': len(df),
+                'Records Analyzed': len(df_clean),
+                'Variance Cases Found': len(variance_df),
+            }
+            report = audit_core.create_excel_download(variance_df, metadata=metadata, quality_issues=quality_issues)
+            with open(output_file, 'wb') as fh:
+                fh.write(report.getvalue())
         
         print(f"\n✓ Price variance report generated: {output_file}")
+        
+        if export_format:
+            _export_columnar(output_file, export_format, variance_df, df_clean, quality_issues, profile)
         print("\n" + "="*60)
         print("AUDIT SUMMARY")
         print("="*60)
         print(f"Total Variance Cases: {len(variance_df)}")
-        print(f"Average Price Difference: {round(variance_df['Diff'].mean(), 2)}")
-        print(f"Maximum Price Difference: {round(variance_df['Diff'].max(), 2)}")
-        print(f"Minimum Price Difference: {round(variance_df['Diff'].min(), 2)}")
+        print(f"Average Price Difference: {round(variance_df['Difference'].mean(), 2)}")
+        print(f"Maximum Price Difference: {round(variance_df['Difference'].max(), 2)}")
+        print(f"Minimum Price Difference: {round(variance_df['Difference'].min(), 2)}")
         print("="*60)
         
         # Show top 10 variances
@@ -105,19 +378,137 @@ def audit_material_price_variance(input_file, output_file='price_variance_report
     
     except Exception as e:
         print(f"✗ Error writing output file: {e}")
+        return None
+    
+    return len(variance_df)
 
 # Example usage
 if __name__ == "__main__":
-    input_file = 'input.xlsx'  # replace with your actual file
-    output_file = 'material_price_variance_audit_report.xlsx'
+    parser = argparse.ArgumentParser(description="Material price variance audit")
+    parser.add_argument('input_file', nargs='?', default='input.xlsx', help="Input Excel/CSV file")
+    parser.add_argument('output_file', nargs='?', default='material_price_variance_audit_report.xlsx',
+                        help="Output Excel report")
+    parser.add_argument('--extra-input', action='append', default=[], metavar='FILE',
+                        help="Another Excel/CSV file to combine with the input (repeatable)")
+    parser.add_argument('--sheet', action='append', default=[], metavar='NAME',
+                        help="Workbook sheet to read (repeatable, '*' for all sheets; default: first sheet)")
+    parser.add_argument('--export', choices=sorted(audit_core.COLUMNAR_FORMATS), metavar='FORMAT',
+                        help="Also write variances, cleaned data and quality report as parquet or arrow files")
+    parser.add_argument('--issue-rows', metavar='CSV',
+                        help="Write every row with a data quality issue (missing value, bad date or rate, "
+                             "duplicate) to this CSV file")
+    parser.add_argument('--profiles', metavar='PATH', default=None,
+                        help="Ingestion profile file; an input whose header has a saved profile is read with its "
+                             "mapping, columns, dtypes and date format (default: $SALES_AUDIT_PROFILES or "
+                             "~/.sales_audit/ingestion_profiles.json)")
+    parser.add_argument('--no-profiles', action='store_true', help="Don't look up ingestion profiles")
+    parser.add_argument('--save-profile', metavar='NAME',
+                        help="Save the input's layout as an ingestion profile named NAME")
+    parser.add_argument('--group-by', action='append', default=[], metavar='COL',
+                        help="Also group by this column, e.g. PLANT (repeatable)")
+    parser.add_argument('--price-master', metavar='PATH',
+                        help="Also check billed rates against this contract price master (columns SOLD TO PARTY NAME, "
+                             "MATERIAL CODE, VALID FROM, VALID TO, CONTRACT RATE) and write <report>_contract.xlsx")
+    parser.add_argument('--history-db', metavar='PATH',
+                        help="Price history database (SQLite) for --drift and --add-to-history")
+    parser.add_argument('--drift', action='store_true',
+                        help="Also compare each customer's rates with the price history (writes <report>_drift.xlsx)")
+    parser.add_argument('--add-to-history', action='store_true',
+                        help="Store this input's cleaned lines in the price history for later drift checks")
+    parser.add_argument('--query', metavar='SQL',
+                        help="Run SQL over the input (tables: upload, clean, variances) instead of writing a report; "
+                             "needs duckdb. The result is printed, or saved as CSV to output_file if given")
+    parser.add_argument('--max-rows', type=int, help="Rows returned by --query (default: 10000)")
+    parser.add_argument('--watch', metavar='DIR',
+                        help="Keep running and audit every new or changed Excel/CSV file dropped into DIR")
+    parser.add_argument('--reports-dir', metavar='DIR',
+                        help="Where --watch writes reports and its processed-file ledger (default: DIR/reports)")
+    parser.add_argument('--workers', type=int, default=2, help="Parallel audits in --watch mode (default: 2)")
+    parser.add_argument('--max-pending', type=int, default=4,
+                        help="Audits queued or running at once in --watch mode before polling pauses (default: 4)")
+    parser.add_argument('--poll-seconds', type=float, default=30.0,
+                        help="Seconds between directory scans in --watch mode; files must be this old (default: 30)")
+    parser.add_argument('--once', action='store_true',
+                        help="With --watch, audit the files already there (waiting for just-written ones to settle) and exit")
+    parser.add_argument('--backend', choices=sorted(audit_core.BACKENDS),
+                        help="Dataframe engine for the audit (default: $SALES_AUDIT_BACKEND or pandas); "
+                             "polars runs the cleaning and the within-customer grouping, while the contract and "
+                             "drift checks use it for cleaning only. Reports are identical either way")
+    parser.add_argument('--excel-reader', choices=['auto', 'calamine', 'openpyxl', 'pandas'],
+                        help="Workbook parser (default: $SALES_AUDIT_EXCEL_READER or auto: calamine if installed, "
+                             "else streaming openpyxl)")
+    parser.add_argument('--perf-log', action='store_true',
+                        help="Emit per-stage timing and memory as JSON lines on stderr")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Record peak memory per stage with tracemalloc (slower)")
+    args = parser.parse_args()
+    if (args.drift or args.add_to_history) and not args.history_db:
+        parser.error("--drift and --add-to-history need --history-db")
+    if args.save_profile and (args.extra_input or args.sheet or args.no_profiles):
+        parser.error("--save-profile needs a single input file and profiles enabled")
+    if args.watch and (args.save_profile or args.issue_rows or args.extra_input):
+        parser.error("--save-profile, --issue-rows and --extra-input name single files and can't be used with --watch")
+    if args.backend:
+        # An environment setting, so --watch worker processes use it too
+        os.environ['SALES_AUDIT_BACKEND'] = args.backend
+    if args.excel_reader:
+        os.environ['SALES_AUDIT_EXCEL_READER'] = args.excel_reader
+    try:
+        audit_core.get_backend()
+        if args.excel_reader == 'calamine':
+            import excel_reader
+            excel_reader.reader_chain(None, 'calamine')
+    except (ImportError, ValueError) as e:
+        parser.error(str(e))
+    
+    if args.query:
+        try:
+            query_input(args.input_file, args.query, extra_inputs=args.extra_input, sheets=args.sheet,
+                        max_rows=args.max_rows,
+                        output_file=args.output_file if args.output_file != parser.get_default('output_file') else None)
+        except Exception as e:
+            print(f"✗ Query failed: {e}")
+            sys.exit(1)
+        sys.exit(0)
+    
+    from ingestion_profiles import DEFAULT_PROFILES_PATH
+    profiles_path = None if args.no_profiles else args.profiles or DEFAULT_PROFILES_PATH
+    
+    if args.watch:
+        from watcher import FolderWatcher
+        FolderWatcher(
+            args.watch, args.reports_dir,
+            workers=args.workers, max_pending=args.max_pending, poll_seconds=args.poll_seconds,
+            export_format=args.export,
+            audit_options={
+                'sheets': args.sheet, 'profiles_path': profiles_path, 'group_by': args.group_by,
+                'price_master': args.price_master, 'history_db': args.history_db, 'drift': args.drift,
+                'add_to_history': args.add_to_history,
+            },
+        ).run(once=args.once)
+        sys.exit(0)
+    
+    input_file = args.input_file
+    output_file = args.output_file
+    profile = PipelineProfile(trace_memory=args.trace_memory) if args.perf_log else None
     
     print("="*60)
     print("MATERIAL PRICE VARIANCE AUDIT TOOL")
     print("="*60)
-    print("Logic: SOLD TO PARTY NAME + MATERIAL CODE + SAME DATE")
+    print("Logic: SOLD TO PARTY NAME + MATERIAL CODE + SAME DATE"
+          + ''.join(f" + {col.upper()}" for col in args.group_by))
     print("="*60)
     print()
     
-    audit_material_price_variance(input_file, output_file)
+    audit_material_price_variance(input_file, output_file, profile=profile,
+                                  extra_inputs=args.extra_input, sheets=args.sheet, export_format=args.export,
+                                  history_db=args.history_db, drift=args.drift, add_to_history=args.add_to_history,
+                                  issue_rows=args.issue_rows,
+                                  profiles_path=profiles_path,
+                                  save_profile=args.save_profile, group_by=args.group_by,
+                                  price_master=args.price_master)
+    
+    if profile is not None:
+        profile.log_json(sys.stderr)
     
     print("\nAudit complete!")
@@ -0,0 +1,443 @@
+"""
+Local HTTP/JSON audit service.
+
+Wraps the audit engines in a small localhost-only HTTP server so other
+systems (e.g. the ERP pipeline) can run audits without the Streamlit UI.
+Jobs run in a bounded process pool; a submitted job gets an id that is
+polled for status, and finished results are downloaded as CSV, Parquet,
+Arrow IPC or an Excel report.
+
+Endpoints:
+    POST   /jobs                       Submit a job (JSON body with a file path,
+                                       or the raw file as the body, see below)
+    GET    /jobs                       List jobs
+    GET    /jobs/<id>                  Job status and result summary
+    GET    /jobs/<id>/result?format=   Result as csv (default), parquet, arrow or xlsx, or
+                                       format=issues for every row with a data quality issue, or
+                                       format=rates for every customer's rate per case (across mode
+                                       with "customer_rates": true)
+    DELETE /jobs/<id>                  Forget a finished job and its files
+    GET    /health                     Worker and queue status
+
+A JSON submission looks like:
+    {"file_path": "/data/ledger.csv", "mode": "within",
+     "mapping": {"material_description": "MATERIAL DESCRIPTION", "date_column": "SO CREATED ON",
+                 "material_code": "MATERIAL CODE", "customer_name": "SOLD TO PARTY NAME",
+                 "basic_rate": "BASIC RATE"},
+     "date_format": "%d-%m-%Y", "dayfirst": false, "rate_precision": 2}
+
+Contract checks (mode "contract") also take "price_master_path" and
+"master_mapping". Cross-customer checks (mode "across") take
+"customer_rates": true to also keep every customer's rate per case. Within and
+across checks take "keys", the ordered grouping keys: mapping fields and/or
+other columns, e.g. ["material_code", "date_column", "PLANT"]. To upload
+instead, POST the file itself with the options in the query string, the
+mapping and keys as JSON:
+    curl -X POST --data-binary @ledger.csv \
+        "http://127.0.0.1:8765/jobs?filename=ledger.csv&mode=within&mapping=%7B...%7D"
+
+Usage:
+    python src/service.py
+    python src/service.py --port 8765 --workers 4 --max-queue 16
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import audit_core
+from perf import PipelineProfile
+
+MODES = ('within', 'across', 'contract')
+RESULT_FORMATS = {
+    'csv': ('text/csv', 'result.csv'),
+    'parquet': ('application/vnd.apache.parquet', 'result.parquet'),
+    'arrow': ('application/vnd.apache.arrow.file', 'result.arrow'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'result.xlsx'),
+    'issues': ('text/csv', 'issues.csv'),
+    'rates': ('text/csv', 'customer_rates.csv'),
+}
+# Finished jobs kept before the oldest are forgotten and their files removed
+MAX_FINISHED_JOBS = 500
+_UPLOAD_CHUNK = 1024 * 1024
+
+
+def run_audit_job(job_dir, request):
+    """Run one audit in a worker process and leave its result in job_dir.
+
+    Returns a JSON-serializable summary; the result frame and quality issues
+    are pickled to job_dir for the server to render on download.
+    """
+    profile = PipelineProfile()
+    with profile.stage('file parsing') as record:
+        df = audit_core.read_table(request['file_path'], stats=record)
+        record['rows_out'] = len(df)
+
+    options = dict(
+        date_format=request.get('date_format'),
+        dayfirst=bool(request.get('dayfirst', False)),
+        rate_precision=int(request.get('rate_precision', audit_core.RATE_PRECISION)),
+        profile=profile,
+    )
+    mode = request['mode']
+    if mode in ('within', 'across'):
+        options['keys'] = request.get('keys')
+    customer_rates = None
+    if mode == 'within':
+        variance_df, df_clean = audit_core.audit_material_price_variance(df, request['mapping'], **options)
+    elif mode == 'across' and request.get('customer_rates'):
+        variance_df, df_clean, case_rows = audit_core.audit_cross_customer_variance(
+            df, request['mapping'], return_index=True, **options
+        )
+        if variance_df is not None:
+            customer_rates = audit_core.get_case_rates(case_rows['rates'], variance_df.index)
+    elif mode == 'across':
+        variance_df, df_clean = audit_core.audit_cross_customer_variance(df, request['mapping'], **options)
+    else:
+        price_master = audit_core.read_table(request['price_master_path'])
+        variance_df, df_clean = audit_core.audit_contract_price(
+            df, request['mapping'], price_master, request['master_mapping'], **options
+        )
+    with profile.stage('quality check', len(df)):
+        quality_issues = audit_core.analyze_data_quality(
+            df, critical_columns=list(request['mapping'].values()), column_mapping=request['mapping'],
+            date_format=options['date_format'], dayfirst=options['dayfirst'],
+        )
+
+    with open(os.path.join(job_dir, 'result.pkl'), 'wb') as fh:
+        pickle.dump({'variance_df': variance_df, 'quality_issues': quality_issues, 'customer_rates': customer_rates},
+                    fh, protocol=pickle.HIGHEST_PROTOCOL)
+    return {
+        'rows': len(df),
+        'rows_analyzed': len(df_clean),
+        'cases': 0 if variance_df is None else len(variance_df),
+        'total_difference': 0.0 if variance_df is None else float(variance_df['Difference'].sum()),
+        'duplicates': int(quality_issues['duplicates']),
+        'rows_with_critical_issues': quality_issues['critical_issue_rows'],
+        'stages': profile.to_records(),
+    }
+
+
+def _validate_request(request):
+    """Return an error message for an unusable job request, or None."""
+    if request.get('mode', 'within') not in MODES:
+        return f"mode must be one of {', '.join(MODES)}"
+    mapping = request.get('mapping')
+    required = ['material_description', 'date_column', 'material_code', 'customer_name', 'basic_rate']
+    if not isinstance(mapping, dict) or any(not mapping.get(field) for field in required):
+        return f"mapping must name a column for each of {', '.join(required)}"
+    if not request.get('file_path') or not os.path.isfile(request['file_path']):
+        return "file_path must point to an existing file"
+    if request.get('mode') == 'contract':
+        if not request.get('price_master_path') or not os.path.isfile(request['price_master_path']):
+            return "contract mode needs price_master_path pointing to an existing file"
+        if not isinstance(request.get('master_mapping'), dict):
+            return "contract mode needs a master_mapping"
+    keys = request.get('keys')
+    if keys is not None and (not isinstance(keys, list) or not all(isinstance(key, str) and key for key in keys)):
+        return "keys must be a list of mapping fields and/or column names"
+    return None
+
+
+class JobQueue:
+    """Bounded process-pool job queue with an in-memory job registry."""
+
+    def __init__(self, workers, max_queue, spool_dir):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.spool_dir = spool_dir
+        os.makedirs(spool_dir, exist_ok=True)
+        # spawn: forking a threaded server can deadlock the children
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def new_job_dir(self):
+        job_id = uuid.uuid4().hex[:12]
+        job_dir = os.path.join(self.spool_dir, job_id)
+        os.makedirs(job_dir)
+        return job_id, job_dir
+
+    def active(self):
+        return sum(1 for job in self.jobs.values() if job['status'] in ('queued', 'running'))
+
+    def submit(self, job_id, job_dir, request):
+        """Queue a job; returns False when the queue is full."""
+        with self._lock:
+            if self.active() >= self.workers + self.max_queue:
+                return False
+            job = {
+                'id': job_id, 'status': 'queued', 'mode': request['mode'],
+                'file': os.path.basename(request['file_path']),
+                'submitted_at': time.time(), 'finished_at': None,
+                'summary': None, 'error': None, 'dir': job_dir,
+            }
+            self.jobs[job_id] = job
+        future = self.pool.submit(run_audit_job, job_dir, request)
+        future.add_done_callback(lambda f: self._finish(job_id, f))
+        job['future'] = future
+        return True
+
+    def _finish(self, job_id, future):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            job['finished_at'] = time.time()
+            try:
+                job['summary'] = future.result()
+                job['status'] = 'done'
+            except Exception as e:
+                job['status'] = 'failed'
+                job['error'] = f"{type(e).__name__}: {e}"
+            self._expire_locked()
+
+    def _expire_locked(self):
+        finished = [job for job in self.jobs.values() if job['status'] in ('done', 'failed')]
+        for job in sorted(finished, key=lambda j: j['finished_at'])[:-MAX_FINISHED_JOBS or None]:
+            self.jobs.pop(job['id'], None)
+            shutil.rmtree(job['dir'], ignore_errors=True)
+
+    def status(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job['status'] == 'queued' and job.get('future') is not None and job['future'].running():
+                job['status'] = 'running'
+            return {k: v for k, v in job.items() if k not in ('dir', 'future')}
+
+    def list_jobs(self):
+        return [self.status(job_id) for job_id in list(self.jobs)]
+
+    def delete(self, job_id):
+        """Forget a finished job; returns False if it is unknown or still active."""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job['status'] in ('queued', 'running'):
+                return False
+            del self.jobs[job_id]
+        shutil.rmtree(job['dir'], ignore_errors=True)
+        return True
+
+    def result_path(self, job_id, fmt):
+        """Render (once) and return the path of a finished job's result in fmt; None if the job is gone."""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+        path = os.path.join(job['dir'], RESULT_FORMATS[fmt][1])
+        if os.path.exists(path):
+            return path
+        import pandas as pd
+        try:
+            with open(os.path.join(job['dir'], 'result.pkl'), 'rb') as fh:
+                result = pickle.load(fh)
+        except FileNotFoundError:
+            # Deleted or expired since the lookup
+            return None
+        variance_df = result['variance_df'] if result['variance_df'] is not None else pd.DataFrame()
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        if fmt == 'csv':
+            variance_df.to_csv(tmp_path, index=False)
+        elif fmt == 'issues':
+            with open(tmp_path, 'w', encoding='utf-8', newline='') as fh:
+                audit_core.write_issue_rows(result['quality_issues'], fh)
+        elif fmt == 'rates':
+            customer_rates = result.get('customer_rates')
+            (customer_rates if customer_rates is not None else pd.DataFrame()).to_csv(tmp_path, index=False)
+        elif fmt in audit_core.COLUMNAR_FORMATS:
+            audit_core.export_frame(variance_df, fmt, tmp_path)
+        else:
+            metadata = {
+                'Analysis Date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'Source File': job['file'],
+                'Mode': job['mode'],
+                'Variance Cases Found': len(variance_df),
+            }
+            with open(tmp_path, 'wb') as fh:
+                fh.write(audit_core.create_excel_download(variance_df, metadata=metadata,
+                                                   quality_issues=result['quality_issues'],
+                                                   customer_rates=result.get('customer_rates')).getvalue())
+        os.replace(tmp_path, path)
+        return path
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class AuditRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'SalesAuditService/1.0'
+
+    @property
+    def queue(self):
+        return self.server.job_queue
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send_json(status, {'error': message})
+
+    def _route(self):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split('/') if p]
+        return parts, {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+    def do_GET(self):
+        parts, query = self._route()
+        if parts == ['health']:
+            self._send_json(HTTPStatus.OK, {
+                'status': 'ok', 'workers': self.queue.workers,
+                'active_jobs': self.queue.active(), 'max_queue': self.queue.max_queue,
+            })
+        elif parts == ['jobs']:
+            self._send_json(HTTPStatus.OK, {'jobs': self.queue.list_jobs()})
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            job = self.queue.status(parts[1])
+            if job is None:
+                self._error(HTTPStatus.NOT_FOUND, f"Unknown job {parts[1]}")
+            else:
+                self._send_json(HTTPStatus.OK, job)
+        elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'result':
+            self._send_result(parts[1], query.get('format', 'csv'))
+        else:
+            self._error(HTTPStatus.NOT_FOUND, f"No route for GET {self.path}")
+
+    def _send_result(self, job_id, fmt):
+        job = self.queue.status(job_id)
+        if job is None:
+            return self._error(HTTPStatus.NOT_FOUND, f"Unknown job {job_id}")
+        if fmt not in RESULT_FORMATS:
+            return self._error(HTTPStatus.BAD_REQUEST, f"format must be one of {', '.join(RESULT_FORMATS)}")
+        if job['status'] != 'done':
+            return self._error(HTTPStatus.CONFLICT, f"Job {job_id} is {job['status']}")
+        try:
+            path = self.queue.result_path(job_id, fmt)
+            fh = open(path, 'rb') if path is not None else None
+        except ImportError as e:
+            return self._error(HTTPStatus.NOT_IMPLEMENTED, f"{fmt} export needs an optional package: {e}")
+        except FileNotFoundError:
+            fh = None
+        if fh is None:
+            return self._error(HTTPStatus.NOT_FOUND, f"Unknown job {job_id}")
+        content_type, filename = RESULT_FORMATS[fmt]
+        with fh:
+            self.send_response(HTTPStatus.OK)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(os.fstat(fh.fileno()).st_size))
+            self.send_header('Content-Disposition', f'attachment; filename="{job_id}_{filename}"')
+            self.end_headers()
+            shutil.copyfileobj(fh, self.wfile)
+
+    def do_POST(self):
+        parts, query = self._route()
+        if parts != ['jobs']:
+            return self._error(HTTPStatus.NOT_FOUND, f"No route for POST {self.path}")
+        length = int(self.headers.get('Content-Length') or 0)
+        job_id, job_dir = self.queue.new_job_dir()
+        try:
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                request = json.loads(self.rfile.read(length) or b'{}')
+            else:
+                # Raw upload: stream the body to the job directory, options in the query string
+                filename = os.path.basename(query.get('filename', 'upload.csv'))
+                upload_path = os.path.join(job_dir, filename)
+                with open(upload_path, 'wb') as fh:
+                    remaining = length
+                    while remaining > 0:
+                        chunk = self.rfile.read(min(_UPLOAD_CHUNK, remaining))
+                        if not chunk:
+                            break
+                        fh.write(chunk)
+                        remaining -= len(chunk)
+                request = {k: v for k, v in query.items() if k != 'filename'}
+                for key in ('mapping', 'master_mapping', 'keys'):
+                    if key in request:
+                        request[key] = json.loads(request[key])
+                for key in ('dayfirst', 'customer_rates'):
+                    request[key] = str(request.get(key, '')).lower() in ('1', 'true', 'yes')
+                request['file_path'] = upload_path
+        except (ValueError, OSError) as e:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            return self._error(HTTPStatus.BAD_REQUEST, f"Could not read the request: {e}")
+
+        request.setdefault('mode', 'within')
+        error = _validate_request(request)
+        if error:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            return self._error(HTTPStatus.BAD_REQUEST, error)
+        if not self.queue.submit(job_id, job_dir, request):
+            shutil.rmtree(job_dir, ignore_errors=True)
+            self.send_response(HTTPStatus.SERVICE_UNAVAILABLE)
+            self.send_header('Retry-After', '5')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self._send_json(HTTPStatus.ACCEPTED, self.queue.status(job_id))
+
+    def do_DELETE(self):
+        parts, _ = self._route()
+        if len(parts) == 2 and parts[0] == 'jobs':
+            if self.queue.delete(parts[1]):
+                self._send_json(HTTPStatus.OK, {'deleted': parts[1]})
+            else:
+                self._error(HTTPStatus.CONFLICT, f"Job {parts[1]} is unknown or still running")
+        else:
+            self._error(HTTPStatus.NOT_FOUND, f"No route for DELETE {self.path}")
+
+    def log_message(self, format, *args):
+        sys.stderr.write(f"{self.log_date_time_string()} {format % args}\n")
+
+
+def make_server(host='127.0.0.1', port=8765, workers=2, max_queue=8, spool_dir=None):
+    """Create the HTTP server and its job queue (call serve_forever() to run)."""
+    spool_dir = spool_dir or os.path.join(tempfile.gettempdir(), 'sales-audit-jobs')
+    server = ThreadingHTTPServer((host, port), AuditRequestHandler)
+    server.job_queue = JobQueue(workers, max_queue, spool_dir)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the local audit HTTP service")
+    parser.add_argument('--host', default='127.0.0.1', help="Interface to bind (default: localhost only)")
+    parser.add_argument('--port', type=int, default=8765, help="Port to listen on")
+    parser.add_argument('--workers', type=int, default=max(1, min(4, (os.cpu_count() or 2) - 1)),
+                        help="Audits run concurrently")
+    parser.add_argument('--max-queue', type=int, default=16, help="Jobs waiting beyond the running ones")
+    parser.add_argument('--spool-dir', help="Where uploads and results are kept")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.workers, args.max_queue, args.spool_dir)
+    print(f"✓ Audit service on http://{args.host}:{args.port} "
+          f"({args.workers} workers, queue {args.max_queue}, spool {server.job_queue.spool_dir})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.job_queue.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Ad-hoc SQL over the audit frames with an embedded DuckDB engine.
+
+The uploaded ledger, the cleaned frame and the variance result are
+registered as the tables ``upload``, ``clean`` and ``variances``. Frames
+are handed to DuckDB as Arrow tables, which it scans faster than
+DataFrames, and queries run vectorized and multi-threaded inside the
+process. Converting a frame copies its text columns, so each frame is
+converted once and its Arrow table is kept for as long as the frame
+lives; later queries over the same frame reuse it. Frames are treated as
+read-only once queried. Reading or writing files from SQL is
+disabled. DuckDB is optional: install it with ``pip install duckdb``.
+"""
+
+import importlib.util
+import threading
+import time
+import weakref
+
+# Rows returned to the caller; larger results are cut off
+DEFAULT_MAX_ROWS = 10_000
+
+TABLE_DESCRIPTIONS = {
+    'upload': 'the uploaded ledger as read',
+    'clean': 'rows kept by the audit, with mapped columns renamed (SOLD TO PARTY NAME, BASIC RATE, ...)',
+    'variances': 'the variance cases of the last analysis',
+}
+
+EXAMPLE_QUERY = """SELECT Customer, COUNT(*) AS cases, SUM(Difference) AS total_difference
+FROM variances
+WHERE Difference > 50
+GROUP BY Customer
+ORDER BY total_difference DESC"""
+
+
+# id(frame) -> (weak reference to the frame, its Arrow table or the frame itself)
+_arrow_tables = {}
+_arrow_lock = threading.Lock()
+
+
+def duckdb_available():
+    return importlib.util.find_spec('duckdb') is not None
+
+
+def _as_arrow(df):
+    """Arrow table of df for DuckDB, cached per frame; df itself when a column can't convert (mixed types)."""
+    key = id(df)
+    with _arrow_lock:
+        ref, table = _arrow_tables.get(key, (None, None))
+    if ref is not None and ref() is df:
+        return table
+    table = _convert(df)
+    with _arrow_lock:
+        # The entry goes when the frame does, so a recycled id never finds a stale table
+        _arrow_tables[key] = (weakref.ref(df, lambda _, key=key: _forget(key)), table)
+    return table
+
+
+def _forget(key):
+    with _arrow_lock:
+        _arrow_tables.pop(key, None)
+
+
+def _convert(df):
+    try:
+        import pyarrow as pa
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except ImportError:
+        return df
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return df
+
+
+def run_query(sql, tables, *, max_rows=DEFAULT_MAX_ROWS):
+    """Run one SQL statement over the named DataFrames.
+
+    Returns (result, truncated, seconds); result holds at most max_rows rows.
+    Tables that are None are left out.
+    """
+    try:
+        import duckdb
+    except ImportError as e:
+        raise ImportError("The SQL console needs the 'duckdb' package (pip install duckdb)") from e
+
+    start = time.perf_counter()
+    with duckdb.connect(':memory:', config={'enable_external_access': False}) as conn:
+        for name, df in tables.items():
+            if df is not None:
+                conn.register(name, _as_arrow(df))
+        conn.execute('SET lock_configuration = true')
+        relation = conn.sql(sql)
+        if relation is None:
+            # Statements without a result set (SET, CREATE VIEW, ...)
+            return None, False, time.perf_counter() - start
+        result = relation.limit(max_rows + 1).df()
+    truncated = len(result) > max_rows
+    return result.head(max_rows), truncated, time.perf_counter() - start
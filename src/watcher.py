@@ -0,0 +1,237 @@
+"""
+Watch-folder mode: audit sales exports as they land in a directory.
+
+The watcher polls a directory for Excel/CSV files, waits until a file has
+stopped changing, and audits new or changed files with the sales.py
+pipeline in a bounded process pool. A file counts as changed when its size
+or mtime differs from the ledger and its SHA-256 differs too, so a file
+that was only touched is not audited again. When the pool is full, the
+poll stops submitting and the remaining files are picked up by later polls
+instead of piling up in memory.
+
+Every audit uses the same options as the command line it was started from
+(sheets, --group-by, ingestion profiles, price master, price history, backend
+and Excel reader), so a watched file gives the report a one-off run of
+sales.py would.
+
+Reports, their console logs and the processed-file ledger (processed.json)
+go to the reports directory; the ledger survives restarts.
+
+Usage:
+    python src/sales.py --watch /shared/erp-exports --reports-dir /shared/audit-reports
+    python src/sales.py --watch /shared/erp-exports --workers 2 --max-pending 4 --poll-seconds 60
+    python src/sales.py --watch /shared/erp-exports --group-by PLANT --price-master contracts.xlsx
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import redirect_stdout
+from datetime import datetime
+
+import audit_core
+
+WATCH_SUFFIXES = audit_core.CSV_SUFFIXES + ('.xlsx', '.xls')
+LEDGER_NAME = 'processed.json'
+_HASH_CHUNK = 1024 * 1024
+
+
+def file_digest(path):
+    """SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(_HASH_CHUNK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def audit_file(path, report_path, export_format=None, audit_options=None):
+    """Audit one file in a worker process; its console output goes to <report>.log.
+
+    audit_options are further keyword arguments of sales.audit_material_price_variance.
+    """
+    import sales
+
+    log_path = os.path.splitext(report_path)[0] + '.log'
+    with open(log_path, 'w', encoding='utf-8') as log, redirect_stdout(log):
+        cases = sales.audit_material_price_variance(path, report_path, export_format=export_format,
+                                                    **(audit_options or {}))
+    if cases is None:
+        raise RuntimeError(f"audit failed, see {log_path}")
+    return {'cases': cases, 'report': report_path if cases else None, 'log': log_path}
+
+
+class FolderWatcher:
+    """Polls a directory and audits new or changed files, at most max_pending at a time.
+
+    audit_options (e.g. group_by, profiles_path, sheets, price_master) are
+    passed to sales.audit_material_price_variance for every file.
+    """
+
+    def __init__(self, watch_dir, reports_dir=None, *, workers=2, max_pending=4, poll_seconds=30.0,
+                 settle_seconds=None, export_format=None, audit_options=None):
+        self.watch_dir = os.path.abspath(watch_dir)
+        self.reports_dir = os.path.abspath(reports_dir or os.path.join(watch_dir, 'reports'))
+        self.workers = workers
+        self.max_pending = max(max_pending, workers)
+        self.poll_seconds = poll_seconds
+        # A file whose mtime is this recent may still be being written
+        self.settle_seconds = poll_seconds if settle_seconds is None else settle_seconds
+        self.export_format = export_format
+        self.audit_options = dict(audit_options or {})
+        self.ledger_path = os.path.join(self.reports_dir, LEDGER_NAME)
+        os.makedirs(self.reports_dir, exist_ok=True)
+        self.ledger = self._load_ledger()
+        self._pending = {}  # path -> future
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _load_ledger(self):
+        try:
+            with open(self.ledger_path, encoding='utf-8') as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"✗ Ignoring unreadable ledger {self.ledger_path}: {e}", flush=True)
+            return {}
+
+    def _save_ledger_locked(self):
+        tmp_path = f"{self.ledger_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as fh:
+            json.dump(self.ledger, fh, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.ledger_path)
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def candidates(self, unsettled=False):
+        """(path, size, mtime_ns) of settled files in the watch directory that the ledger doesn't match.
+
+        With unsettled, the files that would match but were modified within
+        settle_seconds are returned instead.
+        """
+        now_ns = time.time_ns()
+        found = []
+        try:
+            entries = list(os.scandir(self.watch_dir))
+        except OSError as e:
+            print(f"✗ Cannot list {self.watch_dir}: {e}", flush=True)
+            return found
+        for entry in sorted(entries, key=lambda e: e.name):
+            # Skip hidden and Office lock files
+            if entry.name.startswith(('.', '~$')) or not entry.name.lower().endswith(WATCH_SUFFIXES):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue
+            if (now_ns - st.st_mtime_ns < self.settle_seconds * 1e9) != unsettled:
+                continue
+            record = self.ledger.get(entry.path)
+            if record and record['size'] == st.st_size and record['mtime_ns'] == st.st_mtime_ns:
+                continue
+            found.append((entry.path, st.st_size, st.st_mtime_ns))
+        return found
+
+    def poll(self):
+        """Submit settled new or changed files until the pool is full; returns the number submitted."""
+        submitted = 0
+        for path, size, mtime_ns in self.candidates():
+            with self._lock:
+                if path in self._pending:
+                    continue
+                if len(self._pending) >= self.max_pending:
+                    # Backpressure: later polls pick up the rest
+                    break
+            try:
+                digest = file_digest(path)
+                st = os.stat(path)
+            except OSError:
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                continue  # Still being written
+            record = self.ledger.get(path)
+            if record and record['sha256'] == digest:
+                # Touched or copied over with the same content
+                with self._lock:
+                    record.update(size=size, mtime_ns=mtime_ns)
+                    self._save_ledger_locked()
+                continue
+            stem = os.path.basename(path).split('.')[0]
+            report_path = os.path.join(self.reports_dir, f"{stem}_{digest[:10]}_price_variance_report.xlsx")
+            self._submit(path, report_path, {'size': size, 'mtime_ns': mtime_ns, 'sha256': digest})
+            submitted += 1
+        return submitted
+
+    def _submit(self, path, report_path, record):
+        if self._pool is None:
+            self._pool = self._new_pool()
+        try:
+            future = self._pool.submit(audit_file, path, report_path, self.export_format, self.audit_options)
+        except BrokenProcessPool:
+            # A crashed worker breaks the pool for good; start a fresh one
+            self._pool = self._new_pool()
+            future = self._pool.submit(audit_file, path, report_path, self.export_format, self.audit_options)
+        with self._lock:
+            self._pending[path] = future
+        print(f"→ Auditing {os.path.basename(path)}", flush=True)
+        future.add_done_callback(lambda f: self._finish(path, record, f))
+
+    def _finish(self, path, record, future):
+        if future.cancelled():
+            # Dropped at shutdown; the file is still unmatched in the ledger
+            with self._lock:
+                self._pending.pop(path, None)
+            return
+        record = dict(record, finished_at=datetime.now().isoformat(timespec='seconds'))
+        try:
+            record.update(future.result(), status='done')
+            outcome = (f"{record['cases']} variance cases → {record['report']}" if record['cases']
+                       else "no price variances")
+            print(f"✓ {os.path.basename(path)}: {outcome}", flush=True)
+        except Exception as e:
+            # Failed files are retried only once they change
+            record.update(status='failed', error=f"{type(e).__name__}: {e}")
+            print(f"✗ {os.path.basename(path)}: {record['error']}", flush=True)
+        with self._lock:
+            self._pending.pop(path, None)
+            self.ledger[path] = record
+            self._save_ledger_locked()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def run(self, once=False, stop_event=None):
+        """Poll until interrupted (or stop_event is set); with once, audit what is there and return.
+
+        With once, files still inside the settle window are waited for, not
+        skipped, so a just-dropped file is audited before returning.
+        """
+        stop_event = stop_event or threading.Event()
+        print(f"Watching {self.watch_dir} → {self.reports_dir} "
+              f"({self.workers} workers, up to {self.max_pending} pending)", flush=True)
+        try:
+            while not stop_event.is_set():
+                self.poll()
+                if once and not self.candidates_left():
+                    break
+                stop_event.wait(self.poll_seconds if not once else 0.5)
+        except KeyboardInterrupt:
+            print("\nStopping: waiting for running audits to finish...", flush=True)
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def candidates_left(self):
+        """True while audits are pending or new files are waiting to settle or be submitted."""
+        return (self.pending() > 0 or any(path not in self._pending for path, _, _ in self.candidates())
+                or bool(self.candidates(unsettled=True)))
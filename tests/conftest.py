@@ -0,0 +1,43 @@
+import os
+import sys
+import tempfile
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+# Keep the app's saved profiles, price history and spill files out of the user's home
+_STATE_DIR = tempfile.mkdtemp(prefix='sales-audit-tests-')
+os.environ['SALES_AUDIT_PROFILES'] = os.path.join(_STATE_DIR, 'ingestion_profiles.json')
+os.environ['SALES_AUDIT_HISTORY_DB'] = os.path.join(_STATE_DIR, 'price_history.sqlite')
+os.environ['SALES_AUDIT_SPILL_DIR'] = os.path.join(_STATE_DIR, 'spill')
+
+COLUMN_MAPPING = {
+    'material_description': 'MATERIAL DESCRIPTION',
+    'date_column': 'SO CREATED ON',
+    'material_code': 'MATERIAL CODE',
+    'customer_name': 'SOLD TO PARTY NAME',
+    'basic_rate': 'BASIC RATE',
+}
+DATE_FORMAT = '%d-%m-%Y'
+
+
+def sales_frame(rows):
+    """Ledger of (customer, material, date dd-mm-yyyy, rate) tuples with the sample file's columns."""
+    return pd.DataFrame(rows, columns=['SOLD TO PARTY NAME', 'MATERIAL CODE', 'SO CREATED ON', 'BASIC RATE']).assign(
+        **{'MATERIAL DESCRIPTION': 'Steel Rods'})
+
+
+@pytest.fixture
+def mapping():
+    return dict(COLUMN_MAPPING)
+
+
+@pytest.fixture(scope='session')
+def ledger():
+    """A small synthetic ledger with variance cases, blanks and duplicates."""
+    from generate_data import generate_sales_ledger
+    return generate_sales_ledger(3000, customers=40, materials=15, days=30, variance_rate=0.2, seed=7)
@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+from conftest import ROOT
+
+pytest.importorskip('streamlit')
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+APP = os.path.join(ROOT, 'src', 'app.py')
+SAMPLE = os.path.join(ROOT, 'data', 'sample_data.csv')
+
+
+@pytest.fixture
+def analyzed():
+    """An operator session that uploaded the sample ledger and ran the within-customer analysis."""
+    at = AppTest.from_file(APP, default_timeout=120)
+    at.run()
+    at.text_input(key='username').set_value('admin')
+    at.text_input(key='password').set_value('admin123')
+    at.button[0].click().run()
+    with open(SAMPLE, 'rb') as fh:
+        at.sidebar.file_uploader[0].set_value([('sample.csv', fh.read(), 'text/csv')]).run()
+    at.button(key='analyze_btn').click().run()
+    assert not at.exception
+    return at
+
+
+def variance_table(at):
+    return next(t.value for t in at.dataframe if 'Difference' in t.value.columns)
+
+
+def test_filters_narrow_the_table_without_rerunning_the_analysis(analyzed):
+    at = analyzed
+    grouping = next(s for s in at.session_state['perf_profile'].stages if s['stage'] == 'grouping')
+    everything = variance_table(at)
+    at.number_input(key='min_diff_filter').set_value(50.0).run()
+    assert not at.exception
+    filtered = variance_table(at)
+    assert 0 < len(filtered) < len(everything)
+    assert (filtered['Difference'] >= 50).all()
+    # The analysis is kept, not recomputed, across filter changes
+    assert [m.value for m in at.metric if m.label == 'Total Variance Cases'] == [str(len(everything))]
+    assert grouping in at.session_state['perf_profile'].stages
+
+
+def test_quick_filter_buttons_set_the_filters(analyzed):
+    at = analyzed
+    next(b for b in at.button if b.label == "🔥 High").click().run()
+    assert at.session_state['min_diff_filter'] == 100.0
+    assert (variance_table(at)['Difference'] >= 100).all()
+    next(b for b in at.button if b.label == "🔄 Reset").click().run()
+    assert (at.session_state['min_diff_filter'], at.session_state['min_var_filter']) == (0.0, 0.0)
+
+
+@pytest.mark.parametrize('progressive', [False, True])
+def test_reupload_with_same_name_and_size_is_analyzed_afresh(progressive):
+    with open(SAMPLE, 'rb') as fh:
+        # Analyses are cached across sessions by content, so each case gets content of its own
+        original = fh.read().replace(b'10mm', b'10m%d' % progressive)
+    # Same name, same byte length, one rate changed so the ABC Industries case disappears
+    corrected = original.replace(b'MAT001,ABC Industries,120', b'MAT001,ABC Industries,100', 1)
+    assert corrected != original and len(corrected) == len(original)
+
+    at = AppTest.from_file(APP, default_timeout=120)
+    at.run()
+    at.text_input(key='username').set_value('admin')
+    at.text_input(key='password').set_value('admin123')
+    at.button[0].click().run()
+    next(c for c in at.sidebar.checkbox if c.label.startswith('⏩')).set_value(progressive).run()
+    cases = []
+    for content in (original, corrected):
+        at.sidebar.file_uploader[0].set_value([('sales.csv', content, 'text/csv')]).run()
+        at.button(key='analyze_btn').click().run()
+        assert not at.exception
+        cases.append(variance_table(at))
+    assert 'ABC Industries' in set(cases[0]['Customer'])
+    assert 'ABC Industries' not in set(cases[1]['Customer'])
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import audit_core
+from conftest import COLUMN_MAPPING, DATE_FORMAT
+from price_history import PriceHistory
+
+pytest.importorskip('polars')
+
+
+def assert_same(pandas_result, polars_result):
+    for expected, actual in zip(pandas_result, polars_result):
+        if isinstance(expected, pd.DataFrame):
+            pd.testing.assert_frame_equal(actual, expected)
+        elif isinstance(expected, dict):
+            assert expected.keys() == actual.keys()
+            for key in expected:
+                assert_same([expected[key]], [actual[key]])
+        elif isinstance(expected, np.ndarray):
+            np.testing.assert_array_equal(actual, expected)
+        else:
+            assert actual == expected
+
+
+def both(engine, *args, **kwargs):
+    return [engine(*args, backend=name, **kwargs) for name in ('pandas', 'polars')]
+
+
+@pytest.mark.parametrize('options', [
+    {'date_format': DATE_FORMAT},
+    {'dayfirst': True},
+    {'date_format': DATE_FORMAT, 'return_index': True},
+    {'date_format': DATE_FORMAT, 'keys': ['material_code', 'date_column', 'customer_name', 'PLANT']},
+])
+def test_within_customer_audit_matches(ledger, options):
+    df = ledger.assign(PLANT=np.where(ledger.index % 3 == 0, 'P1', 'P2'))
+    assert_same(*both(audit_core.audit_material_price_variance, df, COLUMN_MAPPING, **options))
+
+
+@pytest.mark.parametrize('options', [
+    {'date_format': DATE_FORMAT},
+    {'date_format': DATE_FORMAT, 'return_index': True},
+])
+def test_cross_customer_audit_matches(ledger, options):
+    assert_same(*both(audit_core.audit_cross_customer_variance, ledger, COLUMN_MAPPING, **options))
+
+
+def test_contract_check_matches(ledger):
+    pairs = ledger[['SOLD TO PARTY NAME', 'MATERIAL CODE']].dropna().drop_duplicates()
+    master = pairs.assign(**{'VALID FROM': '01-01-2025', 'VALID TO': '15-01-2025', 'CONTRACT RATE': 1000.0})
+    master_mapping = {'customer_name': 'SOLD TO PARTY NAME', 'material_code': 'MATERIAL CODE',
+                      'valid_from': 'VALID FROM', 'valid_to': 'VALID TO', 'contract_rate': 'CONTRACT RATE'}
+    mapping = {**COLUMN_MAPPING, 'quantity': 'QUANTITY'}
+    assert_same(*both(audit_core.audit_contract_price, ledger, mapping, master, master_mapping,
+                      date_format=DATE_FORMAT))
+
+
+def test_drift_audit_matches(ledger, tmp_path):
+    history = PriceHistory(str(tmp_path / 'history.sqlite'))
+    _, df_clean = audit_core.audit_material_price_variance(ledger.iloc[:1500], COLUMN_MAPPING, date_format=DATE_FORMAT)
+    history.ingest(df_clean, 'first.csv', 'first')
+    later = ledger.iloc[1500:].assign(**{'SO CREATED ON': '15-03-2025'})
+    assert_same(*both(audit_core.audit_price_drift, later, COLUMN_MAPPING, history, date_format=DATE_FORMAT))
+
+
+def test_messy_inputs_match(ledger):
+    df = ledger.astype({'BASIC RATE': object, 'MATERIAL CODE': object})
+    df.loc[df.index[:20], 'BASIC RATE'] = 'n/a'
+    df.loc[df.index[20:40], 'SO CREATED ON'] = 'not a date'
+    df.loc[df.index[40:60], 'MATERIAL CODE'] = 12345
+    assert_same(*both(audit_core.audit_material_price_variance, df, COLUMN_MAPPING, date_format=DATE_FORMAT))
+
+
+def test_get_backend():
+    assert audit_core.get_backend('polars').name == 'polars'
+    with pytest.raises(ValueError, match='Unknown backend'):
+        audit_core.get_backend('spark')
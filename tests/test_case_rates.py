@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import audit_core
+from conftest import COLUMN_MAPPING, DATE_FORMAT, sales_frame
+
+
+def test_every_customer_rate_of_a_case():
+    df = sales_frame([
+        ('A', 'M1', '01-01-2025', 100.0),
+        ('A', 'M1', '01-01-2025', 110.0),
+        ('B', 'M1', '01-01-2025', 90.0),
+        ('C', 'M1', '01-01-2025', 120.0),
+        ('D', 'M1', '01-01-2025', 120.0),
+        ('A', 'M2', '01-01-2025', 50.0),
+        ('B', 'M2', '01-01-2025', 50.0),
+    ])
+    out, _, case_rows = audit_core.audit_cross_customer_variance(df, COLUMN_MAPPING, date_format=DATE_FORMAT,
+                                                                 return_index=True)
+    assert len(out) == 1
+    rates = audit_core.get_case_rates(case_rows['rates'], out.index)
+    assert rates['Case'].tolist() == [out.index[0] + 1] * 4
+    # Lowest rate first; A's two lines average to 105
+    assert rates['Customer'].tolist() == ['B', 'A', 'C', 'D']
+    assert rates['Customer Rate'].tolist() == [90.0, 105.0, 120.0, 120.0]
+    assert rates['Lines'].tolist() == [1, 2, 1, 1]
+    assert rates['Median Rate'].tolist() == [112.5] * 4
+    assert rates['Deviation'].tolist() == [-22.5, -7.5, 7.5, 7.5]
+    assert rates['Deviation %'].iloc[0] == pytest.approx(-20.0)
+
+
+def test_median_of_odd_and_even_cases():
+    rates = audit_core.build_case_rates(
+        case_ids=[0, 0, 0, 1, 1], n_cases=2, customer_codes=[0, 1, 2, 0, 1], customer_names=['A', 'B', 'C'],
+        rate_units=[300, 100, 200, 400, 100], lines=[1, 1, 1, 1, 1],
+    )
+    assert rates['offsets'].tolist() == [0, 3, 5]
+    assert rates['rate_units'].tolist() == [100, 200, 300, 100, 400]
+    assert rates['names'][rates['customers']].tolist() == ['B', 'C', 'A', 'B', 'A']
+    assert rates['median_units'].tolist() == [200.0, 250.0]
+
+    picked = audit_core.get_case_rates(rates, pd.Index([1]))
+    assert picked['Customer'].tolist() == ['B', 'A']
+    assert picked['Customer Rate'].tolist() == [1.0, 4.0]
+
+
+def test_case_rates_sheet_in_the_report(ledger):
+    out, _, case_rows = audit_core.audit_cross_customer_variance(ledger, COLUMN_MAPPING, date_format=DATE_FORMAT,
+                                                                 return_index=True)
+    rates = audit_core.get_case_rates(case_rows['rates'], out.index[:5])
+    assert (rates.groupby('Case')['Customer'].nunique() >= 2).all()
+    report = audit_core.create_excel_download(out, customer_rates=rates)
+    sheets = pd.read_excel(report, sheet_name=None)
+    assert len(sheets['Customer Rates']) == len(rates)
+    np.testing.assert_allclose(sheets['Customer Rates']['Customer Rate'], rates['Customer Rate'])
@@ -0,0 +1,76 @@
+import csv
+import io
+
+import pytest
+
+import audit_core
+from conftest import COLUMN_MAPPING, DATE_FORMAT, sales_frame
+
+ROWS = [
+    ('A', 'M1', '01-01-2025', 100.0),
+    ('B', 'M2', '01-01-2025', 50.0),
+    ('A', 'M1', '01-01-2025', 110.0),
+    ('C', 'M1', '01-01-2025', 'tbd'),
+    ('B', 'M2', '01-01-2025', 55.0),
+    ('A', 'M3', '02-01-2025', 7.0),
+    ('A', 'M1', '01-01-2025', 120.0),
+    ('C', 'M3', '02-01-2025', 9.0),
+    ('B', 'M2', '02-01-2025', 60.0),
+]
+
+
+def ledger_bytes(rows=ROWS):
+    return sales_frame(rows).to_csv(index=False).encode('utf-8')
+
+
+def sheet_lines(content):
+    """Cells of each line, indexed by Excel row number (the header is row 1)."""
+    return dict(enumerate(csv.DictReader(io.StringIO(content.decode('utf-8'))), start=2))
+
+
+def drill_down(df, mode='within'):
+    audit = audit_core.audit_material_price_variance if mode == 'within' else audit_core.audit_cross_customer_variance
+    out, df_clean, case_rows = audit(df, COLUMN_MAPPING, date_format=DATE_FORMAT, return_index=True)
+    return out, audit_core.get_case_source_rows(df_clean, case_rows, out.index)
+
+
+def assert_rows_match_sheet(rows, lines, row_column='Excel Row'):
+    for _, row in rows.iterrows():
+        line = lines[row[row_column]]
+        assert line['SOLD TO PARTY NAME'] == row['SOLD TO PARTY NAME']
+        assert line['MATERIAL CODE'] == row['MATERIAL CODE']
+        assert float(line['BASIC RATE']) == row['BASIC RATE']
+
+
+@pytest.mark.parametrize('mode', ['within', 'across'])
+def test_single_file_rows_point_at_their_sheet_lines(mode):
+    content = ledger_bytes()
+    out, rows = drill_down(audit_core.read_table(content, 'ledger.csv'), mode)
+    assert_rows_match_sheet(rows, sheet_lines(content))
+    # Every line of each case and nothing else; the unparseable rate on row 5 is left out
+    expected = {'within': [[2, 4, 8], [3, 6]], 'across': [[7, 9]]}[mode]
+    assert sorted(rows.groupby('Case')['Excel Row'].apply(list)) == expected
+
+def test_chunked_load_keeps_row_numbers():
+    content = ledger_bytes(ROWS * 50)
+    whole = drill_down(audit_core.read_table(content, 'ledger.csv'))[1]
+    chunks = list(audit_core.iter_table_chunks(content, 'ledger.csv', chunk_rows=7))
+    assert len(chunks) > 1
+    chunked = drill_down(audit_core.pd.concat(chunks))[1]
+    assert chunked['Excel Row'].tolist() == whole['Excel Row'].tolist()
+    assert_rows_match_sheet(chunked, sheet_lines(content))
+    assert chunked['Excel Row'].max() > 400
+
+
+def test_multi_source_rows_carry_file_and_row():
+    # The M1 case on 01-01-2025 spans both files: A in both, D only in feb.csv
+    jan, feb = ledger_bytes(ROWS[:5]), ledger_bytes([*ROWS[5:], ('D', 'M1', '01-01-2025', 130.0)])
+    df = audit_core.read_sources([('jan.csv', jan, None), ('feb.csv', feb, None)])
+    _, rows = drill_down(df, 'across')
+    assert 'Excel Row' not in rows.columns
+    lines = {'jan.csv': sheet_lines(jan), 'feb.csv': sheet_lines(feb)}
+    for name, part in rows.groupby(rows['Source File'].astype(str)):
+        assert_rows_match_sheet(part, lines[name], 'Source Row')
+    m1 = rows[rows['MATERIAL CODE'] == 'M1']
+    assert sorted(zip(m1['Source File'].astype(str), m1['Source Row'])) == [
+        ('feb.csv', 3), ('feb.csv', 6), ('jan.csv', 2), ('jan.csv', 4)]
@@ -0,0 +1,84 @@
+import datetime
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+import audit_core
+from conftest import COLUMN_MAPPING, DATE_FORMAT, ROOT, sales_frame
+
+pa = pytest.importorskip('pyarrow')
+
+
+def read_back(data, fmt):
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.read_table(pa.BufferReader(data))
+    return pa.ipc.open_file(pa.BufferReader(data)).read_all()
+
+
+@pytest.fixture(scope='module')
+def variances(ledger):
+    out, _ = audit_core.audit_material_price_variance(ledger, COLUMN_MAPPING, date_format=DATE_FORMAT)
+    return out
+
+
+@pytest.mark.parametrize('fmt', sorted(audit_core.COLUMNAR_FORMATS))
+def test_round_trip_keeps_values(variances, fmt):
+    table = read_back(audit_core.export_frame(variances, fmt), fmt)
+    back = table.to_pandas()
+    assert len(back) == len(variances)
+    assert list(back.columns) == list(variances.columns)
+    pd.testing.assert_series_equal(back['Difference'], variances['Difference'].reset_index(drop=True))
+
+
+@pytest.mark.parametrize('fmt', sorted(audit_core.COLUMNAR_FORMATS))
+def test_dates_and_repeated_text_get_bi_friendly_types(fmt):
+    df = pd.DataFrame({'Date': ['2025-01-02', '2025-01-03', None, '2025-01-02'],
+                       'Customer': ['A', 'A', 'A', 'B'], 'Rate': [1.0, 2.0, 3.0, 4.0]})
+    table = read_back(audit_core.export_frame(df, fmt), fmt)
+    assert table.schema.field('Date').type == pa.date32()
+    assert table.column('Date').to_pylist()[:2] == [datetime.date(2025, 1, 2), datetime.date(2025, 1, 3)]
+    assert pa.types.is_dictionary(table.schema.field('Customer').type)
+
+
+def test_mixed_type_columns_export_as_text():
+    df = pd.DataFrame({'Code': pd.Series([1, 'A7', 2.5], dtype=object)})
+    table = read_back(audit_core.export_frame(df, 'parquet'), 'parquet')
+    assert table.column('Code').to_pylist() == ['1', 'A7', '2.5']
+
+
+def test_export_to_a_path(tmp_path):
+    path = tmp_path / 'out.arrow'
+    assert audit_core.export_frame(pd.DataFrame({'x': [1, 2]}), 'arrow', path) == path
+    assert read_back(path.read_bytes(), 'arrow').num_rows == 2
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError, match='Unknown export format'):
+        audit_core.export_frame(pd.DataFrame(), 'feather')
+
+
+def test_cli_exports_a_variance_free_ledger(tmp_path):
+    source = tmp_path / 'clean.csv'
+    sales_frame([('A', 'M1', '01-01-2025', 100.0), ('A', 'M1', '01-01-2025', 100.0),
+                 ('B', 'M2', '02-01-2025', 50.0)]).to_csv(source, index=False)
+    report = tmp_path / 'report.xlsx'
+    result = subprocess.run(
+        [sys.executable, os.path.join(ROOT, 'src', 'sales.py'), str(source), str(report),
+         '--export', 'parquet', '--no-profiles'],
+        capture_output=True, text=True, timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    assert 'No price variances detected' in result.stdout
+
+    import pyarrow.parquet as pq
+
+    variances = pq.read_table(tmp_path / 'report_variances.parquet')
+    assert variances.num_rows == 0
+    assert variances.column_names == ['Customer', 'Material Code', 'Date', 'Material Description',
+                                      'Max Rate', 'Min Rate', 'Difference', 'Variance %']
+    assert pq.read_table(tmp_path / 'report_clean.parquet').num_rows == 3
+    assert (tmp_path / 'report_quality.parquet').exists()
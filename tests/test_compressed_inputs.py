@@ -0,0 +1,53 @@
+import gzip
+import io
+import zipfile
+
+import pandas as pd
+import pytest
+
+import audit_core
+
+LEDGER = pd.DataFrame({'Customer': ['A', 'B', 'C'], 'Rate': [10.5, 20.0, 30.25]})
+CSV = LEDGER.to_csv(index=False).encode('utf-8')
+
+
+def zipped(members):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize('name, data', [
+    ('ledger.csv', CSV),
+    ('ledger.csv.gz', gzip.compress(CSV)),
+    ('ledger.zip', zipped({'__MACOSX/._ledger.csv': b'junk', 'readme.txt': b'hi', 'ledger.csv': CSV})),
+])
+def test_read_table_decompresses_while_parsing(tmp_path, name, data):
+    pd.testing.assert_frame_equal(audit_core.read_table(data, name), LEDGER)
+    path = tmp_path / name
+    path.write_bytes(data)
+    pd.testing.assert_frame_equal(audit_core.read_table(str(path)), LEDGER)
+
+
+def test_zstd_input():
+    zstandard = pytest.importorskip('zstandard')
+    data = zstandard.ZstdCompressor().compress(CSV)
+    pd.testing.assert_frame_equal(audit_core.read_table(data, 'ledger.csv.zst'), LEDGER)
+
+
+def test_zip_without_csv_is_rejected():
+    with pytest.raises(ValueError, match='does not contain a .csv file'):
+        audit_core.read_table(zipped({'readme.txt': b'hi'}), 'ledger.zip')
+
+
+def test_compressed_input_streams_in_chunks():
+    chunks = list(audit_core.iter_table_chunks(gzip.compress(CSV), 'ledger.csv.gz', chunk_rows=2))
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    pd.testing.assert_frame_equal(pd.concat(chunks), LEDGER)
+
+
+def test_compressed_names_count_as_csv():
+    assert all(audit_core.is_csv_name(n) for n in ('a.CSV', 'a.csv.gz', 'a.csv.zst', 'a.zip'))
+    assert not audit_core.is_csv_name('a.xlsx')
@@ -0,0 +1,95 @@
+import pandas as pd
+import pytest
+
+import audit_core
+from conftest import DATE_FORMAT, sales_frame
+
+MASTER_MAPPING = {
+    'customer_name': 'Customer',
+    'material_code': 'Material',
+    'valid_from': 'From',
+    'valid_to': 'To',
+    'contract_rate': 'Rate',
+}
+
+
+def master_frame(rows):
+    return pd.DataFrame(rows, columns=['Customer', 'Material', 'From', 'To', 'Rate'])
+
+
+def run(sales, master, mapping, **kwargs):
+    out, _ = audit_core.audit_contract_price(sales, mapping, master, MASTER_MAPPING, date_format=DATE_FORMAT, **kwargs)
+    return out
+
+
+@pytest.mark.parametrize('order_date, covered', [
+    ('31-12-2024', False),  # before the contract starts
+    ('01-01-2025', True),   # on its first day
+    ('30-06-2025', True),   # on its last day
+    ('01-07-2025', False),  # the day after it ends
+])
+def test_validity_window_is_inclusive(mapping, order_date, covered):
+    sales = sales_frame([('ABC Industries', 'MAT001', order_date, 105.0)])
+    master = master_frame([('ABC Industries', 'MAT001', '01-01-2025', '30-06-2025', 100.0)])
+    out = run(sales, master, mapping)
+    assert (out is not None) == covered
+
+
+def test_open_ended_contract_covers_later_dates(mapping):
+    sales = sales_frame([('ABC Industries', 'MAT001', '15-08-2030', 90.0)])
+    master = master_frame([('ABC Industries', 'MAT001', '01-01-2025', None, 100.0)])
+    out = run(sales, master, mapping)
+    assert out['Billing Status'].tolist() == ['Under-billed']
+    assert out['Rate Gap'].tolist() == [-10.0]
+
+
+def test_latest_started_contract_wins(mapping):
+    sales = sales_frame([
+        ('ABC Industries', 'MAT001', '15-02-2025', 100.0),
+        ('ABC Industries', 'MAT001', '15-04-2025', 100.0),
+    ])
+    master = master_frame([
+        ('ABC Industries', 'MAT001', '01-01-2025', '31-12-2025', 100.0),
+        ('ABC Industries', 'MAT001', '01-04-2025', '31-12-2025', 120.0),
+    ])
+    out = run(sales, master, mapping)
+    assert out['Date'].tolist() == ['2025-04-15']
+    assert out['Contract Rate'].tolist() == [120.0]
+
+
+def test_expired_latest_contract_leaves_line_uncovered(mapping):
+    # The as-of join takes the latest start; if that contract has ended, the line has no contract
+    sales = sales_frame([('ABC Industries', 'MAT001', '15-05-2025', 90.0)])
+    master = master_frame([
+        ('ABC Industries', 'MAT001', '01-01-2025', '31-12-2025', 100.0),
+        ('ABC Industries', 'MAT001', '01-03-2025', '30-04-2025', 95.0),
+    ])
+    assert run(sales, master, mapping) is None
+
+
+def test_names_match_after_trimming(mapping):
+    sales = sales_frame([(' ABC Industries ', 'MAT001 ', '01-02-2025', 110.0)])
+    master = master_frame([('ABC Industries', 'MAT001', '01-01-2025', '31-12-2025', 100.0)])
+    assert run(sales, master, mapping)['Billing Status'].tolist() == ['Over-billed']
+
+
+def test_quantity_gives_rupee_impact(mapping):
+    sales = sales_frame([('ABC Industries', 'MAT001', '01-02-2025', 97.5)]).assign(QTY=[4])
+    master = master_frame([('ABC Industries', 'MAT001', '01-01-2025', '31-12-2025', 100.0)])
+    out = run(sales, master, {**mapping, 'quantity': 'QTY'})
+    assert out['Rupee Impact'].tolist() == [-10.0]
+    assert 'Rate Gap' not in out.columns
+
+
+def test_without_quantity_reports_per_unit_rate_gap(mapping):
+    sales = sales_frame([('ABC Industries', 'MAT001', '01-02-2025', 97.5)])
+    master = master_frame([('ABC Industries', 'MAT001', '01-01-2025', '31-12-2025', 100.0)])
+    out = run(sales, master, mapping)
+    assert out['Rate Gap'].tolist() == [-2.5]
+    assert 'Rupee Impact' not in out.columns
+
+
+def test_billed_at_contract_rate_has_no_cases(mapping):
+    sales = sales_frame([('ABC Industries', 'MAT001', '01-02-2025', 100.0), ('XYZ Corp', 'MAT001', '01-02-2025', 1.0)])
+    master = master_frame([('ABC Industries', 'MAT001', '01-01-2025', '31-12-2025', 100.0)])
+    assert run(sales, master, mapping) is None
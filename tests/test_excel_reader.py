@@ -0,0 +1,150 @@
+import pandas as pd
+import pytest
+
+import excel_reader
+
+
+def workbook(tmp_path, rows=25, name='book.xlsx'):
+    df = pd.DataFrame({
+        'Customer': [f'C{i % 4}' for i in range(rows)],
+        'Qty': list(range(rows)),
+        'Rate': [10.5 + i for i in range(rows)],
+        'Date': pd.date_range('2025-01-01', periods=rows),
+    })
+    path = tmp_path / name
+    df.to_excel(path, index=False)
+    return path
+
+
+@pytest.mark.parametrize('reader', ['calamine', 'openpyxl', 'pandas'])
+def test_each_reader_matches_read_excel(tmp_path, reader):
+    if reader == 'calamine':
+        pytest.importorskip('python_calamine')
+    path = workbook(tmp_path)
+    stats = {}
+    df = excel_reader.read_excel(path, reader=reader, stats=stats)
+    pd.testing.assert_frame_equal(df, pd.read_excel(path), check_dtype=False)
+    assert stats['reader'] == reader
+
+
+def test_reader_chain_by_format_and_setting(monkeypatch):
+    monkeypatch.setattr(excel_reader, 'calamine_available', lambda: False)
+    assert excel_reader.reader_chain('a.xlsx') == ['openpyxl', 'pandas']
+    assert excel_reader.reader_chain('a.xls') == ['pandas']
+    monkeypatch.setenv('SALES_AUDIT_EXCEL_READER', 'pandas')
+    assert excel_reader.reader_chain('a.xlsx') == ['pandas']
+    with pytest.raises(ImportError):
+        excel_reader.reader_chain('a.xlsx', 'calamine')
+    with pytest.raises(ValueError, match='Unknown Excel reader'):
+        excel_reader.reader_chain('a.xlsx', 'xlrd')
+
+
+def test_reader_that_cannot_open_hands_over(tmp_path, monkeypatch):
+    def broken(source, sheet):
+        raise OSError('cannot open')
+        yield
+
+    monkeypatch.setitem(excel_reader._ROW_SOURCES, 'openpyxl', broken)
+    path = workbook(tmp_path)
+    stats = {}
+    df = excel_reader.read_excel(path, reader='openpyxl', stats=stats)
+    assert stats['reader'] == 'pandas'
+    assert len(df) == 25
+
+
+@pytest.mark.parametrize('fail_after', [3, 11])
+def test_mid_sheet_failure_resumes_without_lost_or_repeated_rows(tmp_path, monkeypatch, fail_after):
+    original = excel_reader._ROW_SOURCES['openpyxl']
+
+    def flaky(source, sheet):
+        for i, row in enumerate(original(source, sheet)):
+            if i > fail_after:
+                raise RuntimeError('corrupt row')
+            yield row
+
+    monkeypatch.setitem(excel_reader._ROW_SOURCES, 'openpyxl', flaky)
+    path = workbook(tmp_path)
+    stats = {}
+    chunks = list(excel_reader.iter_excel_chunks(path, reader='openpyxl', chunk_rows=4, stats=stats))
+    assert stats['reader'] == 'pandas'
+    df = pd.concat(chunks)
+    assert df.index.tolist() == list(range(25))
+    assert df['Qty'].tolist() == list(range(25))
+
+
+def test_missing_columns_do_not_fall_back(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(excel_reader, '_pandas_rows', lambda *args: calls.append(args) or iter(()))
+    with pytest.raises(ValueError, match='columns expected but not found'):
+        excel_reader.read_excel(workbook(tmp_path), usecols=['Customer', 'Plant'], reader='openpyxl')
+    assert calls == []
+
+
+def test_chunks_continue_the_index_and_stop_at_nrows(tmp_path):
+    path = workbook(tmp_path)
+    chunks = list(excel_reader.iter_excel_chunks(path, usecols=['Qty', 'Rate'], nrows=10, chunk_rows=4,
+                                                 reader='openpyxl'))
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+    assert chunks[1].index.tolist() == [4, 5, 6, 7]
+    assert list(chunks[0].columns) == ['Qty', 'Rate']
+
+
+def test_sheet_without_data_rows_still_gives_columns(tmp_path):
+    path = workbook(tmp_path, rows=0)
+    chunks = list(excel_reader.iter_excel_chunks(path, reader='openpyxl'))
+    assert len(chunks) == 1
+    assert list(chunks[0].columns) == ['Customer', 'Qty', 'Rate', 'Date']
+    assert chunks[0].empty
+
+
+def blank_row_workbook(tmp_path):
+    """Rows Qty 0..19 with an empty row after every third one and a half-filled row."""
+    import openpyxl
+
+    book = openpyxl.Workbook()
+    sheet = book.active
+    sheet.append(['Customer', 'Qty', 'Note'])
+    for i in range(20):
+        sheet.append([f'C{i % 4}', i, None if i == 7 else 'ok'])
+        if i % 3 == 2:
+            sheet.append([None, None, None])
+    path = tmp_path / 'blanks.xlsx'
+    book.save(path)
+    return path
+
+
+@pytest.mark.parametrize('reader', ['calamine', 'openpyxl', 'pandas'])
+def test_blank_rows_are_skipped_by_every_reader(tmp_path, reader):
+    if reader == 'calamine':
+        pytest.importorskip('python_calamine')
+    df = excel_reader.read_excel(blank_row_workbook(tmp_path), reader=reader)
+    assert df['Qty'].tolist() == list(range(20))
+    assert df['Note'].isna().tolist() == [i == 7 for i in range(20)]
+
+
+@pytest.mark.parametrize('fail_after', [4, 9])
+def test_mid_sheet_fallback_counts_blank_rows_like_the_streaming_readers(tmp_path, monkeypatch, fail_after):
+    original = excel_reader._ROW_SOURCES['openpyxl']
+
+    def flaky(source, sheet):
+        for i, row in enumerate(original(source, sheet)):
+            if i > fail_after:
+                raise RuntimeError('corrupt row')
+            yield row
+
+    monkeypatch.setitem(excel_reader._ROW_SOURCES, 'openpyxl', flaky)
+    stats = {}
+    chunks = list(excel_reader.iter_excel_chunks(blank_row_workbook(tmp_path), reader='openpyxl', chunk_rows=2,
+                                                 stats=stats))
+    assert stats['reader'] == 'pandas'
+    df = pd.concat(chunks)
+    assert df['Qty'].tolist() == list(range(20))
+    assert df.index.tolist() == list(range(20))
+
+
+def test_text_and_mixed_columns_are_typed_like_read_excel():
+    text = excel_reader._typed_column(['a', None, 'b'])
+    assert text.tolist()[::2] == ['a', 'b'] and pd.isna(text[1])
+    mixed = excel_reader._typed_column(['A7', 3.0, None, 2.5])
+    assert mixed.tolist()[:2] == ['A7', 3] and type(mixed[1]) is int
+    assert pd.isna(mixed[2]) and mixed[3] == 2.5
@@ -0,0 +1,37 @@
+import pandas as pd
+
+from generate_data import SALES_COLUMNS, generate_sales_ledger, write_ledger
+
+
+def test_same_seed_gives_same_ledger():
+    pd.testing.assert_frame_equal(generate_sales_ledger(2000, seed=3), generate_sales_ledger(2000, seed=3))
+    assert not generate_sales_ledger(2000, seed=3).equals(generate_sales_ledger(2000, seed=4))
+
+
+def test_shape_and_columns():
+    df = generate_sales_ledger(5000, customers=30, materials=10, days=20, duplicate_rate=0.01)
+    assert len(df) == 5000
+    assert list(df.columns) == SALES_COLUMNS + ['SO NUMBER', 'QUANTITY']
+    assert df['SOLD TO PARTY NAME'].nunique() <= 30
+    assert df['MATERIAL CODE'].nunique() <= 10
+    assert df['SO CREATED ON'].nunique() <= 20
+    assert df.duplicated().sum() >= 50
+
+
+def test_rates_are_stable_without_variance():
+    df = generate_sales_ledger(4000, variance_rate=0.0, missing_rate=0.0, duplicate_rate=0.0)
+    rates = df.groupby(['SOLD TO PARTY NAME', 'MATERIAL CODE'])['BASIC RATE'].nunique()
+    assert (rates == 1).all()
+
+
+def test_missing_rate_blanks_cells():
+    df = generate_sales_ledger(10_000, missing_rate=0.05, duplicate_rate=0.0)
+    share = df[SALES_COLUMNS].isna().mean()
+    assert ((share > 0.03) & (share < 0.07)).all()
+
+
+def test_write_ledger_round_trip(tmp_path):
+    df = generate_sales_ledger(200)
+    write_ledger(df, str(tmp_path / 'ledger.csv'))
+    assert len(pd.read_csv(tmp_path / 'ledger.csv')) == 200
+
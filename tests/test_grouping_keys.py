@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import audit_core
+from conftest import COLUMN_MAPPING, DATE_FORMAT, sales_frame
+
+PLANT_KEYS = [*audit_core.WITHIN_KEYS, 'PLANT']
+
+
+def test_group_ids_follow_sorted_key_order():
+    a = pd.Series(['y', 'x', 'y', None, 'x'])
+    b = pd.Series([2, 1, 1, 1, 1])
+    ids, n_groups = audit_core.compile_group_ids([a, b])
+    assert ids.tolist() == [2, 0, 1, -1, 0]
+    assert n_groups == 3
+
+
+def test_group_ids_match_groupby_with_many_wide_keys():
+    rng = np.random.default_rng(1)
+    # Five keys of 20k values each overflow a single int64 radix, so ids are renumbered on the way
+    columns = [pd.Series(rng.integers(0, 20_000, 5000)) for _ in range(5)]
+    ids, n_groups = audit_core.compile_group_ids(columns)
+    expected = pd.DataFrame(dict(enumerate(columns))).groupby(list(range(5)), sort=True).ngroup().to_numpy()
+    np.testing.assert_array_equal(ids, expected)
+    assert n_groups == expected.max() + 1
+
+
+def test_group_spans_keep_row_order_within_groups():
+    order, offsets = audit_core.group_spans(np.array([1, 0, -1, 1, 0]), 2)
+    assert order.tolist() == [1, 4, 0, 3]
+    assert offsets.tolist() == [0, 2, 4]
+
+
+@pytest.mark.parametrize('keys, message', [
+    (['material_code', 'date_column'], 'must include customer_name'),
+    (PLANT_KEYS[:-1] + ['LINE'], 'not in the data'),
+    (PLANT_KEYS + ['material_code'], 'given twice'),
+])
+def test_invalid_keys_are_rejected(keys, message):
+    df = sales_frame([('A', 'M1', '01-01-2025', 1.0)]).assign(PLANT='P1')
+    with pytest.raises(ValueError, match=message):
+        audit_core.resolve_group_keys(COLUMN_MAPPING, keys, audit_core.WITHIN_KEYS, df)
+
+
+def plant_ledger():
+    return sales_frame([
+        ('A', 'M1', '01-01-2025', 100.0),
+        ('A', 'M1', '01-01-2025', 100.0),
+        ('A', 'M1', '01-01-2025', 120.0),
+        ('A', 'M1', '01-01-2025', 120.0),
+        ('B', 'M1', '01-01-2025', 90.0),
+    ]).assign(PLANT=['P1', 'P1', 'P2', 'P2', 'P1'])
+
+
+def test_extra_key_splits_within_customer_groups():
+    df = plant_ledger()
+    plain, _ = audit_core.audit_material_price_variance(df, COLUMN_MAPPING, date_format=DATE_FORMAT)
+    assert len(plain) == 1
+    split, _ = audit_core.audit_material_price_variance(df, COLUMN_MAPPING, keys=PLANT_KEYS, date_format=DATE_FORMAT)
+    assert split is None
+
+
+def test_extra_key_becomes_a_result_column():
+    df = plant_ledger()
+    out, _ = audit_core.audit_cross_customer_variance(
+        df, COLUMN_MAPPING, keys=[*audit_core.ACROSS_KEYS, 'PLANT'], date_format=DATE_FORMAT)
+    assert out['PLANT'].tolist() == ['P1']
+    assert out['Difference'].tolist() == [10.0]
+
+    with pytest.raises(ValueError):
+        audit_core.audit_cross_customer_variance(df, COLUMN_MAPPING, keys=[*audit_core.ACROSS_KEYS, 'customer_name'],
+                                                 date_format=DATE_FORMAT)
+
+
+def test_streaming_and_preview_take_keys():
+    df = plant_ledger()
+    plain = list(audit_core.stream_top_variances([df.iloc[:3], df.iloc[3:]], COLUMN_MAPPING, date_format=DATE_FORMAT))
+    assert plain[-1]['cases_found'] == 1
+    updates = list(audit_core.stream_top_variances([df.iloc[:3], df.iloc[3:]], COLUMN_MAPPING, keys=PLANT_KEYS,
+                                                   date_format=DATE_FORMAT))
+    assert updates[-1]['cases_found'] == 0
+    preview = audit_core.preview_audit(df, COLUMN_MAPPING, fraction=1.0, keys=PLANT_KEYS, date_format=DATE_FORMAT)
+    assert preview['sample_cases'] == 0
@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+HEAVY = ('pandas.core.frame', 'numpy.core', 'numpy._core', 'openpyxl', 'streamlit', 'plotly', 'polars', 'duckdb')
+
+
+def loaded_after(code):
+    """Heavy modules actually loaded by running code in a fresh interpreter."""
+    probe = f"{code}\nimport sys\nprint('LOADED:' + ','.join(m for m in {HEAVY!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, '-c', probe], cwd=os.path.join(ROOT, 'src'),
+                            capture_output=True, text=True, check=True)
+    loaded = result.stdout.rsplit('LOADED:', 1)[1].strip()
+    return [m for m in loaded.split(',') if m]
+
+
+def test_importing_audit_core_loads_no_dataframe_or_ui_library():
+    assert loaded_after('import audit_core') == []
+
+
+def test_cli_help_loads_no_dataframe_library():
+    code = ("import runpy, sys\nsys.argv = ['sales.py', '--help']\n"
+            "try:\n    runpy.run_path('sales.py', run_name='__main__')\nexcept SystemExit:\n    pass")
+    assert loaded_after(code) == []
+
+
+def test_lazy_modules_load_on_first_use():
+    assert 'pandas.core.frame' in loaded_after("import audit_core\naudit_core.pd.DataFrame()")
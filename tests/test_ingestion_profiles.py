@@ -0,0 +1,83 @@
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import COLUMN_MAPPING, ROOT
+from ingestion_profiles import (
+    IngestionProfiles,
+    build_profile,
+    header_fingerprint,
+    infer_date_format,
+    read_header,
+    read_plan,
+    read_with_profile,
+)
+
+SAMPLE = os.path.join(ROOT, 'data', 'sample_data.csv')
+
+
+@pytest.fixture
+def sample():
+    return pd.read_csv(SAMPLE).assign(**{'SO NUMBER': range(24), 'PLANT': 'P1'})
+
+
+def test_fingerprint_depends_on_names_and_order():
+    assert header_fingerprint(['a', 'b']) == header_fingerprint(['a', 'b'])
+    assert header_fingerprint(['a', 'b']) != header_fingerprint(['b', 'a'])
+    assert header_fingerprint(['a', 'b']) != header_fingerprint(['a', 'b', 'c'])
+
+
+def test_date_format_inference():
+    assert infer_date_format(pd.Series(['13-01-2025', '02-02-2025']), dayfirst=True) == '%d-%m-%Y'
+    assert infer_date_format(pd.Series(['2025-01-13'])) == '%Y-%m-%d'
+    assert infer_date_format(pd.Series(pd.to_datetime(['2025-01-13']))) is None
+    assert infer_date_format(pd.Series([None], dtype=object)) is None
+
+
+def test_profile_projects_mapped_and_extra_columns(sample):
+    profile = build_profile('ERP', sample, COLUMN_MAPPING, dayfirst=True, extra_columns=['PLANT'])
+    assert profile['usecols'] == [col for col in sample.columns if col in {*COLUMN_MAPPING.values(), 'PLANT'}]
+    assert profile['date_format'] == '%d-%m-%Y'
+    assert profile['dtypes']['BASIC RATE'] in ('int64', 'float64')
+    assert profile['dtypes']['SOLD TO PARTY NAME'] == 'str'
+    assert build_profile('ERP', sample, COLUMN_MAPPING, project=False)['usecols'] is None
+
+
+def test_saved_profile_matches_only_the_same_header(tmp_path, sample):
+    profiles = IngestionProfiles(str(tmp_path / 'profiles.json'))
+    assert len(profiles) == 0
+    profile = build_profile('ERP', sample, COLUMN_MAPPING)
+    profiles.save(profile)
+
+    # Another instance (e.g. the CLI) sees the saved file
+    other = IngestionProfiles(str(tmp_path / 'profiles.json'))
+    assert other.match(list(sample.columns))['name'] == 'ERP'
+    assert other.match(list(sample.columns)[::-1]) is None
+    assert [p['name'] for p in other.list()] == ['ERP']
+
+    assert profiles.forget(profile['fingerprint'])
+    assert not profiles.forget(profile['fingerprint'])
+    assert other.match(list(sample.columns)) is None
+
+
+def test_read_with_profile_uses_the_stored_plan(tmp_path, sample):
+    path = tmp_path / 'ledger.csv'
+    sample.to_csv(path, index=False)
+    assert read_header(str(path)) == list(sample.columns)
+    profile = build_profile('ERP', sample, COLUMN_MAPPING)
+    df = read_with_profile(str(path), 'ledger.csv', profile)
+    assert list(df.columns) == profile['usecols']
+    assert read_plan(profile) == (tuple(profile['usecols']), tuple(sorted(profile['dtypes'].items())))
+    assert read_plan(None) is None
+
+
+def test_read_with_profile_falls_back_when_a_type_no_longer_fits(tmp_path, sample):
+    profile = build_profile('ERP', sample.assign(**{'BASIC RATE': sample['BASIC RATE'].astype('int64')}),
+                            COLUMN_MAPPING)
+    changed = sample.astype({'BASIC RATE': object})
+    changed.loc[0, 'BASIC RATE'] = 'tbd'
+    path = tmp_path / 'ledger.csv'
+    changed.to_csv(path, index=False)
+    df = read_with_profile(str(path), 'ledger.csv', profile)
+    assert df['BASIC RATE'].iloc[0] == 'tbd'
@@ -0,0 +1,76 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+import audit_core
+from audit_core import IssueIndex
+from conftest import COLUMN_MAPPING, DATE_FORMAT
+
+
+def test_bitmaps_count_and_combine():
+    rng = np.random.default_rng(0)
+    a, b = rng.random(10_001) < 0.1, rng.random(10_001) < 0.2
+    index = IssueIndex(len(a))
+    index.add('missing', 'A', a)
+    index.add('missing', 'B', b)
+    index.add('missing', 'C', np.zeros(len(a), dtype=bool))
+
+    assert index.keys() == [('missing', 'A'), ('missing', 'B')]
+    assert index.count([('missing', 'A')]) == a.sum()
+    assert index.count() == (a | b).sum()
+    np.testing.assert_array_equal(index.positions(), np.flatnonzero(a | b))
+    assert index.count([('missing', 'C')]) == 0
+    assert index.nbytes == 2 * ((len(a) + 7) // 8)
+
+
+def test_positions_stream_in_chunks_and_stop_at_limit():
+    mask = np.zeros(100, dtype=bool)
+    mask[[0, 7, 8, 63, 64, 99]] = True
+    index = IssueIndex(100)
+    index.add('duplicate', 'All', mask)
+    chunks = list(index.iter_positions(chunk_rows=16))
+    assert [c.tolist() for c in chunks] == [[0, 7, 8], [63], [64], [99]]
+    assert index.positions(limit=4).tolist() == [0, 7, 8, 63]
+
+
+def test_labels_follow_the_frame_index():
+    index = IssueIndex(3, np.array([10, 20, 30]))
+    assert index.labels(np.array([0, 2])).tolist() == [10, 30]
+
+
+def test_quality_check_records_every_issue_row():
+    df = pd.DataFrame({
+        'SOLD TO PARTY NAME': ['A', None, 'B', 'B', 'C'],
+        'MATERIAL CODE': ['M1', 'M1', 'M2', 'M2', 'M3'],
+        'SO CREATED ON': ['01-01-2025', '01-01-2025', 'bad', 'bad', '02-01-2025'],
+        'BASIC RATE': ['10', '10', '11', '11', 'n/a'],
+        'MATERIAL DESCRIPTION': ['x'] * 5,
+    })
+    issues = audit_core.analyze_data_quality(df, critical_columns=list(COLUMN_MAPPING.values()),
+                                             column_mapping=COLUMN_MAPPING, date_format=DATE_FORMAT)
+    assert issues['missing_details']['SOLD TO PARTY NAME']['rows'] == [1]
+    assert (issues['date_issues'], issues['non_numeric_prices'], issues['duplicates']) == (2, 1, 1)
+    # Rows 1 (missing customer), 2 and 3 (bad dates), 4 (bad rate)
+    assert issues['critical_issue_rows'] == 4
+
+    out = io.StringIO()
+    assert audit_core.write_issue_rows(issues, out) == 6
+    lines = out.getvalue().splitlines()
+    assert lines[0] == 'Issue Type,Column,Excel Row'
+    assert 'Missing Values,SOLD TO PARTY NAME,3' in lines
+    assert 'Duplicate Rows,All,4' in lines and 'Duplicate Rows,All,5' in lines
+
+    critical = audit_core.issue_rows_csv(issues, critical_only=True).decode().splitlines()
+    assert critical == ['Excel Row', '3', '4', '5', '6']
+
+
+def test_large_frames_keep_complete_issue_lists():
+    n = audit_core.ISSUE_PREVIEW_ROWS * 30
+    df = pd.DataFrame({'x': np.where(np.arange(n) % 3 == 0, np.nan, np.arange(n))}, index=np.arange(n) + 1000)
+    issues = audit_core.analyze_data_quality(df)
+    assert len(issues['missing_details']['x']['rows']) == audit_core.ISSUE_PREVIEW_ROWS
+    assert issues['index'].count([('missing', 'x')]) == (n + 2) // 3
+    out = io.StringIO()
+    assert audit_core.write_issue_rows(issues, out, [('missing', 'x')], chunk_rows=64) == (n + 2) // 3
+    assert out.getvalue().splitlines()[-1] == f"Missing Values,x,{n - 3 + 1000 + 2}"
@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from memory_cache import FrameCache, SessionFrames, estimate_nbytes
+
+
+def frame(n=1000):
+    return pd.DataFrame({'x': np.arange(n, dtype='int64')})
+
+
+def test_estimate_counts_column_buffers_and_objects():
+    df = pd.DataFrame({'x': np.zeros(1000, dtype='int64'), 'o': np.array(['abc' * 10] * 1000, dtype=object)})
+    assert estimate_nbytes(df) > 8000 + 1000 * len('abc' * 10)
+    assert estimate_nbytes(np.zeros(10)) == 80
+    assert estimate_nbytes({'a': b'12345'}) > 5
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = FrameCache(budget_bytes=2 * estimate_nbytes(frame()), spill_dir=str(tmp_path))
+    cache.put(('upload', 1), frame())
+    cache.put(('upload', 2), frame())
+    cache.get(('upload', 1))
+    cache.put(('upload', 3), frame())
+    assert cache.get(('upload', 2)) is None
+    assert cache.get(('upload', 1)) is not None
+    assert cache.stats()['by_kind']['upload']['evictions'] == 1
+    assert cache.nbytes <= cache.budget_bytes
+
+
+def test_oversized_entry_is_kept_alone(tmp_path):
+    cache = FrameCache(budget_bytes=10, spill_dir=str(tmp_path))
+    cache.put(('upload', 1), frame())
+    cache.put(('upload', 2), frame())
+    assert cache.stats()['entries'] == 1
+    assert cache.get(('upload', 2)) is not None
+
+
+def test_spillable_entries_go_to_disk_and_come_back(tmp_path):
+    cache = FrameCache(budget_bytes=estimate_nbytes(frame()), spill_dir=str(tmp_path))
+    first = frame()
+    cache.put(('session', 'a', 'result'), first, spillable=True)
+    cache.put(('session', 'b', 'result'), frame(), spillable=True)
+    assert cache.stats()['spilled_entries'] == 1
+    assert len(os.listdir(tmp_path)) == 1
+
+    restored = cache.get(('session', 'a', 'result'))
+    pd.testing.assert_frame_equal(restored, first)
+    assert cache.stats()['by_kind']['session']['restores'] == 1
+    # Restoring made room by spilling the other session
+    assert cache.stats()['spilled_entries'] == 1
+
+
+def test_spill_idle_moves_untouched_entries(tmp_path):
+    cache = FrameCache(budget_bytes=10 ** 9, spill_dir=str(tmp_path))
+    cache.put(('session', 'a', 'result'), frame(), spillable=True)
+    cache.put(('upload', 1), frame())
+    assert cache.spill_idle(0) == 1
+    assert cache.stats()['entries'] == 1
+    assert cache.get(('session', 'a', 'result')) is not None
+
+
+def test_pop_removes_spilled_files(tmp_path):
+    cache = FrameCache(budget_bytes=10 ** 9, spill_dir=str(tmp_path))
+    cache.put(('session', 'a', 'result'), frame(), spillable=True)
+    cache.spill_idle(0)
+    cache.pop(('session', 'a', 'result'))
+    assert os.listdir(tmp_path) == []
+    assert cache.get(('session', 'a', 'result')) is None
+
+
+def test_session_frames(tmp_path):
+    cache = FrameCache(budget_bytes=10 ** 9, spill_dir=str(tmp_path))
+    frames = SessionFrames(cache, 's1')
+    frames['analysis'] = {'n': 1}
+    frames['empty'] = None
+    assert frames['analysis'] == {'n': 1}
+    assert 'empty' in frames and frames['empty'] is None
+    assert 'other' not in frames
+
+    cache.put(('result', 'shared'), {'n': 2})
+    frames.link('analysis', ('result', 'shared'))
+    assert frames['analysis'] == {'n': 2}
+    assert cache.get(('session', 's1', 'analysis')) is None
+
+    frames.clear()
+    assert 'analysis' not in frames
+    # Linked entries belong to the cache, not the session
+    assert cache.get(('result', 'shared')) == {'n': 2}
+
+
+def test_get_or_compute_runs_once_for_concurrent_callers(tmp_path):
+    cache = FrameCache(budget_bytes=10 ** 9, spill_dir=str(tmp_path))
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return frame()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        leader = pool.submit(cache.get_or_compute, ('result', 'k'), compute)
+        started.wait(5)
+        waiters = [pool.submit(cache.get_or_compute, ('result', 'k'), compute) for _ in range(7)]
+        while cache.stats()['by_kind']['result']['waits'] < len(waiters):
+            time.sleep(0.01)
+        release.set()
+        results = [leader.result()] + [w.result() for w in waiters]
+
+    assert len(calls) == 1
+    assert [computed for _, computed in results] == [True] + [False] * 7
+    assert all(value is results[0][0] for value, _ in results)
+    assert cache.get_or_compute(('result', 'k'), compute) == (results[0][0], False)
+
+
+def test_get_or_compute_error_reaches_every_waiter_and_is_not_cached(tmp_path):
+    cache = FrameCache(budget_bytes=10 ** 9, spill_dir=str(tmp_path))
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise RuntimeError('bad ledger')
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(cache.get_or_compute, ('result', 'k'), fail) for _ in range(4)]
+        while cache.stats()['by_kind'].get('result', {}).get('waits', 0) < 3:
+            time.sleep(0.01)
+        release.set()
+        errors = [f.exception() for f in futures]
+
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    assert cache.get_or_compute(('result', 'k'), lambda: 42) == (42, True)
+
+
+RESTORING = threading.Event()
+RESUME = threading.Event()
+
+
+def _slow_restore(value):
+    # Unpickling hook: holds the restore open until the test lets it finish
+    RESTORING.set()
+    RESUME.wait(5)
+    return value
+
+
+class SlowToLoad:
+    def __init__(self, value):
+        self.value = value
+
+    def __reduce__(self):
+        return _slow_restore, (self.value,)
+
+
+def test_callers_wait_for_a_spilled_entry_being_restored(tmp_path):
+    RESTORING.clear()
+    RESUME.clear()
+    cache = FrameCache(budget_bytes=10 ** 9, spill_dir=str(tmp_path))
+    cache.put(('result', 'k'), SlowToLoad('stored'), spillable=True)
+    assert cache.spill_idle(0) == 1
+    calls = []
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        restorer = pool.submit(cache.get, ('result', 'k'))
+        assert RESTORING.wait(5)
+        others = [pool.submit(cache.get_or_compute, ('result', 'k'), lambda: calls.append(1) or 'recomputed'),
+                  pool.submit(cache.get, ('result', 'k'))]
+        time.sleep(0.1)
+        assert not any(f.done() for f in others)
+        RESUME.set()
+        restored = restorer.result(5)
+
+    assert restored == 'stored'
+    assert others[0].result() == ('stored', False)
+    assert others[1].result() == 'stored'
+    assert calls == []
+    counts = cache.stats()['by_kind']['result']
+    assert (counts['restores'], counts['misses']) == (1, 0)
+
+
+def test_pop_during_a_restore_wins(tmp_path):
+    RESTORING.clear()
+    RESUME.clear()
+    cache = FrameCache(budget_bytes=10 ** 9, spill_dir=str(tmp_path))
+    cache.put(('result', 'k'), SlowToLoad('stored'), spillable=True)
+    cache.spill_idle(0)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        restorer = pool.submit(cache.get, ('result', 'k'))
+        assert RESTORING.wait(5)
+        cache.pop(('result', 'k'))
+        RESUME.set()
+        assert restorer.result(5) == 'stored'
+    assert cache.get(('result', 'k')) is None
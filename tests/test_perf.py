@@ -0,0 +1,63 @@
+import io
+import json
+
+import audit_core
+from conftest import DATE_FORMAT
+from perf import PipelineProfile, stage
+
+
+def test_stage_records_rows_time_and_rss():
+    profile = PipelineProfile()
+    with profile.stage('cleaning', rows=10) as record:
+        record['rows_out'] = 7
+    [rec] = profile.to_records()
+    assert rec['stage'] == 'cleaning'
+    assert (rec['rows_in'], rec['rows_out']) == (10, 7)
+    assert rec['seconds'] >= 0
+    assert rec['rss_mb'] is None or rec['rss_mb'] > 0
+
+
+def test_rerun_stage_replaces_the_old_record():
+    profile = PipelineProfile()
+    with profile.stage('a'):
+        pass
+    with profile.stage('b'):
+        pass
+    with profile.stage('a', rows=3):
+        pass
+    assert [s['stage'] for s in profile.stages] == ['b', 'a']
+    assert profile.stages[-1]['rows_in'] == 3
+
+
+def test_trace_memory_reports_peak_allocation():
+    profile = PipelineProfile(trace_memory=True)
+    with profile.stage('allocate'):
+        block = bytearray(8 * 1024 ** 2)
+    del block
+    assert profile.stages[0]['peak_mb'] >= 7
+
+
+def test_stage_without_profile_is_a_no_op():
+    with stage(None, 'anything', 5) as record:
+        record['rows_out'] = 1
+
+
+def test_log_json_writes_stages_and_summary():
+    profile = PipelineProfile()
+    with profile.stage('x'):
+        pass
+    stream = io.StringIO()
+    profile.log_json(stream, rows=5)
+    events = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [e['event'] for e in events] == ['stage', 'pipeline_complete']
+    assert events[0]['stage'] == 'x' and events[0]['rows'] == 5
+    assert events[1]['stages'] == 1
+
+
+def test_audit_records_its_stages(ledger, mapping):
+    profile = PipelineProfile()
+    audit_core.audit_material_price_variance(ledger, mapping, date_format=DATE_FORMAT, profile=profile)
+    assert [s['stage'] for s in profile.stages] == ['date & rate coercion', 'cleaning', 'grouping',
+                                                     'result building']
+    assert profile.stages[0]['rows_in'] == len(ledger)
+    assert profile.total_seconds() > 0
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+import audit_core
+from conftest import COLUMN_MAPPING, DATE_FORMAT
+from generate_data import generate_sales_ledger
+
+KEY_COLUMNS = ['SOLD TO PARTY NAME', 'MATERIAL CODE', 'SO CREATED ON']
+
+
+@pytest.fixture(scope='module')
+def big_ledger():
+    return generate_sales_ledger(60_000, customers=200, materials=60, days=60, variance_rate=0.1, seed=11)
+
+
+@pytest.mark.parametrize('mode', ['within', 'across'])
+def test_true_totals_fall_inside_the_estimate_intervals(big_ledger, mode):
+    audit = audit_core.audit_material_price_variance if mode == 'within' else audit_core.audit_cross_customer_variance
+    full, _ = audit(big_ledger, COLUMN_MAPPING, date_format=DATE_FORMAT)
+    preview = audit_core.preview_audit(big_ledger, COLUMN_MAPPING, mode, date_format=DATE_FORMAT)
+    assert preview['fraction'] == 0.05
+    assert preview['sample_cases'] >= 30
+    low, high = preview['cases_ci']
+    assert low <= len(full) <= high
+    low, high = preview['total_difference_ci']
+    assert low <= full['Difference'].sum() <= high
+    # The sample is a small share of the ledger
+    assert preview['sample_rows'] < 0.1 * preview['total_rows']
+
+
+def test_key_groups_are_kept_whole_and_drawn_deterministically(big_ledger):
+    sample = audit_core.sample_key_groups(big_ledger, KEY_COLUMNS, 0.2)
+    sampled = big_ledger.merge(sample[KEY_COLUMNS].drop_duplicates(), on=KEY_COLUMNS)
+    assert len(sampled) == len(sample)
+    assert 0.15 < len(sample) / len(big_ledger) < 0.25
+
+    again = audit_core.sample_key_groups(big_ledger, KEY_COLUMNS, 0.2)
+    assert again.index.equals(sample.index)
+    other = audit_core.sample_key_groups(big_ledger, KEY_COLUMNS, 0.2, salt='another-sample16')
+    assert not other.index.equals(sample.index)
+    # A larger fraction keeps every group of a smaller one
+    assert np.isin(sample.index, audit_core.sample_key_groups(big_ledger, KEY_COLUMNS, 0.5).index).all()
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import audit_core
+from conftest import COLUMN_MAPPING, DATE_FORMAT, sales_frame
+from price_history import PriceHistory, epoch_days
+
+
+def clean(rows):
+    return audit_core.get_backend('pandas').prepare(sales_frame(rows), COLUMN_MAPPING, date_format=DATE_FORMAT)
+
+
+def day(text):
+    return int(epoch_days(pd.Series(pd.to_datetime([text], format=DATE_FORMAT)))[0])
+
+
+@pytest.fixture
+def history(tmp_path):
+    store = PriceHistory(str(tmp_path / 'db' / 'history.sqlite'))
+    store.ingest(clean([
+        ('ABC', 'M1', '01-01-2025', 100.0),
+        ('ABC', 'M1', '01-01-2025', 102.0),
+        ('ABC', 'M1', '10-01-2025', 110.0),
+        ('ABC', 'M2', '05-01-2025', 50.0),
+    ]), 'jan.csv', 'digest-jan')
+    return store
+
+
+def test_baseline_is_latest_level_before_cutoff(history):
+    out = history.baselines(['ABC', 'ABC'], ['M1', 'M1'], [day('10-01-2025'), day('11-01-2025')])
+    assert sorted(zip(out['day'], out['rate'])) == [(day('01-01-2025'), 101.0), (day('10-01-2025'), 110.0)]
+
+
+def test_cutoff_is_exclusive_and_since_bounds_age(history):
+    assert history.baselines(['ABC'], ['M1'], [day('01-01-2025')]).empty
+    bounded = history.baselines(['ABC'], ['M1'], [day('09-01-2025')], since_days=[day('02-01-2025')])
+    assert bounded.empty
+    assert history.baselines(['XYZ'], ['M1'], [day('01-02-2025')]).empty
+
+
+def test_same_upload_is_ingested_once(history):
+    again = clean([('ABC', 'M1', '01-01-2025', 100.0)])
+    version = history.version()
+    assert history.ingest(again, 'jan-copy.csv', 'digest-jan') == 0
+    assert history.version() == version
+    assert history.summary() == {'uploads': 1, 'lines': 4, 'rows': 3,
+                                 'first_date': '2025-01-01', 'last_date': '2025-01-10'}
+
+
+def test_levels_of_several_uploads_are_averaged(history):
+    history.ingest(clean([('ABC', 'M1', '10-01-2025', 120.0)]), 'jan-b.csv', 'digest-jan-b')
+    out = history.baselines(['ABC'], ['M1'], [day('11-01-2025')])
+    assert out['rate'].tolist() == [pytest.approx(115.0)]
+
+
+def test_drift_audit_compares_with_history(history):
+    upload = sales_frame([
+        ('ABC', 'M1', '01-02-2025', 115.5),
+        ('ABC', 'M2', '01-02-2025', 50.0),
+        ('NEW', 'M1', '01-02-2025', 99.0),
+    ])
+    out, _ = audit_core.audit_price_drift(upload, COLUMN_MAPPING, history, date_format=DATE_FORMAT)
+    assert out[['Customer', 'Material Code', 'Previous Rate', 'Current Rate', 'Drift']].values.tolist() == [
+        ['ABC', 'M1', 110.0, 115.5, 'Increase'],
+    ]
+    assert out['Days Since Previous'].tolist() == [22]
+
+    assert audit_core.audit_price_drift(upload, COLUMN_MAPPING, history, date_format=DATE_FORMAT,
+                                        min_change_pct=10)[0] is None
+    assert audit_core.audit_price_drift(upload, COLUMN_MAPPING, history, date_format=DATE_FORMAT,
+                                        max_age_days=7)[0] is None
+
+
+def test_epoch_days():
+    dates = pd.Series([pd.Timestamp('1970-01-02'), pd.Timestamp('2025-01-01 13:00')])
+    assert epoch_days(dates).tolist() == [1, int(np.datetime64('2025-01-01', 'D').astype('int64'))]
+
+
+def test_cli_drift_uses_the_ingestion_profile_date_format(tmp_path):
+    import sales
+
+    db = str(tmp_path / 'history.sqlite')
+    PriceHistory(db).ingest(clean([('ABC', 'M1', '01-01-2025', 100.0)]), 'jan.csv', 'digest-jan')
+    df = sales_frame([('ABC', 'M1', '02-01-2025', 104.0)])
+    output = str(tmp_path / 'report.xlsx')
+    sales.run_price_history(df, None, [output], output, db, drift=True,
+                            date_options={'date_format': DATE_FORMAT, 'dayfirst': True})
+    report = pd.read_excel(tmp_path / 'report_drift.xlsx', sheet_name='Price Variances')
+    # 02-01-2025 is 2 January here, not 1 February
+    assert report['Date'].tolist() == ['2025-01-02']
+    assert report['Days Since Previous'].tolist() == [1]
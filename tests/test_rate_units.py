@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import audit_core
+from conftest import COLUMN_MAPPING, DATE_FORMAT, sales_frame
+
+
+def within(rows, **options):
+    out, _ = audit_core.audit_material_price_variance(sales_frame(rows), COLUMN_MAPPING, date_format=DATE_FORMAT,
+                                                      **options)
+    return out
+
+
+def across(rows, **options):
+    out, _ = audit_core.audit_cross_customer_variance(sales_frame(rows), COLUMN_MAPPING, date_format=DATE_FORMAT,
+                                                      **options)
+    return out
+
+
+@pytest.mark.parametrize('noisy, exact', [
+    (0.1 + 0.2, 0.3),
+    (0.7 * 3, 2.1),
+    (1.0050000000000001, 1.005),
+    (np.nextafter(10.075, 11), 10.075),
+])
+def test_float_noise_is_not_a_variance(noisy, exact):
+    assert noisy != exact
+    assert within([('A', 'M1', '01-01-2025', noisy), ('A', 'M1', '01-01-2025', exact)]) is None
+    assert across([('A', 'M1', '01-01-2025', noisy), ('B', 'M1', '01-01-2025', exact)]) is None
+
+
+def test_ties_round_half_up():
+    assert audit_core.to_rate_units([1.005, 1.015, 2.675, 0.125], 2).tolist() == [101, 102, 268, 13]
+
+
+@pytest.mark.parametrize('precision, cases', [(0, 0), (1, 1), (3, 1)])
+def test_rate_precision_sets_the_smallest_variance(precision, cases):
+    rows = [('A', 'M1', '01-01-2025', 100.2), ('A', 'M1', '01-01-2025', 100.4)]
+    out = within(rows, rate_precision=precision)
+    assert (0 if out is None else len(out)) == cases
+
+
+def test_results_are_in_rupees():
+    out = within([('A', 'M1', '01-01-2025', 100.123), ('A', 'M1', '01-01-2025', 120.5)], rate_precision=3)
+    row = out.iloc[0]
+    assert (row['Min Rate'], row['Max Rate'], row['Difference']) == (100.123, 120.5, 20.377)
+    units = audit_core.to_rate_units([19.99, 0.07, 1234.56])
+    np.testing.assert_array_equal(audit_core.from_rate_units(units), [19.99, 0.07, 1234.56])
+
+
+def test_customer_average_rounds_half_up_in_units():
+    # A's mean of 10.00 and 10.01 is 10.005: 10.01 here, where round(mean, 2) gave 10.0
+    out = across([('A', 'M1', '01-01-2025', 10.00), ('A', 'M1', '01-01-2025', 10.01),
+                  ('B', 'M1', '01-01-2025', 12.00)])
+    assert out.iloc[0]['Min Rate'] == 10.01
+    assert round((10.00 + 10.01) / 2, 2) == 10.0
+    assert out.iloc[0]['Difference'] == 1.99
+
+
+def test_cross_customer_rates_on_a_generated_ledger(ledger):
+    out, df_clean = audit_core.audit_cross_customer_variance(ledger, COLUMN_MAPPING, date_format=DATE_FORMAT)
+    means = df_clean.groupby(['MATERIAL CODE', 'SO CREATED ON', 'SOLD TO PARTY NAME'])['BASIC RATE']
+    units = means.agg(lambda rates: audit_core._mean_units(audit_core.to_rate_units(rates).sum(), len(rates)))
+    by_key = units.groupby(level=[0, 1]).agg(['min', 'max'])
+    key = pd.MultiIndex.from_arrays([out['Material Code'], pd.to_datetime(out['Date'])])
+    np.testing.assert_array_equal(audit_core.to_rate_units(out['Min Rate']), by_key['min'].reindex(key))
+    np.testing.assert_array_equal(audit_core.to_rate_units(out['Max Rate']), by_key['max'].reindex(key))
+    # Against the earlier round(mean, 2) per customer, some rates move by exactly one paisa
+    rounded = means.mean().round(2).groupby(level=[0, 1]).agg(['min', 'max']).reindex(key)
+    for column, reference in (('Min Rate', rounded['min']), ('Max Rate', rounded['max'])):
+        moved = np.round(np.abs(out[column].to_numpy() - reference.to_numpy()), 6)
+        assert set(moved) == {0.0, 0.01}
+
+
+def test_drift_averages_round_like_the_cross_customer_engine(tmp_path):
+    from price_history import PriceHistory
+
+    history = PriceHistory(str(tmp_path / 'history.db'))
+    earlier = sales_frame([('A', 'M1', '01-01-2025', 10.00)])
+    _, earlier_clean = audit_core.audit_material_price_variance(earlier, COLUMN_MAPPING, date_format=DATE_FORMAT)
+    history.ingest(earlier_clean, 'earlier.csv', 'earlier')
+    current = sales_frame([('A', 'M1', '02-01-2025', 10.00), ('A', 'M1', '02-01-2025', 10.01)])
+    out, _ = audit_core.audit_price_drift(current, COLUMN_MAPPING, history, date_format=DATE_FORMAT)
+    assert out.iloc[0]['Current Rate'] == 10.01
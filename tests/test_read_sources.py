@@ -0,0 +1,52 @@
+import io
+
+import pandas as pd
+
+import audit_core
+
+
+def csv_bytes(df):
+    return df.to_csv(index=False).encode('utf-8')
+
+
+def workbook_bytes(sheets):
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf) as writer:
+        for name, df in sheets.items():
+            df.to_excel(writer, sheet_name=name, index=False)
+    return buf.getvalue()
+
+
+JAN = pd.DataFrame({'Customer': ['A', 'B'], 'Rate': [10.0, 20.0], 'Note': ['x', 'y']})
+FEB = pd.DataFrame({'Customer': ['C', 'D', 'E'], 'Rate': [30.0, 40.0, 50.0], 'Note': ['z', 'z', 'z']})
+
+
+def test_csv_files_are_combined_and_tagged():
+    df = audit_core.read_sources([('jan.csv', csv_bytes(JAN), None), ('feb.csv', csv_bytes(FEB), None)],
+                                 usecols=['Customer', 'Rate'])
+    assert list(df.columns) == ['Customer', 'Rate'] + audit_core.SOURCE_COLUMNS
+    assert df['Customer'].tolist() == ['A', 'B', 'C', 'D', 'E']
+    assert df['Source File'].astype(str).tolist() == ['jan.csv'] * 2 + ['feb.csv'] * 3
+    assert df['Source Sheet'].astype(str).tolist() == [''] * 5
+    # Row numbers within each file, counting the header as row 1
+    assert df['Source Row'].tolist() == [2, 3, 2, 3, 4]
+
+
+def test_workbook_sheets_are_read_in_parallel_processes(tmp_path):
+    path = tmp_path / 'ledger.xlsx'
+    path.write_bytes(workbook_bytes({'Jan': JAN, 'Feb': FEB}))
+    assert audit_core.list_sheets(str(path)) == ['Jan', 'Feb']
+
+    df = audit_core.read_sources([('ledger.xlsx', str(path), sheet) for sheet in ('Jan', 'Feb')], max_workers=2)
+    assert df['Rate'].tolist() == [10.0, 20.0, 30.0, 40.0, 50.0]
+    assert df['Source Sheet'].astype(str).tolist() == ['Jan'] * 2 + ['Feb'] * 3
+    assert df['Source Row'].tolist() == [2, 3, 2, 3, 4]
+
+
+def test_nrows_limits_each_source():
+    df = audit_core.read_sources([('jan.csv', csv_bytes(JAN), None), ('feb.csv', csv_bytes(FEB), None)], nrows=1)
+    assert df['Customer'].tolist() == ['A', 'C']
+
+
+def test_list_sheets_of_a_csv_is_a_single_unnamed_sheet():
+    assert audit_core.list_sheets(csv_bytes(JAN), 'jan.csv') == [None]
@@ -0,0 +1,135 @@
+import io
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import pandas as pd
+import pytest
+
+import service
+from conftest import COLUMN_MAPPING, DATE_FORMAT, ROOT
+
+SAMPLE = os.path.join(ROOT, 'data', 'sample_data.csv')
+
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    server = service.make_server(port=0, workers=1, max_queue=2, spool_dir=str(tmp_path_factory.mktemp('spool')))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    server.job_queue.shutdown()
+
+
+@pytest.fixture(scope='module')
+def base_url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def call(method, url, body=None, content_type='application/json'):
+    """(status, parsed JSON or raw bytes) of one request."""
+    if isinstance(body, dict):
+        body = json.dumps(body).encode('utf-8')
+    request = urllib.request.Request(url, data=body, method=method, headers={'Content-Type': content_type})
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            status, payload, kind = response.status, response.read(), response.headers.get('Content-Type')
+    except urllib.error.HTTPError as e:
+        status, payload, kind = e.code, e.read(), e.headers.get('Content-Type')
+    return status, json.loads(payload) if kind == 'application/json' else payload
+
+
+def wait_done(base_url, job_id):
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        _, job = call('GET', f"{base_url}/jobs/{job_id}")
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.2)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_health(base_url):
+    status, payload = call('GET', f"{base_url}/health")
+    assert status == 200
+    assert payload['status'] == 'ok' and payload['workers'] == 1
+
+
+def test_json_job_runs_and_serves_results(base_url):
+    status, job = call('POST', f"{base_url}/jobs",
+                       {'file_path': SAMPLE, 'mode': 'within', 'mapping': COLUMN_MAPPING, 'date_format': DATE_FORMAT})
+    assert status == 202
+    job = wait_done(base_url, job['id'])
+    assert job['status'] == 'done', job['error']
+    assert job['summary']['rows'] == 24
+    assert job['summary']['cases'] > 0
+
+    status, body = call('GET', f"{base_url}/jobs/{job['id']}/result")
+    assert status == 200
+    assert len(pd.read_csv(io.BytesIO(body))) == job['summary']['cases']
+    status, body = call('GET', f"{base_url}/jobs/{job['id']}/result?format=issues")
+    assert status == 200
+
+    assert call('GET', f"{base_url}/jobs/{job['id']}/result?format=pdf")[0] == 400
+    assert call('DELETE', f"{base_url}/jobs/{job['id']}")[0] == 200
+    assert call('GET', f"{base_url}/jobs/{job['id']}")[0] == 404
+
+
+def test_raw_upload_with_query_options(base_url):
+    with open(SAMPLE, 'rb') as fh:
+        data = fh.read()
+    query = urllib.parse.urlencode({
+        'filename': 'ledger.csv', 'mode': 'across', 'mapping': json.dumps(COLUMN_MAPPING),
+        'date_format': DATE_FORMAT, 'customer_rates': 'true',
+    })
+    status, job = call('POST', f"{base_url}/jobs?{query}", data, content_type='text/csv')
+    assert status == 202
+    job = wait_done(base_url, job['id'])
+    assert job['status'] == 'done', job['error']
+    status, body = call('GET', f"{base_url}/jobs/{job['id']}/result?format=rates")
+    assert status == 200
+    assert {'Case', 'Customer', 'Customer Rate'} <= set(pd.read_csv(io.BytesIO(body)).columns)
+
+
+@pytest.mark.parametrize('request_body, message', [
+    ({'file_path': SAMPLE, 'mode': 'monthly', 'mapping': COLUMN_MAPPING}, 'mode must be'),
+    ({'file_path': SAMPLE, 'mapping': {'basic_rate': 'BASIC RATE'}}, 'mapping must name'),
+    ({'file_path': '/no/such/file.csv', 'mapping': COLUMN_MAPPING}, 'file_path'),
+    ({'file_path': SAMPLE, 'mode': 'contract', 'mapping': COLUMN_MAPPING}, 'price_master_path'),
+    ({'file_path': SAMPLE, 'mapping': COLUMN_MAPPING, 'keys': 'PLANT'}, 'keys must be'),
+])
+def test_invalid_requests_are_rejected(base_url, request_body, message):
+    status, payload = call('POST', f"{base_url}/jobs", request_body)
+    assert status == 400
+    assert message in payload['error']
+
+
+def test_unknown_routes_and_jobs(base_url):
+    assert call('GET', f"{base_url}/nope")[0] == 404
+    assert call('GET', f"{base_url}/jobs/missing")[0] == 404
+    assert call('DELETE', f"{base_url}/jobs/missing")[0] == 409
+
+
+def test_result_of_a_job_deleted_mid_request_is_not_found(server, base_url, monkeypatch):
+    status, job = call('POST', f"{base_url}/jobs",
+                       {'file_path': SAMPLE, 'mapping': COLUMN_MAPPING, 'date_format': DATE_FORMAT})
+    job = wait_done(base_url, job['id'])
+    queue = server.job_queue
+    result_path = queue.result_path
+
+    def deleted_first(job_id, fmt):
+        # A DELETE lands between the handler's status check and the render
+        assert queue.delete(job_id)
+        return result_path(job_id, fmt)
+
+    monkeypatch.setattr(queue, 'result_path', deleted_first)
+    status, payload = call('GET', f"{base_url}/jobs/{job['id']}/result?format=xlsx")
+    assert status == 404
+    assert 'Unknown job' in payload['error']
+    assert result_path('missing', 'csv') is None
@@ -0,0 +1,61 @@
+import gc
+
+import pandas as pd
+import pytest
+
+import sql_console
+
+pytest.importorskip('duckdb')
+
+UPLOAD = pd.DataFrame({'Customer': ['A', 'A', 'B'], 'Rate': [10.0, 12.0, 20.0]})
+
+
+def test_query_over_named_tables():
+    variances = pd.DataFrame({'Customer': ['A'], 'Difference': [2.0]})
+    result, truncated, seconds = sql_console.run_query(
+        "SELECT u.Customer, COUNT(*) AS lines, MAX(v.Difference) AS diff "
+        "FROM upload u JOIN variances v USING (Customer) GROUP BY u.Customer",
+        {'upload': UPLOAD, 'clean': None, 'variances': variances},
+    )
+    assert result.to_dict('records') == [{'Customer': 'A', 'lines': 2, 'diff': 2.0}]
+    assert not truncated and seconds >= 0
+
+
+def test_results_are_cut_at_max_rows():
+    result, truncated, _ = sql_console.run_query("SELECT * FROM range(100)", {}, max_rows=10)
+    assert len(result) == 10 and truncated
+
+
+def test_statement_without_result_set():
+    assert sql_console.run_query("CREATE VIEW one AS SELECT 1", {})[0] is None
+
+
+def test_missing_tables_are_left_out():
+    with pytest.raises(Exception, match='clean'):
+        sql_console.run_query("SELECT * FROM clean", {'upload': UPLOAD, 'clean': None})
+
+
+def test_file_access_is_disabled(tmp_path):
+    path = tmp_path / 'secret.csv'
+    path.write_text("a\n1\n")
+    with pytest.raises(Exception):
+        sql_console.run_query(f"SELECT * FROM read_csv('{path}')", {})
+    with pytest.raises(Exception):
+        sql_console.run_query("SET enable_external_access = true", {})
+
+
+def test_arrow_table_is_reused_per_frame_and_dropped_with_it():
+    pytest.importorskip('pyarrow')
+    frame = UPLOAD.copy()
+    first = sql_console._as_arrow(frame)
+    assert sql_console._as_arrow(frame) is first
+    assert sql_console._as_arrow(UPLOAD.copy()) is not first
+    key = id(frame)
+    del frame
+    gc.collect()
+    assert key not in sql_console._arrow_tables
+
+
+def test_mixed_type_columns_are_queried_as_frames():
+    mixed = pd.DataFrame({'Code': pd.Series([1, 'A7'], dtype=object)})
+    assert sql_console._as_arrow(mixed) is mixed
@@ -0,0 +1,53 @@
+import audit_core
+from conftest import COLUMN_MAPPING, DATE_FORMAT, sales_frame
+
+KEY = ['Customer', 'Material Code', 'Date']
+
+
+def final_top(chunks, mode='within', **options):
+    *_, last = audit_core.stream_top_variances(chunks, COLUMN_MAPPING, mode, date_format=DATE_FORMAT, **options)
+    return last
+
+
+def test_group_split_across_chunks_merges_into_one_case():
+    first = sales_frame([('A', 'M1', '01-01-2025', 100.0), ('A', 'M1', '01-01-2025', 110.0)])
+    second = sales_frame([('A', 'M1', '01-01-2025', 95.0), ('A', 'M1', '01-01-2025', 130.0)])
+    last = final_top([first, second])
+    assert last['rows_processed'] == 4
+    assert len(last['top']) == 1
+    case = last['top'].iloc[0]
+    assert (case['Min Rate'], case['Max Rate'], case['Difference']) == (95.0, 130.0, 35.0)
+    assert round(case['Variance %'], 2) == round(35 / 95 * 100, 2)
+
+
+def test_cross_customer_merge_keeps_the_extreme_customers():
+    first = sales_frame([('A', 'M1', '01-01-2025', 100.0), ('B', 'M1', '01-01-2025', 110.0)])
+    second = sales_frame([('C', 'M1', '01-01-2025', 90.0), ('D', 'M1', '01-01-2025', 105.0)])
+    case = final_top([first, second], 'across')['top'].iloc[0]
+    assert (case['Min Customer'], case['Max Customer'], case['Difference']) == ('C', 'B', 20.0)
+
+
+def test_only_the_k_largest_cases_are_kept():
+    rows = []
+    for i in range(30):
+        rows += [(f'C{i}', 'M1', '01-01-2025', 100.0), (f'C{i}', 'M1', '01-01-2025', 100.0 + i + 1)]
+    df = sales_frame(rows)
+    chunks = [df.iloc[start:start + 6] for start in range(0, len(df), 6)]
+    snapshots = list(audit_core.stream_top_variances(chunks, COLUMN_MAPPING, k=5, date_format=DATE_FORMAT))
+    assert all(len(snapshot['top']) <= 5 for snapshot in snapshots)
+    last = snapshots[-1]
+    assert last['cases_found'] == 30
+    assert last['top']['Difference'].tolist() == [30.0, 29.0, 28.0, 27.0, 26.0]
+    assert last['top']['Customer'].tolist() == ['C29', 'C28', 'C27', 'C26', 'C25']
+
+
+def test_matches_the_full_audit_when_groups_stay_in_one_chunk(ledger):
+    # One chunk per date, so no (customer, material, date) group is split
+    chunks = [part for _, part in ledger.groupby('SO CREATED ON', sort=False)]
+    top = final_top(chunks, k=20)['top']
+    full, _ = audit_core.audit_material_price_variance(ledger, COLUMN_MAPPING, date_format=DATE_FORMAT)
+    assert top['Difference'].tolist() == full['Difference'].head(20).tolist()
+    by_key = full.set_index(KEY)['Difference']
+    for _, case in top.iterrows():
+        assert by_key[tuple(case[KEY])] == case['Difference']
+    assert len(top.drop_duplicates(KEY)) == 20
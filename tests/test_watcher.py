@@ -0,0 +1,130 @@
+import json
+import os
+import shutil
+import time
+from concurrent.futures import Future
+
+import pandas as pd
+import pytest
+
+import watcher
+from conftest import ROOT
+
+SAMPLE = os.path.join(ROOT, 'data', 'sample_data.csv')
+
+
+def settled(path):
+    """Backdate a file's mtime so the watcher treats it as finished."""
+    old = time.time() - 3600
+    os.utime(path, (old, old))
+
+
+@pytest.fixture
+def folder(tmp_path):
+    watch = tmp_path / 'in'
+    watch.mkdir()
+    return watch, tmp_path / 'reports'
+
+
+def test_audits_new_files_and_records_them(folder):
+    watch, reports = folder
+    shutil.copy(SAMPLE, watch / 'jan.csv')
+    settled(watch / 'jan.csv')
+    watcher.FolderWatcher(str(watch), str(reports), workers=1, poll_seconds=0).run(once=True)
+
+    ledger = json.loads((reports / watcher.LEDGER_NAME).read_text())
+    record = ledger[str(watch / 'jan.csv')]
+    assert record['status'] == 'done'
+    assert record['cases'] > 0
+    assert os.path.isfile(record['report']) and os.path.isfile(record['log'])
+
+    # A restart reads the ledger and finds nothing left to do
+    assert watcher.FolderWatcher(str(watch), str(reports), poll_seconds=0).candidates() == []
+
+
+def test_skips_hidden_lock_unsettled_and_other_files(folder):
+    watch, reports = folder
+    for name in ('.hidden.csv', '~$open.xlsx', 'notes.txt', 'fresh.csv', 'ready.csv.gz'):
+        (watch / name).write_bytes(b'x')
+    for name in ('.hidden.csv', '~$open.xlsx', 'notes.txt', 'ready.csv.gz'):
+        settled(watch / name)
+    folder_watcher = watcher.FolderWatcher(str(watch), str(reports), poll_seconds=60)
+    assert [os.path.basename(path) for path, _, _ in folder_watcher.candidates()] == ['ready.csv.gz']
+
+
+def test_touched_file_with_same_content_is_not_audited_again(folder, monkeypatch):
+    watch, reports = folder
+    path = watch / 'jan.csv'
+    shutil.copy(SAMPLE, path)
+    settled(path)
+    folder_watcher = watcher.FolderWatcher(str(watch), str(reports), poll_seconds=0)
+    st = os.stat(path)
+    folder_watcher.ledger[str(path)] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns - 1,
+                                        'sha256': watcher.file_digest(str(path)), 'status': 'done'}
+    submitted = []
+    monkeypatch.setattr(folder_watcher, '_submit', lambda *args: submitted.append(args))
+
+    assert folder_watcher.poll() == 0
+    assert submitted == []
+    assert folder_watcher.ledger[str(path)]['mtime_ns'] == st.st_mtime_ns
+
+    path.write_text(path.read_text().replace('100', '101'))
+    settled(path)
+    assert folder_watcher.poll() == 1
+
+
+def test_backpressure_limits_pending_audits(folder, monkeypatch):
+    watch, reports = folder
+    for i in range(5):
+        (watch / f"f{i}.csv").write_text(f"a\n{i}\n")
+        settled(watch / f"f{i}.csv")
+    folder_watcher = watcher.FolderWatcher(str(watch), str(reports), workers=1, max_pending=2, poll_seconds=0)
+
+    def hold(path, report_path, record):
+        folder_watcher._pending[path] = Future()
+
+    monkeypatch.setattr(folder_watcher, '_submit', hold)
+    assert folder_watcher.poll() == 2
+    assert folder_watcher.poll() == 0
+    assert folder_watcher.pending() == 2
+
+    # Once an audit finishes, the next poll submits more
+    finished = next(iter(folder_watcher._pending))
+    folder_watcher._pending.pop(finished)
+    assert folder_watcher.poll() == 1
+
+
+def test_audit_file_uses_the_command_line_options(tmp_path):
+    ledger = pd.read_csv(SAMPLE)
+    ledger['PLANT'] = ['P1', 'P2'] * (len(ledger) // 2)
+    source = tmp_path / 'plants.csv'
+    ledger.to_csv(source, index=False)
+    report = tmp_path / 'report.xlsx'
+
+    plain = watcher.audit_file(str(source), str(report))
+    by_plant = watcher.audit_file(str(source), str(report), audit_options={'group_by': ['PLANT']})
+    assert by_plant['cases'] < plain['cases']
+
+
+def test_failed_audit_is_recorded(folder):
+    watch, reports = folder
+    path = watch / 'broken.csv'
+    path.write_text("not,a,ledger\n1,2,3\n")
+    settled(path)
+    watcher.FolderWatcher(str(watch), str(reports), workers=1, poll_seconds=0).run(once=True)
+    record = json.loads((reports / watcher.LEDGER_NAME).read_text())[str(path)]
+    assert record['status'] == 'failed'
+    assert 'audit failed' in record['error']
+
+
+def test_once_waits_for_a_just_written_file_to_settle(folder):
+    watch, reports = folder
+    shutil.copy(SAMPLE, watch / 'fresh.csv')
+    folder_watcher = watcher.FolderWatcher(str(watch), str(reports), workers=1, poll_seconds=1)
+    assert folder_watcher.candidates() == []
+    started = time.monotonic()
+    folder_watcher.run(once=True)
+
+    assert time.monotonic() - started >= 1
+    record = json.loads((reports / watcher.LEDGER_NAME).read_text())[str(watch / 'fresh.csv')]
+    assert record['status'] == 'done'